@@ -0,0 +1,37 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.db.models.functions import Lower
+
+
+def buscar_por_email(email):
+    """
+    Queryset del cliente con ese email (sin distinguir mayúsculas).
+
+    Filtra por LOWER(email) y excluye el email vacío para que SQLite use el
+    índice parcial de la restricción cliente_email_unico; email__iexact se
+    traduce a LIKE y recorrería la tabla entera.
+    """
+    return (
+        get_user_model()._default_manager
+        .alias(email_normalizado=Lower('email'))
+        .filter(email_normalizado=email.strip().lower())
+        .exclude(email='')
+    )
+
+
+class EmailBackend(ModelBackend):
+    """Autentica por email y contraseña con una sola consulta"""
+
+    def authenticate(self, request, email=None, password=None, username=None, **kwargs):
+        if email is None and username and '@' in username:
+            email = username  # formulario de login del admin
+        if not email or password is None:
+            return None
+        usuario = buscar_por_email(email).first()
+        if usuario is None:
+            # Mismo coste que con un usuario existente, para no revelar qué emails hay
+            get_user_model()().set_password(password)
+            return None
+        if usuario.check_password(password) and self.user_can_authenticate(usuario):
+            return usuario
+        return None
@@ -1,8 +1,19 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
+from .backends import buscar_por_email
 from .models import Cliente
 
 
+def validar_email_libre(email, cliente=None):
+    """Error si otro cliente ya usa el email (sin distinguir mayúsculas)"""
+    otros = buscar_por_email(email)
+    if cliente is not None and cliente.pk:
+        otros = otros.exclude(pk=cliente.pk)
+    if otros.exists():
+        raise forms.ValidationError('Ya existe una cuenta con este email.')
+    return email
+
+
 class RegistroForm(UserCreationForm):
     """Formulario de registro de clientes"""
     email = forms.EmailField(
@@ -51,6 +62,9 @@ class RegistroForm(UserCreationForm):
         self.fields['direccion'].widget.attrs.update({'class': 'form-control'})
         self.fields['ciudad'].widget.attrs.update({'class': 'form-control'})
         self.fields['codigo_postal'].widget.attrs.update({'class': 'form-control'})
+    
+    def clean_email(self):
+        return validar_email_libre(self.cleaned_data['email'])
                                                          
     def save(self, commit=True):
         user = super().save(commit=False)
@@ -89,3 +103,7 @@ class PerfilForm(forms.ModelForm):
             'ciudad': forms.TextInput(attrs={'class': 'form-control'}),
             'codigo_postal': forms.TextInput(attrs={'class': 'form-control'}),
         }
+    
+    def clean_email(self):
+        email = self.cleaned_data['email']
+        return validar_email_libre(email, self.instance) if email else email
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.7 on 2026-10-19 16:02
+
+import logging
+
+import django.db.models.functions.text
+from django.db import migrations, models
+from django.db.models import Count, F
+from django.db.models.functions import Lower
+
+logger = logging.getLogger('petjoy.migraciones')
+
+
+def resolver_duplicados(apps, schema_editor):
+    """
+    Antes de crear la restricción, deja un solo cliente por email (sin distinguir
+    mayúsculas): conserva el que entró más recientemente y al resto les cambia
+    el email a usuario+duplicado-<id>@dominio, que sigue siendo válido y deja
+    rastro del original para que soporte pueda fusionar las cuentas.
+    """
+    Cliente = apps.get_model('clientes', 'Cliente')
+    clientes = Cliente.objects.using(schema_editor.connection.alias).exclude(email='')
+    repetidos = (
+        clientes.annotate(email_normalizado=Lower('email'))
+        .values('email_normalizado').annotate(total=Count('id')).filter(total__gt=1)
+        .values_list('email_normalizado', flat=True)
+    )
+    renombrados = 0
+    for email in repetidos:
+        cuentas = (
+            clientes.annotate(email_normalizado=Lower('email')).filter(email_normalizado=email)
+            .order_by(F('last_login').desc(nulls_last=True), '-date_joined', '-id')
+        )
+        for cliente in list(cuentas)[1:]:
+            usuario, _, dominio = cliente.email.rpartition('@')
+            cliente.email = f'{usuario}+duplicado-{cliente.pk}@{dominio}'
+            cliente.save(update_fields=['email'])
+            renombrados += 1
+    if renombrados:
+        logger.warning('%d clientes con email repetido renombrados a usuario+duplicado-<id>@dominio', renombrados)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('clientes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(resolver_duplicados, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cliente',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('email'), condition=models.Q(('email', ''), _negated=True), name='cliente_email_unico', violation_error_message='Ya existe una cuenta con este email.'),
+        ),
+    ]
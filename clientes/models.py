@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import Q
+from django.db.models.functions import Lower
 from django.contrib.auth.models import AbstractUser
 
 
@@ -12,6 +14,13 @@ class Cliente(AbstractUser):
     class Meta:
         verbose_name = 'Cliente'
         verbose_name_plural = 'Clientes'
+        constraints = [
+            # Un email por cuenta sin distinguir mayúsculas; es también el índice del login por email
+            models.UniqueConstraint(
+                Lower('email'), condition=~Q(email=''), name='cliente_email_unico',
+                violation_error_message='Ya existe una cuenta con este email.',
+            ),
+        ]
     
     def __str__(self):
         return self.email or self.username
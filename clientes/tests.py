@@ -1,3 +1,85 @@
-from django.test import TestCase
+import os
+import random
+import time
+from unittest import skipUnless
 
-# Create your tests here.
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from .backends import buscar_por_email
+from .forms import PerfilForm, RegistroForm
+from .models import Cliente
+
+HASHERS_RAPIDOS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+
+@override_settings(PASSWORD_HASHERS=HASHERS_RAPIDOS)
+class LoginEmailTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cliente = Cliente.objects.create_user(
+            username='ana@ejemplo.com', email='Ana@Ejemplo.com', password='secreta123',
+        )
+
+    def test_autentica_con_una_consulta(self):
+        with self.assertNumQueries(1):
+            usuario = authenticate(email='ANA@ejemplo.com', password='secreta123')
+        self.assertEqual(usuario, self.cliente)
+        self.assertIsNone(authenticate(email='ana@ejemplo.com', password='otra'))
+        self.assertIsNone(authenticate(email='nadie@ejemplo.com', password='secreta123'))
+
+    def test_login_view(self):
+        response = self.client.post(reverse('clientes:login'), {'email': 'ana@ejemplo.com', 'password': 'secreta123'})
+        self.assertRedirects(response, reverse('core:inicio'), fetch_redirect_response=False)
+        self.assertEqual(int(self.client.session['_auth_user_id']), self.cliente.pk)
+
+    def test_busqueda_usa_indice(self):
+        plan = buscar_por_email('ana@ejemplo.com').explain()
+        self.assertIn('cliente_email_unico', plan)
+
+    def test_registro_con_email_repetido(self):
+        form = RegistroForm(data={
+            'email': 'ANA@ejemplo.com', 'first_name': 'Ana', 'last_name': 'Otra', 'direccion': 'Calle 1',
+            'ciudad': 'Madrid', 'codigo_postal': '28001', 'password1': 'clave-larga-987', 'password2': 'clave-larga-987',
+        })
+        self.assertFalse(form.is_valid())
+        self.assertIn('email', form.errors)
+
+    def test_perfil_conserva_su_email(self):
+        datos = {'first_name': 'Ana', 'last_name': 'García', 'email': 'ana@ejemplo.com'}
+        self.assertTrue(PerfilForm(data=datos, instance=self.cliente).is_valid())
+        otro = Cliente.objects.create_user(username='luis', email='luis@ejemplo.com', password='x')
+        self.assertFalse(PerfilForm(data=datos, instance=otro).is_valid())
+
+
+@skipUnless(os.environ.get('PETJOY_TEST_MILLON_CLIENTES'), 'Define PETJOY_TEST_MILLON_CLIENTES=1 para ejecutarlo')
+@override_settings(PASSWORD_HASHERS=HASHERS_RAPIDOS)
+class LoginMillonClientesTests(TestCase):
+    TOTAL = 1_000_000
+    MAXIMO_MS = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        password = make_password('secreta123')
+        columnas = 'password, username, email, first_name, last_name, is_superuser, is_staff, is_active, ' \
+                   'date_joined, telefono, direccion, ciudad, codigo_postal'
+        sql = f"INSERT INTO clientes_cliente ({columnas}) VALUES (%s, %s, %s, '', '', 0, 0, 1, %s, '', '', '', '')"
+        with connection.cursor() as cursor:
+            for inicio in range(0, cls.TOTAL, 50_000):
+                cursor.executemany(sql, [
+                    (password, f'cliente{i}', f'Cliente{i}@Ejemplo.com', '2024-01-01 00:00:00')
+                    for i in range(inicio, inicio + 50_000)
+                ])
+
+    def test_login_por_email(self):
+        aleatorio = random.Random(40)
+        emails = [f'cliente{aleatorio.randrange(self.TOTAL)}@ejemplo.com' for _ in range(500)]
+        inicio = time.perf_counter()
+        for email in emails:
+            self.assertIsNotNone(authenticate(email=email, password='secreta123'))
+        media_ms = (time.perf_counter() - inicio) * 1000 / len(emails)
+        self.assertLess(media_ms, self.MAXIMO_MS, f'Login medio de {media_ms:.2f} ms con {self.TOTAL} clientes')
@@ -35,20 +35,15 @@ def login_view(request):
             email = form.cleaned_data['email']
             password = form.cleaned_data['password']
             
-            # Buscar usuario por email
-            from .models import Cliente
-            try:
-                user = Cliente.objects.get(email=email)
-                user = authenticate(request, username=user.username, password=password)
-                
-                if user is not None:
-                    login(request, user)
-                    next_url = request.GET.get('next', 'core:inicio')
-                    messages.success(request, f'¡Bienvenido {user.first_name or user.username}!')
-                    return redirect(next_url)
-                else:
-                    messages.error(request, 'Email o contraseña incorrectos')
-            except Cliente.DoesNotExist:
+            # Una sola consulta por el índice único de LOWER(email) (clientes.backends.EmailBackend)
+            user = authenticate(request, email=email, password=password)
+            
+            if user is not None:
+                login(request, user)
+                next_url = request.GET.get('next', 'core:inicio')
+                messages.success(request, f'¡Bienvenido {user.first_name or user.username}!')
+                return redirect(next_url)
+            else:
                 messages.error(request, 'Email o contraseña incorrectos')
     else:
         form = LoginForm()
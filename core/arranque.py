@@ -0,0 +1,65 @@
+"""
+Coste de arranque de un worker: django.setup() más la carga de las URLs
+(que importa todas las vistas), medido en un intérprete nuevo.
+
+Lo usan el comando tiempo_arranque y el test del presupuesto de arranque
+(ARRANQUE_MAXIMO_MS). Los módulos de IMPORTS_DIFERIDOS solo deben cargarse
+la primera vez que se usan, nunca al arrancar.
+"""
+
+import json
+import os
+import re
+import subprocess
+import sys
+
+from django.conf import settings
+
+IMPORTS_DIFERIDOS = ('stripe',)
+
+SCRIPT = """
+import json, os, sys, time
+inicio = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tienda_online.settings')
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+print(json.dumps({'ms': (time.perf_counter() - inicio) * 1000, 'modulos': sorted(sys.modules)}))
+"""
+
+# import time: <propio us> | <acumulado us> | <sangría><módulo>
+LINEA_IMPORTTIME = re.compile(r'^import time:\s*(\d+) \|\s*(\d+) \|( *)(\S+)$')
+
+
+def medir_arranque(importtime=False):
+    """
+    Arranca un intérprete limpio y devuelve {'ms', 'modulos', 'imports'}.
+
+    'imports' (solo con importtime=True) es la lista de (módulo, propio_ms,
+    acumulado_ms, nivel) que escribe `python -X importtime`.
+    """
+    opciones = ['-X', 'importtime'] if importtime else []
+    entorno = dict(os.environ)
+    # Con override_settings activo (los tests) settings.SETTINGS_MODULE vale None
+    entorno.setdefault('DJANGO_SETTINGS_MODULE', settings.SETTINGS_MODULE)
+    proceso = subprocess.run(
+        [sys.executable, *opciones, '-c', SCRIPT],
+        cwd=settings.BASE_DIR, env=entorno, capture_output=True, text=True, check=True,
+    )
+    resultado = json.loads(proceso.stdout.strip().splitlines()[-1])
+    resultado['imports'] = []
+    for linea in proceso.stderr.splitlines():
+        coincidencia = LINEA_IMPORTTIME.match(linea)
+        if coincidencia:
+            propio, acumulado, sangria, modulo = coincidencia.groups()
+            resultado['imports'].append((modulo, int(propio) / 1000, int(acumulado) / 1000, len(sangria) // 2))
+    return resultado
+
+
+def diferidos_cargados(modulos):
+    """Módulos que deberían cargarse bajo demanda y se han importado al arrancar"""
+    return sorted(
+        modulo for modulo in modulos
+        if any(modulo == diferido or modulo.startswith(diferido + '.') for diferido in IMPORTS_DIFERIDOS)
+    )
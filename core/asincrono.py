@@ -0,0 +1,68 @@
+"""
+Utilidades para las vistas asíncronas (ASGI, VISTAS_ASYNC).
+
+Las plantillas se pintan de forma síncrona, así que una vista async tiene
+que dejar cargado antes todo lo que la plantilla vaya a leer de la BD: el
+usuario, la sesión y los querysets (como listas).
+"""
+
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+
+
+async def preparar_peticion(request):
+    """Carga el usuario y la sesión para que base.html no consulte la BD al pintarse"""
+    request.user = await request.auser()
+    await request.session.aget('carrito')
+
+
+async def alista(queryset):
+    return [objeto async for objeto in queryset]
+
+
+async def apaginar(queryset, por_pagina, numero):
+    """Equivalente asíncrono de Paginator(queryset, por_pagina).get_page(numero)"""
+    paginator = Paginator(queryset, por_pagina)
+    paginator.count = await queryset.acount()
+    try:
+        numero = paginator.validate_number(numero)
+    except PageNotAnInteger:
+        numero = 1
+    except EmptyPage:
+        numero = paginator.num_pages
+    inferior = (numero - 1) * por_pagina
+    objetos = await alista(queryset[inferior:inferior + por_pagina])
+    return paginator._get_page(objetos, numero, paginator)
+
+
+def condicion_async(etag_func=None, last_modified_func=None):
+    """
+    @condition para vistas async cuyas funciones de ETag/Last-Modified
+    consultan la BD (se evalúan en un hilo con sync_to_async).
+    """
+    def decorador(vista):
+        def evaluar(request, *args, **kwargs):
+            etag = etag_func(request, *args, **kwargs) if etag_func else None
+            ultima = last_modified_func(request, *args, **kwargs) if last_modified_func else None
+            return etag, ultima
+
+        @wraps(vista)
+        async def envoltorio(request, *args, **kwargs):
+            etag, ultima = await sync_to_async(evaluar)(request, *args, **kwargs)
+            etag = quote_etag(etag) if etag else None
+            marca = int(ultima.timestamp()) if ultima else None
+            response = get_conditional_response(request, etag=etag, last_modified=marca)
+            if response is None:
+                response = await vista(request, *args, **kwargs)
+            if request.method in ('GET', 'HEAD'):
+                if marca and not response.has_header('Last-Modified'):
+                    response.headers['Last-Modified'] = http_date(marca)
+                if etag:
+                    response.headers.setdefault('ETag', etag)
+            return response
+        return envoltorio
+    return decorador
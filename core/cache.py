@@ -0,0 +1,238 @@
+"""
+Caché del escaparate en dos niveles: un LRU acotado en la memoria de cada
+worker delante de la caché compartida de Django (FileBasedCache en disco,
+sin servicios externos). Vistas y modelos usan `cache` de este módulo, no
+django.core.cache.
+
+- obtener(clave, calcular) devuelve el valor o lo calcula una sola vez
+  (single-flight): los demás hilos del worker esperan a ese cálculo y los
+  demás workers esperan al que tenga el cerrojo en la caché compartida.
+- Pasado su TTL, un valor sigue sirviéndose durante `obsoleto` segundos
+  mientras un solo hilo lo recalcula en segundo plano (stale-while-revalidate).
+- Cada escritura varía el TTL ±CACHE_JITTER para que las claves calculadas a
+  la vez no caduquen a la vez.
+- estadisticas() da aciertos por nivel, fallos, obsoletos, esperas,
+  recálculos y desalojos del LRU; también salen en /metrics.
+
+El nivel local guarda cada entrada como mucho CACHE_LOCAL_TTL segundos para
+que los borrados hechos desde otro worker se noten enseguida.
+"""
+
+import logging
+import random
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import connections
+from django.dispatch import receiver
+
+from .metricas import EVENTOS_CACHE
+
+logger = logging.getLogger('petjoy.cache')
+
+
+class CacheDosNiveles:
+
+    def __init__(self, alias='default'):
+        self.alias = alias
+        self.local = OrderedDict()  # clave -> (valor, fresco_hasta, caduca, local_hasta)
+        self.calculos = {}  # clave -> threading.Event del cálculo en curso en este worker
+        self.contadores = Counter()
+        self.cerrojo = threading.RLock()
+
+    @property
+    def compartida(self):
+        return caches[self.alias]
+
+    def _contar(self, evento):
+        with self.cerrojo:
+            self.contadores[evento] += 1
+        EVENTOS_CACHE.inc(self.alias, evento)
+
+    # Niveles
+
+    def _leer(self, clave):
+        """(entrada, nivel) con entrada = (valor, fresco_hasta, caduca), o (None, None)"""
+        ahora = time.time()
+        with self.cerrojo:
+            entrada = self.local.get(clave)
+            if entrada is not None:
+                if ahora < entrada[2] and ahora < entrada[3]:
+                    self.local.move_to_end(clave)
+                    return entrada[:3], 'local'
+                del self.local[clave]
+        entrada = self.compartida.get(clave)
+        if entrada is None or ahora >= entrada[2]:
+            return None, None
+        self._guardar_local(clave, entrada)
+        return entrada, 'compartida'
+
+    def _guardar_local(self, clave, entrada):
+        with self.cerrojo:
+            self.local[clave] = (*entrada, time.time() + settings.CACHE_LOCAL_TTL)
+            self.local.move_to_end(clave)
+            while len(self.local) > settings.CACHE_LOCAL_MAXIMO:
+                self.local.popitem(last=False)
+                self._contar('desalojo')
+
+    # Interfaz básica
+
+    def get(self, clave, default=None):
+        """Valor fresco de `clave` o `default` (un valor obsoleto cuenta como fallo)"""
+        entrada, nivel = self._leer(clave)
+        if entrada is None or time.time() >= entrada[1]:
+            self._contar('fallo')
+            return default
+        self._contar(f'acierto_{nivel}')
+        return entrada[0]
+
+    def set(self, clave, valor, ttl=None, obsoleto=None):
+        ttl = settings.CACHE_TTL if ttl is None else ttl
+        obsoleto = settings.CACHE_OBSOLETO if obsoleto is None else obsoleto
+        ttl *= 1 + random.uniform(-settings.CACHE_JITTER, settings.CACHE_JITTER)
+        ahora = time.time()
+        entrada = (valor, ahora + ttl, ahora + ttl + obsoleto)
+        self.compartida.set(clave, entrada, timeout=ttl + obsoleto)
+        self._guardar_local(clave, entrada)
+
+    def delete(self, clave):
+        with self.cerrojo:
+            self.local.pop(clave, None)
+        self.compartida.delete(clave)
+
+    def caducar(self, clave):
+        """Da por obsoleto el valor sin borrarlo: se sigue sirviendo mientras se recalcula"""
+        with self.cerrojo:
+            self.local.pop(clave, None)
+        entrada = self.compartida.get(clave)
+        if entrada is not None:
+            restante = entrada[2] - time.time()
+            if restante > 0:
+                self.compartida.set(clave, (entrada[0], 0, entrada[2]), timeout=restante)
+
+    def clear(self):
+        """Vacía los dos niveles y las estadísticas"""
+        self.limpiar_local()
+        self.compartida.clear()
+
+    def limpiar_local(self):
+        with self.cerrojo:
+            self.local.clear()
+            self.contadores.clear()
+
+    def estadisticas(self):
+        with self.cerrojo:
+            estadisticas = dict(self.contadores)
+            estadisticas['entradas_locales'] = len(self.local)
+        aciertos = estadisticas.get('acierto_local', 0) + estadisticas.get('acierto_compartida', 0)
+        lecturas = aciertos + estadisticas.get('fallo', 0) + estadisticas.get('obsoleto', 0)
+        estadisticas['tasa_aciertos'] = aciertos / lecturas if lecturas else 0.0
+        return estadisticas
+
+    # Cálculo protegido
+
+    def obtener(self, clave, calcular, ttl=None, obsoleto=None):
+        """
+        Valor de `clave`. Si falta, lo calcula con calcular() un único hilo y
+        los demás esperan; si está obsoleto, lo devuelve igualmente y lo
+        recalcula en segundo plano.
+        """
+        entrada, nivel = self._leer(clave)
+        if entrada is not None:
+            if time.time() < entrada[1]:
+                self._contar(f'acierto_{nivel}')
+            else:
+                self._contar('obsoleto')
+                self._revalidar(clave, calcular, ttl, obsoleto)
+            return entrada[0]
+
+        self._contar('fallo')
+        with self.cerrojo:
+            evento = self.calculos.get(clave)
+            if evento is None:
+                evento = self.calculos[clave] = threading.Event()
+                propio = True
+            else:
+                propio = False
+        if not propio:
+            self._contar('espera')
+            evento.wait(settings.CACHE_ESPERA_MAXIMA)
+            entrada, _ = self._leer(clave)
+            # Si el cálculo falló o tardó demasiado, se calcula sin caché
+            return entrada[0] if entrada is not None else calcular()
+        try:
+            return self._calcular_entre_workers(clave, calcular, ttl, obsoleto)
+        finally:
+            self._terminar(clave, evento)
+
+    def _cerrojo_compartido(self, clave):
+        return self.compartida.add(f'{clave}:calculando', 1, timeout=settings.CACHE_ESPERA_MAXIMA)
+
+    def _terminar(self, clave, evento):
+        with self.cerrojo:
+            self.calculos.pop(clave, None)
+        evento.set()
+
+    def _recalcular(self, clave, calcular, ttl, obsoleto):
+        try:
+            valor = calcular()
+            self._contar('recalculo')
+            self.set(clave, valor, ttl, obsoleto)
+            return valor
+        finally:
+            self.compartida.delete(f'{clave}:calculando')
+
+    def _calcular_entre_workers(self, clave, calcular, ttl, obsoleto):
+        limite = time.monotonic() + settings.CACHE_ESPERA_MAXIMA
+        while not self._cerrojo_compartido(clave):
+            # Otro worker lo está calculando: se espera a que lo publique
+            self._contar('espera')
+            time.sleep(0.05)
+            entrada = self.compartida.get(clave)
+            if entrada is not None and time.time() < entrada[2]:
+                self._guardar_local(clave, entrada)
+                return entrada[0]
+            if time.monotonic() > limite:
+                return calcular()
+        return self._recalcular(clave, calcular, ttl, obsoleto)
+
+    def _revalidar(self, clave, calcular, ttl, obsoleto):
+        """Recalcula un valor obsoleto si nadie, en este worker ni en otro, lo está haciendo ya"""
+        with self.cerrojo:
+            if clave in self.calculos:
+                return
+            evento = self.calculos[clave] = threading.Event()
+        if not self._cerrojo_compartido(clave):
+            self._terminar(clave, evento)
+            return
+
+        def tarea():
+            try:
+                self._recalcular(clave, calcular, ttl, obsoleto)
+            except Exception:
+                # Se sigue sirviendo el valor obsoleto; el siguiente acceso lo reintenta
+                logger.exception('No se pudo recalcular %s', clave)
+            finally:
+                self._terminar(clave, evento)
+                if segundo_plano:
+                    connections.close_all()
+
+        segundo_plano = settings.CACHE_REVALIDAR_EN_SEGUNDO_PLANO
+        if segundo_plano:
+            threading.Thread(target=tarea, name=f'revalidar {clave}', daemon=True).start()
+        else:
+            tarea()
+
+
+cache = CacheDosNiveles()
+
+
+@receiver(setting_changed)
+def _cambio_caches(setting, **kwargs):
+    # override_settings(CACHES=...) en los tests: el nivel local ya no corresponde
+    if setting == 'CACHES':
+        cache.limpiar_local()
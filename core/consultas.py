@@ -0,0 +1,236 @@
+"""
+Registro de las consultas SQL.
+
+RegistroConsultas se engancha a las conexiones con connection.execute_wrapper,
+agrupa las consultas por SQL normalizado y punto de llamada, y marca como N+1
+los patrones que se repiten. Lo usa DetectorConsultasMiddleware.
+
+El log de consultas lentas se activa con CONSULTAS_LENTAS_MS > 0: se engancha
+a todas las conexiones y escribe en CONSULTAS_LENTAS_LOG una línea JSON por
+consulta lenta, más el EXPLAIN QUERY PLAN de cada SQL normalizado la primera
+vez que aparece en el proceso. Solo guarda el SQL normalizado: los parámetros
+llevan emails, direcciones y demás datos de los clientes.
+"""
+
+import hashlib
+import json
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+RAIZ_PROYECTO = str(Path(settings.BASE_DIR).resolve())
+
+_LITERALES = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LISTAS = re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)')
+_ESPACIOS = re.compile(r'\s+')
+
+
+class PresupuestoConsultasExcedido(Exception):
+    """Una vista ha ejecutado más consultas de las declaradas en su presupuesto"""
+
+
+def normalizar_sql(sql):
+    """SQL sin literales ni listas IN de longitud variable, para agrupar consultas equivalentes"""
+    sql = _LITERALES.sub('?', sql.replace('%s', '?'))
+    sql = _LISTAS.sub('(...)', sql)
+    return _ESPACIOS.sub(' ', sql).strip()
+
+
+def _punto_llamada(profundidad=8):
+    """
+    Frames del proyecto desde los que se lanzó la consulta (fichero:línea).
+
+    Si la consulta nace en una plantilla se añade también la plantilla y la
+    línea del nodo que la provocó, que es lo que interesa para un N+1.
+    """
+    pila, plantilla = [], None
+    frame = sys._getframe(2)
+    while frame is not None and len(pila) < profundidad:
+        codigo = frame.f_code
+        if plantilla is None and codigo.co_name == 'render_annotated':
+            nodo = frame.f_locals.get('self')
+            origen = getattr(nodo, 'origin', None)
+            token = getattr(nodo, 'token', None)
+            if origen is not None and token is not None:
+                plantilla = f'{origen.template_name}:{token.lineno}'
+        fichero = codigo.co_filename
+        if fichero.startswith(RAIZ_PROYECTO) and 'site-packages' not in fichero:
+            pila.append(f'{Path(fichero).relative_to(RAIZ_PROYECTO)}:{frame.f_lineno}')
+        frame = frame.f_back
+    if plantilla:
+        pila.insert(0, plantilla)
+    return tuple(pila)
+
+
+_registro_activo = ContextVar('registro_consultas', default=None)
+
+
+def _envoltorio_registro(execute, sql, params, many, context):
+    registro = _registro_activo.get()
+    if registro is None:
+        return execute(sql, params, many, context)
+    return registro(execute, sql, params, many, context)
+
+
+class RegistroConsultas:
+    """Execute wrapper que acumula las consultas ejecutadas mientras está activo"""
+
+    def __init__(self):
+        self.consultas = []
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.consultas.append({
+                'sql': sql,
+                'normalizado': normalizar_sql(sql),
+                'duracion': time.perf_counter() - inicio,
+                'alias': context['connection'].alias,
+                'llamada': _punto_llamada(),
+            })
+
+    @contextmanager
+    def activo(self):
+        """
+        Registra las consultas de todas las conexiones mientras dure el bloque.
+
+        Va por una contextvar en lugar de connection.execute_wrapper() para
+        ver también las consultas que el ORM asíncrono lanza en otro hilo.
+        """
+        token = _registro_activo.set(self)
+        try:
+            yield self
+        finally:
+            _registro_activo.reset(token)
+
+    @property
+    def total(self):
+        return len(self.consultas)
+
+    @property
+    def tiempo(self):
+        return sum(consulta['duracion'] for consulta in self.consultas)
+
+    def repetidas(self, umbral):
+        """Patrones (SQL normalizado, punto de llamada) repetidos al menos `umbral` veces"""
+        grupos = Counter((consulta['normalizado'], consulta['llamada']) for consulta in self.consultas)
+        return [
+            {'sql': sql, 'llamada': llamada, 'veces': veces}
+            for (sql, llamada), veces in grupos.most_common()
+            if veces >= umbral
+        ]
+
+
+@contextmanager
+def fuera_de_presupuesto():
+    """Consultas del bloque que no se registran (trabajo de una vez por worker, como construir un índice)"""
+    token = _registro_activo.set(None)
+    try:
+        yield
+    finally:
+        _registro_activo.reset(token)
+
+
+def presupuesto_consultas(maximo):
+    """Declara el número máximo de consultas SQL que puede ejecutar una vista"""
+    def decorador(vista):
+        vista.presupuesto_consultas = maximo
+        return vista
+    return decorador
+
+
+# Log de consultas lentas
+
+# Nombre de la vista en curso, para atribuirle las consultas lentas. Es una
+# lista de un elemento que el middleware rellena en process_view, que con ASGI
+# puede ejecutarse en otro hilo (y otra copia del contexto)
+vista_actual = ContextVar('vista_actual', default=None)
+
+
+def huella(sql_normalizado):
+    return hashlib.sha1(sql_normalizado.encode()).hexdigest()[:12]
+
+
+class RegistroConsultasLentas:
+    """Execute wrapper que anota en un JSONL las consultas que superan el umbral"""
+
+    def __init__(self, umbral_ms, ruta):
+        self.umbral = umbral_ms / 1000
+        self.ruta = Path(ruta)
+        self.planes = set()
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracion = time.perf_counter() - inicio
+            if duracion >= self.umbral:
+                self.anotar(sql, params, many, duracion, context['connection'])
+
+    def anotar(self, sql, params, many, duracion, conexion):
+        normalizado = normalizar_sql(sql)
+        clave = huella(normalizado)
+        registros = [{
+            'tipo': 'consulta',
+            'fecha': timezone.now().isoformat(),
+            'huella': clave,
+            'ms': round(duracion * 1000, 2),
+            'sql': normalizado,
+            'vista': (vista_actual.get() or [None])[0],
+            'alias': conexion.alias,
+        }]
+        if clave not in self.planes:
+            self.planes.add(clave)
+            plan = self.plan(conexion, sql, params, many)
+            if plan is not None:
+                registros.append({'tipo': 'plan', 'huella': clave, 'sql': normalizado, 'plan': plan})
+
+        lineas = ''.join(json.dumps(registro, ensure_ascii=False) + '\n' for registro in registros)
+        with self.lock:
+            self.ruta.parent.mkdir(parents=True, exist_ok=True)
+            with self.ruta.open('a', encoding='utf-8') as fichero:
+                fichero.write(lineas)
+
+    def plan(self, conexion, sql, params, many):
+        """EXPLAIN QUERY PLAN de un SELECT en SQLite, con un cursor aparte para no pisar el resultado"""
+        if many or conexion.vendor != 'sqlite' or not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+            return None
+        cursor = conexion.create_cursor()
+        try:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [fila[-1] for fila in cursor.fetchall()]
+        except Exception:
+            return None
+        finally:
+            cursor.close()
+
+
+_registro_lentas = None
+
+
+def instalar_registros(sender=None, connection=None, **kwargs):
+    """Receptor de connection_created: engancha RegistroConsultas y el log de consultas lentas"""
+    global _registro_lentas
+    if connection is None:
+        return
+    if _envoltorio_registro not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_envoltorio_registro)
+    umbral = getattr(settings, 'CONSULTAS_LENTAS_MS', 0)
+    if not umbral:
+        return
+    if _registro_lentas is None:
+        _registro_lentas = RegistroConsultasLentas(umbral, settings.CONSULTAS_LENTAS_LOG)
+    if _registro_lentas not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_registro_lentas)
@@ -0,0 +1,53 @@
+"""
+Instantánea de la parte común de la página de inicio (categorías y productos
+destacados), renderizada una vez y servida desde core.cache.
+
+Cuando caduca (ESCAPARATE_TTL) o cambian los destacados o las categorías, se
+sigue sirviendo la copia anterior mientras un hilo la regenera, y si la base
+de datos no responde se sirve hasta ESCAPARATE_OBSOLETO segundos más: la
+portada no espera a la BD. Si no hay copia que servir y la BD no responde, la
+portada sale sin escaparate en lugar de dar un error. Lo único personal de
+la instantánea, el token CSRF de los formularios de "Agregar", se sustituye
+en cada petición.
+"""
+
+import logging
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.template.backends.utils import csrf_input
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from productos.models import Categoria, Producto
+
+from .cache import cache
+
+CLAVE = 'core:escaparate'
+MARCA_CSRF = '<!-- csrf-escaparate -->'
+
+logger = logging.getLogger('petjoy.cache')
+
+
+def renderizar():
+    """HTML de categorías y destacados, sin nada propio del visitante"""
+    return render_to_string('core/escaparate.html', {
+        'categorias': Categoria.objects.all()[:6],
+        'productos_destacados': Producto.objects.para_tarjeta().filter(es_destacado=True, esta_disponible=True)[:8],
+        'marca_csrf': mark_safe(MARCA_CSRF),
+    })
+
+
+def escaparate(request):
+    try:
+        html = cache.obtener(CLAVE, renderizar, ttl=settings.ESCAPARATE_TTL, obsoleto=settings.ESCAPARATE_OBSOLETO)
+    except DatabaseError:
+        # Sin copia en caché y sin BD: no se guarda nada, la siguiente visita lo reintenta
+        logger.exception('No se pudo generar el escaparate')
+        return ''
+    return mark_safe(html.replace(MARCA_CSRF, csrf_input(request)))
+
+
+def caducar():
+    """Pide regenerar la instantánea (se sigue sirviendo la anterior mientras tanto)"""
+    cache.caducar(CLAVE)
@@ -0,0 +1,202 @@
+"""
+Ficheros estáticos con hash en el nombre, precomprimidos y servidos por la app.
+
+AlmacenEstaticos (STORAGES['staticfiles']) añade el hash del contenido al
+nombre de cada fichero en collectstatic y deja junto a cada fichero de texto
+sus variantes .gz y, si está instalado el paquete opcional brotli, .br.
+Si un fichero no está en el manifiesto (p. ej. en desarrollo sin
+collectstatic) se usa su nombre sin hash en lugar de fallar.
+
+EstaticosMiddleware sirve STATIC_ROOT con mmap, en trozos para no copiar el
+fichero entero en cada respuesta, elige la variante según Accept-Encoding
+(respetando los q=0) y marca como inmutables los ficheros con hash.
+"""
+
+import gzip
+import mimetypes
+import mmap
+import os
+import re
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRIMIBLES = ('.css', '.js', '.svg', '.json', '.txt', '.xml', '.csv', '.html', '.map', '.ico')
+
+# nombre.0123456789ab.ext, como los genera ManifestStaticFilesStorage
+CON_HASH = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+
+CODIFICACIONES = [('br', '.br'), ('gzip', '.gz')]
+
+TAMANO_TROZO = 64 * 1024
+
+
+def comprimir_gzip(contenido):
+    # mtime=0 para que la salida no cambie entre ejecuciones de collectstatic
+    return gzip.compress(contenido, compresslevel=9, mtime=0)
+
+
+def comprimir_brotli(contenido):
+    return brotli.compress(contenido, quality=11)
+
+
+def codificaciones_aceptadas(accept_encoding):
+    """Codificaciones de un Accept-Encoding con q > 0 ('*' cubre las no nombradas)"""
+    pesos = {}
+    for parte in accept_encoding.split(','):
+        codificacion, *parametros = [trozo.strip() for trozo in parte.split(';')]
+        if not codificacion:
+            continue
+        peso = 1.0
+        for parametro in parametros:
+            clave, _, valor = parametro.partition('=')
+            if clave.strip().lower() == 'q':
+                try:
+                    peso = float(valor)
+                except ValueError:
+                    peso = 0.0
+        pesos[codificacion.lower()] = peso
+    comodin = pesos.pop('*', 0.0)
+    return {codificacion for codificacion, _ in CODIFICACIONES if pesos.get(codificacion, comodin) > 0}
+
+
+class AlmacenEstaticos(ManifestStaticFilesStorage):
+    manifest_strict = False
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # El fichero no existe en STATIC_ROOT: se sirve sin hash (desarrollo)
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        # También los nombres sin hash, que son los que se usan con DEBUG
+        nombres = set(self.hashed_files) | set(self.hashed_files.values())
+        for nombre in sorted(nombres):
+            if nombre.endswith(COMPRIMIBLES):
+                for variante in self.comprimir(nombre):
+                    yield nombre, variante, True
+
+    def comprimir(self, nombre):
+        """Escribe las variantes comprimidas de `nombre` que ahorren espacio"""
+        with self.open(nombre) as fichero:
+            contenido = fichero.read()
+        compresores = [('.gz', comprimir_gzip)]
+        if brotli is not None:
+            compresores.append(('.br', comprimir_brotli))
+        for extension, comprimir in compresores:
+            comprimido = comprimir(contenido)
+            if len(comprimido) < len(contenido):
+                variante = nombre + extension
+                if self.exists(variante):
+                    self.delete(variante)
+                self._save(variante, ContentFile(comprimido))
+                yield variante
+
+
+class FicheroMapeado:
+    """Fichero estático abierto con mmap; se reabre si cambia en disco"""
+
+    def __init__(self, ruta, estado):
+        self.ruta = ruta
+        self.mtime_ns = estado.st_mtime_ns
+        self.tamano = estado.st_size
+        self.mapa = None
+        if self.tamano:
+            with open(ruta, 'rb') as fichero:
+                self.mapa = mmap.mmap(fichero.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def trozos(self):
+        """El contenido en vistas de TAMANO_TROZO bytes sobre el mapa, sin copiarlo"""
+        if self.mapa is None:
+            return
+        vista = memoryview(self.mapa)
+        for inicio in range(0, self.tamano, TAMANO_TROZO):
+            yield vista[inicio:inicio + TAMANO_TROZO]
+
+    async def atrozos(self):
+        """trozos() para ASGI, que cargaría entero en memoria un iterador síncrono"""
+        for trozo in self.trozos():
+            yield trozo
+
+    def vigente(self, estado):
+        return estado.st_mtime_ns == self.mtime_ns and estado.st_size == self.tamano
+
+
+class ServidorEstaticos:
+    """Resuelve una ruta relativa a `raiz` a un fichero y su mejor variante, y la sirve"""
+
+    def __init__(self, raiz):
+        self.raiz = os.path.realpath(raiz)
+        self.mapeados = {}
+
+    def _mapeado(self, ruta):
+        try:
+            estado = os.stat(ruta)
+        except OSError:
+            return None
+        mapeado = self.mapeados.get(ruta)
+        if mapeado is None or not mapeado.vigente(estado):
+            mapeado = self.mapeados[ruta] = FicheroMapeado(ruta, estado)
+        return mapeado
+
+    def buscar(self, nombre, accept_encoding):
+        """(FicheroMapeado, Content-Encoding o None, comprimible) o None si no existe"""
+        ruta = os.path.realpath(os.path.join(self.raiz, nombre))
+        if not ruta.startswith(self.raiz + os.sep) or not os.path.isfile(ruta):
+            return None
+        comprimible = ruta.endswith(COMPRIMIBLES)
+        if comprimible:
+            aceptadas = codificaciones_aceptadas(accept_encoding)
+            for codificacion, extension in CODIFICACIONES:
+                if codificacion in aceptadas:
+                    variante = self._mapeado(ruta + extension)
+                    if variante is not None:
+                        return variante, codificacion, comprimible
+        return self._mapeado(ruta), None, comprimible
+
+    def responder(self, request, nombre, encontrado, cache_control, asincrono=False):
+        """Respuesta (o 304) para lo que devolvió buscar(); `asincrono` con ASGI"""
+        fichero, codificacion, comprimible = encontrado
+        if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), fichero.mtime_ns // 10**9):
+            response = HttpResponseNotModified()
+        else:
+            if request.method == 'HEAD':
+                response = HttpResponse(content_type=self.tipo_contenido(nombre))
+            else:
+                response = StreamingHttpResponse(
+                    fichero.atrozos() if asincrono else fichero.trozos(),
+                    content_type=self.tipo_contenido(nombre),
+                )
+            response['Content-Length'] = str(fichero.tamano)
+            if codificacion:
+                response['Content-Encoding'] = codificacion
+        response['Last-Modified'] = http_date(fichero.mtime_ns // 10**9)
+        if comprimible:
+            response['Vary'] = 'Accept-Encoding'
+        response['Cache-Control'] = cache_control
+        return response
+
+    @staticmethod
+    def tipo_contenido(nombre):
+        tipo, _ = mimetypes.guess_type(nombre)
+        tipo = tipo or 'application/octet-stream'
+        if tipo.startswith('text/') or tipo in ('application/javascript', 'image/svg+xml', 'application/json'):
+            tipo += '; charset=utf-8'
+        return tipo
+
+    @staticmethod
+    def inmutable(nombre):
+        return bool(CON_HASH.search(nombre))
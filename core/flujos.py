@@ -0,0 +1,37 @@
+"""
+Utilidades para generar ficheros de texto en streaming (exportaciones,
+catálogo, feeds) sin tenerlos enteros en memoria.
+"""
+
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+
+class Eco:
+    """Pseudo-buffer que devuelve lo escrito en lugar de guardarlo (para csv.writer)"""
+    def write(self, valor):
+        return valor
+
+
+async def iterar_async(lineas, lote=500):
+    """
+    Recorre desde código async un generador síncrono que lee de la BD.
+
+    Las líneas se piden de `lote` en `lote` en el hilo de sync_to_async (el
+    mismo siempre, así que el cursor de la BD sigue en su conexión) y salen
+    unidas en un solo trozo.
+    """
+    iterador = iter(lineas)
+    siguientes = sync_to_async(lambda: list(islice(iterador, lote)))
+    while trozo := await siguientes():
+        yield ''.join(trozo)
+
+
+def contenido_streaming(lineas):
+    """
+    Contenido para StreamingHttpResponse: con ASGI (VISTAS_ASYNC) un iterador
+    async, porque Django cargaría en memoria uno síncrono antes de enviarlo.
+    """
+    return iterar_async(lineas) if settings.VISTAS_ASYNC else lineas
@@ -0,0 +1,207 @@
+"""
+Instrumentación por petición: tiempo de cada fase y cabecera Server-Timing.
+
+ServerTimingMiddleware abre una Medicion para las peticiones muestreadas
+(INSTRUMENTACION_MUESTREO, entre 0 y 1) y la deja en una contextvar. Mientras
+está abierta se acumulan:
+
+- sql: tiempo y número de consultas (execute wrapper en cada conexión)
+- sesion: carga de la sesión desde su backend
+- tpl: tiempo de render propio de cada plantilla (el de las que incluye se
+  anota en ellas, así que los tiempos se pueden sumar)
+- cache: aciertos, fallos y tiempo de las lecturas de caché
+- bloques explícitos con medir('nombre'), p. ej. el carrito o la pasarela
+
+Fuera de una petición muestreada todos los ganchos se reducen a leer la
+contextvar; con el muestreo a 0 ni siquiera se instalan.
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from importlib import import_module
+
+from django.conf import settings
+
+_medicion = ContextVar('medicion', default=None)
+
+
+class Medicion:
+    """Tiempos acumulados de una petición"""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.fases = {}
+        self.plantillas = {}
+        self.contadores = {}
+        self.pila_plantillas = []  # tiempo de las hijas de cada plantilla que se está pintando
+
+    def anotar(self, nombre, duracion, tabla=None):
+        tabla = self.fases if tabla is None else tabla
+        total, veces = tabla.get(nombre, (0.0, 0))
+        tabla[nombre] = (total + duracion, veces + 1)
+
+    def contar(self, nombre, cantidad=1):
+        self.contadores[nombre] = self.contadores.get(nombre, 0) + cantidad
+
+    @property
+    def total(self):
+        return time.perf_counter() - self.inicio
+
+    def server_timing(self):
+        """Valor de la cabecera Server-Timing (duraciones en ms)"""
+        partes = []
+        for nombre, (duracion, veces) in self.fases.items():
+            descripcion = f'{veces} consultas' if nombre == 'sql' else f'{veces}x'
+            if nombre == 'cache':
+                descripcion = (
+                    f"{self.contadores.get('cache_aciertos', 0)} aciertos "
+                    f"{self.contadores.get('cache_fallos', 0)} fallos"
+                )
+            partes.append(f'{nombre};dur={duracion * 1000:.1f};desc="{descripcion}"')
+        for plantilla, (duracion, _) in self.plantillas.items():
+            partes.append(f'tpl;dur={duracion * 1000:.1f};desc="{plantilla}"')
+        partes.append(f'total;dur={self.total * 1000:.1f}')
+        return ', '.join(partes)
+
+    def como_dict(self):
+        """Resumen para el log estructurado (duraciones en ms)"""
+        return {
+            'total_ms': round(self.total * 1000, 2),
+            'fases': {
+                nombre: {'ms': round(duracion * 1000, 2), 'veces': veces}
+                for nombre, (duracion, veces) in self.fases.items()
+            },
+            'plantillas': {
+                nombre: round(duracion * 1000, 2) for nombre, (duracion, _) in self.plantillas.items()
+            },
+            'contadores': self.contadores,
+        }
+
+
+def medicion_actual():
+    return _medicion.get()
+
+
+@contextmanager
+def medicion():
+    """Abre una Medicion para el bloque (lo usa el middleware)"""
+    actual = Medicion()
+    token = _medicion.set(actual)
+    try:
+        yield actual
+    finally:
+        _medicion.reset(token)
+
+
+@contextmanager
+def medir(nombre):
+    """Acumula la duración del bloque en la fase `nombre` de la medición en curso"""
+    actual = _medicion.get()
+    if actual is None:
+        yield
+        return
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        actual.anotar(nombre, time.perf_counter() - inicio)
+
+
+def contar(nombre, cantidad=1):
+    """Suma un contador a la medición en curso, si la hay"""
+    actual = _medicion.get()
+    if actual is not None:
+        actual.contar(nombre, cantidad)
+
+
+# Ganchos
+
+def _envoltorio_sql(execute, sql, params, many, context):
+    actual = _medicion.get()
+    if actual is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        actual.anotar('sql', time.perf_counter() - inicio)
+
+
+def _conexion_creada(sender, connection, **kwargs):
+    if _envoltorio_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_envoltorio_sql)
+
+
+def _instrumentar_render(render_original):
+    @wraps(render_original)
+    def render(self, context):
+        actual = _medicion.get()
+        if actual is None:
+            return render_original(self, context)
+        inicio = time.perf_counter()
+        actual.pila_plantillas.append(0.0)
+        try:
+            return render_original(self, context)
+        finally:
+            duracion = time.perf_counter() - inicio
+            hijas = actual.pila_plantillas.pop()
+            if actual.pila_plantillas:
+                actual.pila_plantillas[-1] += duracion
+            actual.anotar(self.origin.template_name or self.origin.name, duracion - hijas,
+                          tabla=actual.plantillas)
+    return render
+
+
+def _instrumentar_metodo(metodo, fase):
+    @wraps(metodo)
+    def envoltorio(*args, **kwargs):
+        with medir(fase):
+            return metodo(*args, **kwargs)
+    return envoltorio
+
+
+def _instrumentar_lectura_cache(metodo):
+    centinela = object()
+
+    @wraps(metodo)
+    def get(self, key, default=None, version=None):
+        actual = _medicion.get()
+        if actual is None:
+            return metodo(self, key, default, version)
+        inicio = time.perf_counter()
+        valor = metodo(self, key, centinela, version)
+        actual.anotar('cache', time.perf_counter() - inicio)
+        if valor is centinela:
+            actual.contar('cache_fallos')
+            return default
+        actual.contar('cache_aciertos')
+        return valor
+    return get
+
+
+def instalar():
+    """Engancha la instrumentación a SQL, sesiones, plantillas y cachés (una sola vez)"""
+    from django.core.cache import caches
+    from django.db import connections
+    from django.db.backends.signals import connection_created
+    from django.template.base import Template
+
+    if getattr(Template.render, 'instrumentado', False):
+        return
+    connection_created.connect(_conexion_creada, dispatch_uid='instrumentacion_sql')
+    for conexion in connections.all(initialized_only=True):
+        _conexion_creada(None, conexion)
+
+    Template.render = _instrumentar_render(Template.render)
+    Template.render.instrumentado = True
+
+    sesiones = import_module(settings.SESSION_ENGINE).SessionStore
+    sesiones.load = _instrumentar_metodo(sesiones.load, 'sesion')
+
+    for alias in settings.CACHES:
+        clase = type(caches[alias])
+        if not getattr(clase.get, 'instrumentado', False):
+            clase.get = _instrumentar_lectura_cache(clase.get)
+            clase.get.instrumentado = True
@@ -0,0 +1,191 @@
+import json
+import statistics
+import time
+from itertools import combinations
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import (
+    CaptureQueriesContext, setup_databases, setup_test_environment, teardown_databases, teardown_test_environment,
+)
+
+from core.routers import leer_de_primaria
+from productos.models import Producto
+
+LINEA_BASE = Path(settings.BASE_DIR) / 'benchmarks' / 'linea_base.json'
+
+DATOS_ENVIO = {
+    'nombre': 'Ana', 'apellidos': 'Benchmark', 'email': 'benchmark@ejemplo.com', 'telefono': '600000000',
+    'direccion': 'Calle Falsa 123', 'ciudad': 'Madrid', 'codigo_postal': '28001',
+    'metodo_pago': 'tarjeta', 'notas': '',
+}
+
+
+def percentil(valores, p):
+    """Percentil por interpolación lineal (p entre 0 y 100)"""
+    ordenados = sorted(valores)
+    if len(ordenados) == 1:
+        return ordenados[0]
+    posicion = (len(ordenados) - 1) * p / 100
+    inferior = int(posicion)
+    superior = min(inferior + 1, len(ordenados) - 1)
+    return ordenados[inferior] + (ordenados[superior] - ordenados[inferior]) * (posicion - inferior)
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide p50/p95 y número de consultas de las vistas principales sobre un conjunto de '
+        'datos generado en una BD de pruebas, y lo compara con una línea base JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--productos', type=int, default=5000)
+        parser.add_argument('--clientes', type=int, default=2000)
+        parser.add_argument('--pedidos', type=int, default=20000)
+        parser.add_argument('--repeticiones', type=int, default=30, help='Mediciones por escenario')
+        parser.add_argument('--calentamiento', type=int, default=3, help='Ejecuciones descartadas por escenario')
+        parser.add_argument('--linea-base', default=str(LINEA_BASE), help='Fichero JSON con la línea base')
+        parser.add_argument('--guardar', action='store_true', help='Guarda los resultados como nueva línea base')
+        parser.add_argument(
+            '--tolerancia', type=float, default=0.25,
+            help='Aumento relativo de p95 admitido antes de considerarlo una regresión',
+        )
+        parser.add_argument(
+            '--margen-ms', type=float, default=2.0,
+            help='Aumento absoluto de p95 (ms) por debajo del cual nunca se considera regresión',
+        )
+
+    def handle(self, *args, **options):
+        self.repeticiones = options['repeticiones']
+        self.calentamiento = options['calentamiento']
+
+        setup_test_environment()
+        # También la réplica, que en pruebas es un espejo de la primaria: nunca se leen datos reales
+        bases_de_datos = setup_databases(verbosity=0, interactive=False)
+        try:
+            self.stdout.write('Generando datos de prueba...')
+            call_command(
+                'generar_datos', productos=options['productos'], clientes=options['clientes'],
+                sesiones=0, pedidos=options['pedidos'], stdout=self.stdout,
+            )
+            # Todo por la misma conexión, la que se mide y cuyas consultas se cuentan
+            with override_settings(PASARELA_PAGO='pedidos.pasarela.PasarelaFalsa'), leer_de_primaria():
+                resultados = self._ejecutar_escenarios()
+        finally:
+            teardown_databases(bases_de_datos, verbosity=0)
+            teardown_test_environment()
+
+        self._informe(resultados)
+        ruta = Path(options['linea_base'])
+        if options['guardar']:
+            ruta.parent.mkdir(parents=True, exist_ok=True)
+            ruta.write_text(json.dumps(resultados, indent=2, sort_keys=True) + '\n', encoding='utf-8')
+            self.stdout.write(self.style.SUCCESS(f'✅ Línea base guardada en {ruta}'))
+        elif ruta.exists():
+            linea_base = json.loads(ruta.read_text(encoding='utf-8'))
+            self._comparar(resultados, linea_base, options['tolerancia'], options['margen_ms'])
+        else:
+            self.stdout.write(self.style.WARNING(f'No hay línea base en {ruta}; usa --guardar para crearla'))
+
+    # Escenarios
+
+    def _escenarios(self):
+        producto = Producto.objects.filter(esta_disponible=True, stock__gt=0).order_by('id').first()
+        filtros = {
+            'categoria': producto.categoria_id,
+            'marca': producto.marca_id,
+            'genero': producto.genero or 'unisex',
+        }
+        escenarios = [('inicio', lambda cliente: [cliente.get('/')])]
+
+        # Catálogo con cada combinación de filtros
+        for n in range(len(filtros) + 1):
+            for claves in combinations(sorted(filtros), n):
+                parametros = {clave: filtros[clave] for clave in claves}
+                nombre = 'catalogo[' + ','.join(claves) + ']'
+                escenarios.append((nombre, lambda cliente, p=parametros: [cliente.get('/productos/', p)]))
+        escenarios += [
+            ('catalogo[pagina=3]', lambda cliente: [cliente.get('/productos/', {'page': 3})]),
+            ('busqueda', lambda cliente: [cliente.get('/productos/', {'q': 'pelota'})]),
+            ('detalle_producto', lambda cliente: [cliente.get(f'/productos/producto/{producto.slug}/')]),
+            ('carrito[agregar]', lambda cliente: [
+                cliente.post(f'/pedidos/carrito/agregar/{producto.id}/', {'cantidad': 1}),
+            ]),
+            ('carrito[actualizar]', lambda cliente: [
+                cliente.post(f'/pedidos/carrito/actualizar/{producto.id}/', {'cantidad': 2}),
+            ]),
+            ('carrito[ver]', lambda cliente: [cliente.get('/pedidos/carrito/')]),
+            ('checkout[completo]', lambda cliente: [
+                cliente.get('/pedidos/checkout/'),
+                cliente.post('/pedidos/checkout/', DATOS_ENVIO, follow=True),
+            ]),
+        ]
+        # Tras pagar el carrito queda vacío: se repone, sin medirlo, antes de cada checkout
+        preparar_checkout = lambda cliente: cliente.post(f'/pedidos/carrito/agregar/{producto.id}/', {'cantidad': 1})
+        return [
+            (nombre, peticion, preparar_checkout if nombre.startswith('checkout') else None)
+            for nombre, peticion in escenarios
+        ]
+
+    def _ejecutar_escenarios(self):
+        cliente = Client()
+        resultados = {}
+        for nombre, peticion, preparar in self._escenarios():
+            for _ in range(self.calentamiento):
+                if preparar:
+                    preparar(cliente)
+                peticion(cliente)
+
+            tiempos = []
+            for _ in range(self.repeticiones):
+                if preparar:
+                    preparar(cliente)
+                inicio = time.perf_counter()
+                respuestas = peticion(cliente)
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+                errores = [r.status_code for r in respuestas if r.status_code >= 400]
+                if errores:
+                    raise CommandError(f'El escenario {nombre} devolvió {errores}')
+
+            # El recuento de consultas se mide aparte para no inflar los tiempos
+            if preparar:
+                preparar(cliente)
+            with CaptureQueriesContext(connection) as consultas:
+                peticion(cliente)
+
+            resultados[nombre] = {
+                'p50_ms': round(statistics.median(tiempos), 2),
+                'p95_ms': round(percentil(tiempos, 95), 2),
+                'consultas': len(consultas),
+            }
+        return resultados
+
+    # Informe y comparación
+
+    def _informe(self, resultados):
+        ancho = max(len(nombre) for nombre in resultados)
+        self.stdout.write(f"\n{'Escenario'.ljust(ancho)}  {'p50 ms':>8}  {'p95 ms':>8}  {'consultas':>9}")
+        for nombre, datos in resultados.items():
+            self.stdout.write(
+                f"{nombre.ljust(ancho)}  {datos['p50_ms']:>8.2f}  {datos['p95_ms']:>8.2f}  {datos['consultas']:>9}"
+            )
+
+    def _comparar(self, resultados, linea_base, tolerancia, margen_ms):
+        regresiones = []
+        for nombre, base in linea_base.items():
+            actual = resultados.get(nombre)
+            if actual is None:
+                continue
+            if actual['consultas'] > base['consultas']:
+                regresiones.append(f"{nombre}: {base['consultas']} → {actual['consultas']} consultas")
+            limite = max(base['p95_ms'] * (1 + tolerancia), base['p95_ms'] + margen_ms)
+            if actual['p95_ms'] > limite:
+                regresiones.append(f"{nombre}: p95 {base['p95_ms']:.2f} → {actual['p95_ms']:.2f} ms")
+
+        if regresiones:
+            raise CommandError('Regresiones de rendimiento:\n  ' + '\n  '.join(regresiones))
+        self.stdout.write(self.style.SUCCESS('✅ Sin regresiones respecto a la línea base'))
@@ -0,0 +1,395 @@
+import asyncio
+import json
+import random
+import re
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPException
+from http.cookiejar import CookieJar
+from pathlib import Path
+from urllib.error import HTTPError
+from urllib.parse import urlencode, urlsplit
+from urllib.request import HTTPCookieProcessor, HTTPRedirectHandler, Request, build_opener
+
+from django.conf import settings
+from django.core import mail
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, override_settings
+from django.test.utils import (
+    setup_databases, setup_test_environment, teardown_databases, teardown_test_environment,
+)
+from django.urls import Resolver404, resolve, reverse
+
+from .benchmark import DATOS_ENVIO, percentil
+
+RECORRIDOS_POR_DEFECTO = 'mirar=50,buscar=20,abandonar=20,comprar=10'
+PRODUCTOS_POR_DEFECTO = 200
+MAX_REDIRECCIONES = 5
+
+# Los enlaces se sacan del HTML, como haría un navegador: sirve con cualquier catálogo
+ENLACE_PRODUCTO = re.compile(r'href="/productos/producto/([\w-]+)/"')
+FORMULARIO_AGREGAR = re.compile(r'action="/pedidos/carrito/agregar/(\d+)/"')
+TALLA_DISPONIBLE = re.compile(r'<option value="([^"]+)">')
+
+
+class ErrorRecorrido(Exception):
+    """El recorrido no pudo terminarse (error HTTP, de red o página inesperada)"""
+
+
+def nombre_url(ruta):
+    try:
+        return resolve(urlsplit(ruta).path).view_name
+    except Resolver404:
+        return 'desconocida'
+
+
+# Clientes: mismo interfaz para la aplicación en proceso y para un servidor real
+
+class ClienteASGI:
+    """Peticiones a la aplicación del propio proceso; AsyncClient pasa por el manejador ASGI"""
+
+    def __init__(self):
+        self.cliente = AsyncClient(raise_request_exception=False)
+
+    async def peticion(self, metodo, ruta, datos=None, referer=''):
+        if metodo == 'POST':
+            respuesta = await self.cliente.post(ruta, datos or {}, HTTP_REFERER=referer)
+        else:
+            respuesta = await self.cliente.get(ruta)
+        return respuesta.status_code, respuesta.get('Location', ''), respuesta.content.decode('utf-8', 'replace')
+
+
+class _SinRedirecciones(HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None  # las sigue UsuarioVirtual, midiendo cada salto
+
+
+class ClienteHTTP:
+    """Peticiones a un servidor real con urllib, en un grupo de hilos (sin dependencias nuevas)"""
+
+    def __init__(self, base, ejecutor):
+        self.base = base.rstrip('/')
+        self.ejecutor = ejecutor
+        self.cookies = CookieJar()
+        self.abridor = build_opener(HTTPCookieProcessor(self.cookies), _SinRedirecciones)
+
+    async def peticion(self, metodo, ruta, datos=None, referer=''):
+        bucle = asyncio.get_running_loop()
+        return await bucle.run_in_executor(self.ejecutor, self._peticion, metodo, ruta, datos, referer)
+
+    def _peticion(self, metodo, ruta, datos, referer):
+        cuerpo, cabeceras = None, {}
+        if metodo == 'POST':
+            cuerpo = urlencode(datos or {}).encode()
+            token = next((cookie.value for cookie in self.cookies if cookie.name == settings.CSRF_COOKIE_NAME), '')
+            cabeceras = {'X-CSRFToken': token, 'Referer': self.base + referer}
+        try:
+            with self.abridor.open(Request(self.base + ruta, cuerpo, cabeceras, method=metodo), timeout=30) as respuesta:
+                return respuesta.status, respuesta.headers.get('Location', ''), respuesta.read().decode('utf-8', 'replace')
+        except HTTPError as error:  # también las redirecciones, que no se siguen aquí
+            with error:
+                return error.code, error.headers.get('Location', ''), error.read().decode('utf-8', 'replace')
+
+
+# Usuarios virtuales y recorridos
+
+class UsuarioVirtual:
+    """Un visitante con su propia sesión; `pausa` es el tiempo medio que mira cada página"""
+
+    def __init__(self, cliente, resultados, azar, pausa):
+        self.cliente = cliente
+        self.resultados = resultados
+        self.azar = azar
+        self.pausa = pausa
+        self.pagina = '/'
+
+    async def get(self, ruta):
+        return await self._navegar('GET', ruta)
+
+    async def post(self, ruta, datos):
+        return await self._navegar('POST', ruta, datos)
+
+    async def _navegar(self, metodo, ruta, datos=None):
+        """Pide la página siguiendo las redirecciones; devuelve (ruta final, HTML)"""
+        if self.pausa:
+            await asyncio.sleep(self.azar.expovariate(1 / self.pausa))
+        for _ in range(MAX_REDIRECCIONES):
+            nombre = nombre_url(ruta)
+            inicio = time.perf_counter()
+            try:
+                estado, destino, cuerpo = await self.cliente.peticion(metodo, ruta, datos, self.pagina)
+            except (OSError, HTTPException) as error:
+                self.resultados.anotar(nombre, (time.perf_counter() - inicio) * 1000, f'{type(error).__name__}')
+                raise ErrorRecorrido(f'{nombre}: {error}') from error
+            fallo = str(estado) if estado >= 400 else None
+            self.resultados.anotar(nombre, (time.perf_counter() - inicio) * 1000, fallo)
+            if fallo:
+                raise ErrorRecorrido(f'{nombre}: HTTP {estado}')
+            if estado not in (301, 302, 303, 307, 308) or not destino:
+                self.pagina = ruta
+                return ruta, cuerpo
+            partes = urlsplit(destino)
+            ruta = partes.path + (f'?{partes.query}' if partes.query else '')
+            metodo, datos = 'GET', None
+        raise ErrorRecorrido(f'Demasiadas redirecciones desde {nombre}')
+
+    async def ver_producto(self, listado):
+        """Abre un producto con stock de los enlazados en `listado` y devuelve (id, talla)"""
+        slugs = ENLACE_PRODUCTO.findall(listado)
+        if not slugs:
+            _, listado = await self.get(reverse('productos:catalogo'))
+            slugs = ENLACE_PRODUCTO.findall(listado)
+        for slug in self.azar.sample(slugs, min(len(slugs), 3)):
+            _, detalle = await self.get(reverse('productos:detalle', args=[slug]))
+            agregar = FORMULARIO_AGREGAR.search(detalle)
+            if agregar:
+                formulario = detalle[agregar.end():detalle.find('</form>', agregar.end())]
+                tallas = TALLA_DISPONIBLE.findall(formulario)
+                return int(agregar.group(1)), self.azar.choice(tallas) if tallas else ''
+        raise ErrorRecorrido('No se encontró ningún producto con stock')
+
+    async def agregar(self, listado):
+        producto_id, talla = await self.ver_producto(listado)
+        await self.post(reverse('pedidos:agregar_carrito', args=[producto_id]), {'cantidad': 1, 'talla': talla})
+
+
+async def mirar(usuario):
+    await usuario.get('/')
+    _, listado = await usuario.get(f"{reverse('productos:catalogo')}?page={usuario.azar.randint(1, 3)}")
+    await usuario.ver_producto(listado)
+
+
+async def buscar(usuario):
+    _, listado = await usuario.get(reverse('productos:catalogo'))
+    slugs = ENLACE_PRODUCTO.findall(listado) or ['pelota']
+    termino = usuario.azar.choice(slugs).split('-')[0]
+    _, resultados = await usuario.get(f"{reverse('productos:catalogo')}?{urlencode({'q': termino})}")
+    await usuario.ver_producto(resultados)
+
+
+async def abandonar(usuario):
+    _, listado = await usuario.get(reverse('productos:catalogo'))
+    await usuario.agregar(listado)
+    await usuario.get(reverse('pedidos:carrito'))
+
+
+async def comprar(usuario):
+    _, listado = await usuario.get(reverse('productos:catalogo'))
+    await usuario.agregar(listado)
+    await usuario.get(reverse('pedidos:carrito'))
+    await usuario.get(reverse('pedidos:checkout'))
+    final, _ = await usuario.post(reverse('pedidos:checkout'), DATOS_ENVIO)
+    if nombre_url(final) != 'pedidos:confirmacion':
+        raise ErrorRecorrido(f'El checkout terminó en {nombre_url(final)} y no en la confirmación')
+
+
+RECORRIDOS = {'mirar': mirar, 'buscar': buscar, 'abandonar': abandonar, 'comprar': comprar}
+
+
+class Resultados:
+    """Tiempos por nombre de URL; solo los toca el bucle de eventos, sin bloqueos"""
+
+    def __init__(self):
+        self.tiempos = defaultdict(list)
+        self.errores = Counter()
+        self.recorridos = defaultdict(Counter)
+        self.fallos = Counter()
+
+    def anotar(self, nombre, ms, fallo=None):
+        self.tiempos[nombre].append(ms)
+        if fallo:
+            self.errores[nombre] += 1
+
+    def resumen(self, segundos):
+        peticiones = sum(len(tiempos) for tiempos in self.tiempos.values())
+        errores = sum(self.errores.values())
+        return {
+            'segundos': round(segundos, 2),
+            'peticiones': peticiones,
+            'peticiones_s': round(peticiones / segundos, 2) if segundos else 0,
+            'errores': errores,
+            'tasa_errores': round(errores / peticiones, 4) if peticiones else 0,
+            'recorridos': {
+                nombre: {'completados': cuenta['completados'], 'fallidos': cuenta['fallidos']}
+                for nombre, cuenta in sorted(self.recorridos.items())
+            },
+            'fallos': dict(self.fallos.most_common(10)),
+            'urls': {
+                nombre: {
+                    'peticiones': len(tiempos),
+                    'errores': self.errores[nombre],
+                    'p50_ms': round(percentil(tiempos, 50), 1),
+                    'p95_ms': round(percentil(tiempos, 95), 1),
+                    'p99_ms': round(percentil(tiempos, 99), 1),
+                    'max_ms': round(max(tiempos), 1),
+                }
+                for nombre, tiempos in sorted(self.tiempos.items())
+            },
+        }
+
+
+def leer_recorridos(texto):
+    """'mirar=50,comprar=10' -> {'mirar': 50.0, 'comprar': 10.0}"""
+    pesos = {}
+    for parte in filter(None, (trozo.strip() for trozo in texto.split(','))):
+        nombre, _, peso = parte.partition('=')
+        if nombre not in RECORRIDOS:
+            raise CommandError(f"Recorrido desconocido: {nombre} (hay {', '.join(RECORRIDOS)})")
+        try:
+            pesos[nombre] = float(peso or 1)
+        except ValueError:
+            raise CommandError(f'Peso no válido para {nombre}: {peso}')
+    if not any(peso > 0 for peso in pesos.values()):
+        raise CommandError('Hace falta al menos un recorrido con peso positivo')
+    return pesos
+
+
+class Command(BaseCommand):
+    help = (
+        'Prueba de carga: usuarios virtuales asyncio que repiten recorridos ponderados (mirar, buscar, '
+        'carrito abandonado, compra con la pasarela falsa) contra la aplicación en este proceso (ASGI) '
+        'o contra un servidor con --url, e informa de peticiones/s, percentiles por URL y errores'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuarios', type=int, default=20, help='Usuarios virtuales simultáneos')
+        parser.add_argument('--duracion', type=float, default=30, help='Segundos empezando recorridos')
+        parser.add_argument('--rampa', type=float, default=0, help='Segundos hasta tener a todos los usuarios')
+        parser.add_argument('--pausa', type=float, default=0, help='Segundos medios que se mira cada página')
+        parser.add_argument('--recorridos', default=RECORRIDOS_POR_DEFECTO, help='Pesos: mirar=50,comprar=10')
+        parser.add_argument('--semilla', type=int, help='Repite la misma secuencia de recorridos')
+        parser.add_argument(
+            '--url',
+            help='Servidor al que atacar (p. ej. http://127.0.0.1:8000); arrancado con '
+                 'PETJOY_PASARELA=pedidos.pasarela.PasarelaFalsa para que las compras terminen',
+        )
+        parser.add_argument(
+            '--productos', type=int,
+            help=f'En proceso: productos generados en la BD de pruebas desechable (por defecto {PRODUCTOS_POR_DEFECTO})',
+        )
+        parser.add_argument(
+            '--usar-bd-configurada', action='store_true',
+            help='En proceso: ataca la BD configurada en lugar de una de pruebas; las compras crean pedidos en ella',
+        )
+        parser.add_argument('--json', help='Guarda los resultados en este fichero JSON')
+        parser.add_argument('--comparar', help='JSON de una ejecución anterior con el que comparar')
+
+    def handle(self, *args, **options):
+        pesos = leer_recorridos(options['recorridos'])
+        if options['usuarios'] < 1:
+            raise CommandError('Hace falta al menos un usuario')
+        if options['url'] and (options['productos'] or options['usar_bd_configurada']):
+            raise CommandError('--productos y --usar-bd-configurada solo tienen sentido sin --url')
+        if options['usar_bd_configurada'] and options['productos']:
+            raise CommandError('--productos genera una BD de pruebas: no se combina con --usar-bd-configurada')
+
+        if options['url']:
+            destino = options['url']
+            with ThreadPoolExecutor(max_workers=options['usuarios']) as ejecutor:
+                resumen = asyncio.run(self._ejecutar(lambda: ClienteHTTP(options['url'], ejecutor), pesos, options))
+        else:
+            destino = 'en proceso (ASGI, vistas ' + ('async' if settings.VISTAS_ASYNC else 'síncronas') + ')'
+            if not options['usar_bd_configurada']:
+                options['productos'] = options['productos'] or PRODUCTOS_POR_DEFECTO
+            resumen = self._en_proceso(pesos, options)
+
+        resumen['configuracion'] = {
+            'destino': destino,
+            **{clave: options[clave] for clave in ('usuarios', 'duracion', 'rampa', 'pausa', 'semilla', 'productos')},
+            'recorridos': pesos,
+        }
+        self._informe(resumen)
+        if options['comparar']:
+            self._comparar(resumen, json.loads(Path(options['comparar']).read_text(encoding='utf-8')))
+        if options['json']:
+            Path(options['json']).write_text(json.dumps(resumen, indent=2, ensure_ascii=False) + '\n', encoding='utf-8')
+            self.stdout.write(f"Resultados guardados en {options['json']}")
+
+        estilo = self.style.WARNING if resumen['errores'] else self.style.SUCCESS
+        self.stdout.write(estilo(
+            f"{'⚠️' if resumen['errores'] else '✅'} {resumen['peticiones']} peticiones en {resumen['segundos']} s "
+            f"({resumen['peticiones_s']}/s), {resumen['errores']} errores ({resumen['tasa_errores']:.2%})"
+        ))
+
+    def _en_proceso(self, pesos, options):
+        propio = not hasattr(mail, 'outbox')  # dentro de los tests ya está preparado
+        if propio:
+            setup_test_environment()  # admite el host 'testserver' de AsyncClient y no envía emails
+        bases_de_datos = None
+        try:
+            if not options['usar_bd_configurada']:
+                # También la réplica, que en pruebas es un espejo de la primaria
+                bases_de_datos = setup_databases(verbosity=0, interactive=False)
+                self.stdout.write('Generando datos de prueba...')
+                call_command(
+                    'generar_datos', productos=options['productos'], clientes=10, sesiones=0, pedidos=0,
+                    stdout=self.stdout,
+                )
+            with override_settings(PASARELA_PAGO='pedidos.pasarela.PasarelaFalsa'):
+                return asyncio.run(self._ejecutar(ClienteASGI, pesos, options))
+        finally:
+            if bases_de_datos is not None:
+                teardown_databases(bases_de_datos, verbosity=0)
+            if propio:
+                teardown_test_environment()
+
+    async def _ejecutar(self, crear_cliente, pesos, options):
+        resultados = Resultados()
+        nombres, ponderaciones = list(pesos), list(pesos.values())
+        usuarios = options['usuarios']
+        fin = time.monotonic() + options['rampa'] + options['duracion']
+
+        async def usuario(n):
+            await asyncio.sleep(options['rampa'] * n / usuarios)
+            semilla = f"{options['semilla']}-{n}" if options['semilla'] is not None else None
+            virtual = UsuarioVirtual(crear_cliente(), resultados, random.Random(semilla), options['pausa'])
+            # Al acabarse el tiempo no se empiezan recorridos, pero los empezados terminan
+            while time.monotonic() < fin:
+                nombre = virtual.azar.choices(nombres, ponderaciones)[0]
+                try:
+                    await RECORRIDOS[nombre](virtual)
+                except ErrorRecorrido as error:
+                    resultados.recorridos[nombre]['fallidos'] += 1
+                    resultados.fallos[str(error)] += 1
+                else:
+                    resultados.recorridos[nombre]['completados'] += 1
+
+        self.stdout.write(f'{usuarios} usuarios durante {options["duracion"]:g} s...')
+        inicio = time.perf_counter()
+        await asyncio.gather(*(usuario(n) for n in range(usuarios)))
+        return resultados.resumen(time.perf_counter() - inicio)
+
+    # Informe y comparación
+
+    def _informe(self, resumen):
+        self.stdout.write(f"\nDestino: {resumen['configuracion']['destino']}")
+        urls = resumen['urls']
+        ancho = max([len(nombre) for nombre in urls] + [3])
+        self.stdout.write(
+            f"\n{'URL'.ljust(ancho)}  {'peticiones':>10}  {'errores':>7}  {'p50 ms':>8}  {'p95 ms':>8}  {'p99 ms':>8}"
+        )
+        for nombre, datos in urls.items():
+            self.stdout.write(
+                f"{nombre.ljust(ancho)}  {datos['peticiones']:>10}  {datos['errores']:>7}  {datos['p50_ms']:>8.1f}  "
+                f"{datos['p95_ms']:>8.1f}  {datos['p99_ms']:>8.1f}"
+            )
+        self.stdout.write(f"\n{'Recorrido':<10}  {'completados':>11}  {'fallidos':>8}")
+        for nombre, datos in resumen['recorridos'].items():
+            self.stdout.write(f"{nombre:<10}  {datos['completados']:>11}  {datos['fallidos']:>8}")
+        for fallo, veces in resumen['fallos'].items():
+            self.stdout.write(self.style.WARNING(f'  {veces}× {fallo}'))
+        self.stdout.write('')
+
+    def _comparar(self, resumen, anterior):
+        self.stdout.write(
+            f"Peticiones/s: {anterior['peticiones_s']} → {resumen['peticiones_s']} · "
+            f"errores: {anterior['tasa_errores']:.2%} → {resumen['tasa_errores']:.2%}"
+        )
+        for nombre, datos in resumen['urls'].items():
+            base = anterior['urls'].get(nombre)
+            if base and base['p95_ms']:
+                cambio = datos['p95_ms'] / base['p95_ms'] - 1
+                self.stdout.write(f"  {nombre}: p95 {base['p95_ms']:.1f} → {datos['p95_ms']:.1f} ms ({cambio:+.0%})")
+        self.stdout.write('')
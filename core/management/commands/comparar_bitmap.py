@@ -0,0 +1,102 @@
+import random
+import statistics
+import sys
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.paginator import Paginator
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from core.management.commands.benchmark import percentil
+from productos.bitmap import indice_catalogo
+from productos.facetas import BANDAS_PRECIO
+from productos.models import Categoria, Marca, Producto
+from productos.views import filtrar_catalogo
+
+POR_PAGINA = 12
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara el catálogo filtrado por SQL con el índice de bits en memoria '
+        '(productos.bitmap) sobre un catálogo generado en una BD de pruebas'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--productos', type=int, default=100_000)
+        parser.add_argument('--consultas', type=int, default=300, help='Combinaciones de filtros medidas')
+        parser.add_argument('--semilla', type=int, default=42)
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        nombre_bd = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self.stdout.write(f"Generando {options['productos']} productos...")
+            call_command(
+                'generar_datos', productos=options['productos'], clientes=0, sesiones=0, pedidos=0,
+                stdout=self.stdout,
+            )
+            consultas = self._consultas(options['consultas'], random.Random(options['semilla']))
+
+            indice_catalogo.reiniciar()
+            inicio = time.perf_counter()
+            indice_catalogo.refrescar()
+            construccion_ms = (time.perf_counter() - inicio) * 1000
+
+            sql = [self._medir(self._pagina_sql, parametros) for parametros in consultas]
+            bitmap = [self._medir(self._pagina_bitmap, parametros) for parametros in consultas]
+        finally:
+            connection.creation.destroy_test_db(nombre_bd, verbosity=0)
+            teardown_test_environment()
+
+        distintas = sum(1 for (_, a), (_, b) in zip(sql, bitmap) if a != b)
+        memoria = sum(sys.getsizeof(bits) for bits in indice_catalogo.bitsets.values())
+        self.stdout.write(
+            f'\nÍndice: {len(indice_catalogo.ids)} productos, {len(indice_catalogo.bitsets)} bitsets, '
+            f'{memoria / 1024:.0f} KiB, construido en {construccion_ms:.0f} ms'
+        )
+        self.stdout.write(f"\n{'Camino':<8}  {'p50 ms':>8}  {'p95 ms':>8}  {'media ms':>9}")
+        for nombre, tiempos in (('SQL', [t for t, _ in sql]), ('bitmap', [t for t, _ in bitmap])):
+            self.stdout.write(
+                f'{nombre:<8}  {percentil(tiempos, 50):>8.2f}  {percentil(tiempos, 95):>8.2f}  '
+                f'{statistics.mean(tiempos):>9.2f}'
+            )
+        if distintas:
+            raise CommandError(f'{distintas} páginas del índice no coinciden con las de SQL')
+        self.stdout.write(self.style.SUCCESS(f'✅ {len(consultas)} páginas idénticas por los dos caminos'))
+
+    def _consultas(self, total, aleatorio):
+        """Combinaciones de filtros y páginas como las que llegan al catálogo"""
+        categorias = list(Categoria.objects.values_list('id', flat=True))
+        marcas = list(Marca.objects.values_list('id', flat=True))
+        generos = [valor for valor, _ in Producto.GENERO_CHOICES]
+        consultas = []
+        for _ in range(total):
+            parametros = {'page': str(aleatorio.choice([1, 1, 1, 2, 5, 50]))}
+            if aleatorio.random() < 0.6 and categorias:
+                parametros['categoria'] = str(aleatorio.choice(categorias))
+            if aleatorio.random() < 0.3 and marcas:
+                parametros['marca'] = str(aleatorio.choice(marcas))
+            if aleatorio.random() < 0.3:
+                parametros['genero'] = aleatorio.choice(generos)
+            if aleatorio.random() < 0.3:
+                parametros['precio'] = str(aleatorio.randrange(len(BANDAS_PRECIO)))
+            consultas.append(parametros)
+        return consultas
+
+    def _medir(self, pagina, parametros):
+        inicio = time.perf_counter()
+        ids = pagina(parametros)
+        return (time.perf_counter() - inicio) * 1000, ids
+
+    def _pagina_sql(self, parametros):
+        productos, _ = filtrar_catalogo(parametros)
+        # Mismo desempate por id que el índice para poder comparar las páginas
+        paginator = Paginator(productos.order_by('-fecha_creacion', '-id'), POR_PAGINA)
+        return [producto.id for producto in paginator.get_page(parametros['page'])]
+
+    def _pagina_bitmap(self, parametros):
+        resultado = indice_catalogo.filtrar(parametros, Producto.objects.para_tarjeta())
+        return [producto.id for producto in Paginator(resultado, POR_PAGINA).get_page(parametros['page'])]
@@ -0,0 +1,160 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from productos.models import Producto
+
+from .benchmark import DATOS_ENVIO, percentil
+
+FASES = ('wsgi', 'asgi')
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara el rendimiento de checkouts lentos (pasarela con latencia simulada) con las '
+        'vistas síncronas en N hilos (WSGI) y con las asíncronas en un solo bucle (ASGI)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--compras', type=int, default=400, help='Checkouts completos por fase')
+        parser.add_argument('--hilos', type=int, default=8, help='Hilos de la fase WSGI (workers síncronos)')
+        parser.add_argument(
+            '--concurrencia', type=int, default=400,
+            help='Usuarios virtuales simultáneos de la fase ASGI',
+        )
+        parser.add_argument('--latencia', type=float, default=0.3, help='Segundos que tarda la pasarela')
+        parser.add_argument('--productos', type=int, default=500)
+        parser.add_argument('--fase', choices=FASES, help='Uso interno: ejecuta una sola fase')
+
+    def handle(self, *args, **options):
+        if options['fase']:
+            resultado = self._ejecutar_fase(options)
+            self.stdout.write(json.dumps(resultado))
+            return
+
+        with tempfile.TemporaryDirectory(prefix='petjoy_asgi_') as directorio:
+            # Sin Server-Timing para no medir también el log de cada petición
+            entorno = {**os.environ, 'PETJOY_DB': str(Path(directorio) / 'bench.sqlite3'), 'PETJOY_MUESTREO': '0'}
+            self.stdout.write('Preparando la base de datos...')
+            self._manage(entorno, 'migrate', '--verbosity', '0')
+            self._manage(
+                entorno, 'generar_datos', '--productos', str(options['productos']),
+                '--clientes', '50', '--sesiones', '0', '--pedidos', '0',
+            )
+
+            resultados = {}
+            for fase in FASES:
+                self.stdout.write(f'Fase {fase.upper()}...')
+                salida = self._manage(
+                    {**entorno, 'PETJOY_VISTAS_ASYNC': '1' if fase == 'asgi' else '0'},
+                    'comparar_wsgi_asgi', '--fase', fase,
+                    *[f'--{opcion}={options[opcion]}' for opcion in ('compras', 'hilos', 'concurrencia', 'latencia')],
+                )
+                resultados[fase] = json.loads(salida.strip().splitlines()[-1])
+
+        self._informe(resultados, options)
+
+    def _manage(self, entorno, *argumentos):
+        proceso = subprocess.run(
+            [sys.executable, str(Path(settings.BASE_DIR) / 'manage.py'), *argumentos],
+            env=entorno, capture_output=True, text=True,
+        )
+        if proceso.returncode:
+            raise CommandError(f'Falló manage.py {argumentos[0]}:\n{proceso.stderr}')
+        return proceso.stdout
+
+    # Fases (en un subproceso cada una: VISTAS_ASYNC se lee al cargar las URLs)
+
+    def _ejecutar_fase(self, options):
+        if settings.VISTAS_ASYNC != (options['fase'] == 'asgi'):
+            raise CommandError('PETJOY_VISTAS_ASYNC no corresponde con la fase')
+        setup_test_environment()
+        try:
+            with override_settings(
+                PASARELA_PAGO='pedidos.pasarela.PasarelaFalsa',
+                PASARELA_FALSA_LATENCIA=options['latencia'],
+                DETECTOR_CONSULTAS=False,
+                METRICAS=False,
+            ):
+                producto = Producto.objects.filter(esta_disponible=True, stock__gt=0).order_by('id').first()
+                if producto is None:
+                    raise CommandError('No hay productos disponibles')
+                inicio = time.perf_counter()
+                if options['fase'] == 'wsgi':
+                    tiempos = self._fase_wsgi(producto.id, options['compras'], options['hilos'])
+                else:
+                    tiempos = asyncio.run(self._fase_asgi(producto.id, options['compras'], options['concurrencia']))
+                duracion = time.perf_counter() - inicio
+        finally:
+            teardown_test_environment()
+
+        errores = sum(1 for tiempo in tiempos if tiempo is None)
+        validos = [tiempo for tiempo in tiempos if tiempo is not None] or [0]
+        return {
+            'compras': len(tiempos),
+            'errores': errores,
+            'segundos': round(duracion, 2),
+            'compras_s': round(len(tiempos) / duracion, 2),
+            'p50_ms': round(percentil(validos, 50), 1),
+            'p95_ms': round(percentil(validos, 95), 1),
+        }
+
+    @staticmethod
+    def _completada(respuesta):
+        cadena = getattr(respuesta, 'redirect_chain', [])
+        return respuesta.status_code == 200 and bool(cadena) and '/confirmacion/' in cadena[-1][0]
+
+    def _fase_wsgi(self, producto_id, compras, hilos):
+        def compra(_):
+            cliente = Client()
+            inicio = time.perf_counter()
+            cliente.post(f'/pedidos/carrito/agregar/{producto_id}/', {'cantidad': 1})
+            cliente.get('/pedidos/checkout/')
+            respuesta = cliente.post('/pedidos/checkout/', DATOS_ENVIO, follow=True)
+            return (time.perf_counter() - inicio) * 1000 if self._completada(respuesta) else None
+
+        with ThreadPoolExecutor(max_workers=hilos) as ejecutor:
+            return list(ejecutor.map(compra, range(compras)))
+
+    async def _fase_asgi(self, producto_id, compras, concurrencia):
+        limite = asyncio.Semaphore(concurrencia)
+
+        async def compra():
+            async with limite:
+                cliente = AsyncClient()
+                inicio = time.perf_counter()
+                await cliente.post(f'/pedidos/carrito/agregar/{producto_id}/', {'cantidad': 1})
+                await cliente.get('/pedidos/checkout/')
+                respuesta = await cliente.post('/pedidos/checkout/', DATOS_ENVIO, follow=True)
+                return (time.perf_counter() - inicio) * 1000 if self._completada(respuesta) else None
+
+        return await asyncio.gather(*(compra() for _ in range(compras)))
+
+    # Informe
+
+    def _informe(self, resultados, options):
+        self.stdout.write(
+            f"\n{options['compras']} checkouts por fase · pasarela {options['latencia'] * 1000:.0f} ms · "
+            f"WSGI {options['hilos']} hilos · ASGI {options['concurrencia']} usuarios simultáneos"
+        )
+        self.stdout.write(f"\n{'Fase':<6}  {'compras/s':>10}  {'p50 ms':>9}  {'p95 ms':>9}  {'errores':>7}")
+        for fase, datos in resultados.items():
+            self.stdout.write(
+                f"{fase.upper():<6}  {datos['compras_s']:>10.2f}  {datos['p50_ms']:>9.1f}  "
+                f"{datos['p95_ms']:>9.1f}  {datos['errores']:>7}"
+            )
+        if any(datos['errores'] for datos in resultados.values()):
+            raise CommandError('Hubo checkouts que no llegaron a la confirmación')
+        mejora = resultados['asgi']['compras_s'] / resultados['wsgi']['compras_s']
+        self.stdout.write(self.style.SUCCESS(f'\n✅ ASGI procesa {mejora:.1f}× los checkouts por segundo de WSGI'))
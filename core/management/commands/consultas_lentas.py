@@ -0,0 +1,67 @@
+import json
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Recorridos completos de tabla (sin índice) en las tablas grandes
+RECORRIDO_COMPLETO = re.compile(r'\bSCAN (?:TABLE )?(productos_producto|pedidos_pedido)\b(?! USING)')
+
+
+class Command(BaseCommand):
+    help = (
+        'Resume el log de consultas lentas: las peores por tiempo total y las que '
+        'recorren productos_producto o pedidos_pedido completas'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fichero', default=str(settings.CONSULTAS_LENTAS_LOG))
+        parser.add_argument('--top', type=int, default=20, help='Número de consultas a mostrar')
+
+    def handle(self, *args, **options):
+        ruta = Path(options['fichero'])
+        if not ruta.exists():
+            raise CommandError(f'No existe {ruta}')
+
+        consultas, planes = {}, {}
+        with ruta.open(encoding='utf-8') as fichero:
+            for linea in fichero:
+                try:
+                    registro = json.loads(linea)
+                except ValueError:
+                    continue
+                clave = registro['huella']
+                if registro['tipo'] == 'plan':
+                    planes[clave] = registro['plan']
+                    continue
+                datos = consultas.setdefault(clave, {
+                    'sql': registro['sql'], 'veces': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'vistas': set(),
+                })
+                datos['veces'] += 1
+                datos['total_ms'] += registro['ms']
+                datos['max_ms'] = max(datos['max_ms'], registro['ms'])
+                if registro.get('vista'):
+                    datos['vistas'].add(registro['vista'])
+
+        if not consultas:
+            self.stdout.write('No hay consultas lentas registradas')
+            return
+
+        peores = sorted(consultas.items(), key=lambda par: par[1]['total_ms'], reverse=True)[:options['top']]
+        for posicion, (clave, datos) in enumerate(peores, start=1):
+            plan = planes.get(clave, [])
+            recorridos = sorted({m.group(1) for paso in plan for m in RECORRIDO_COMPLETO.finditer(paso)})
+            self.stdout.write(
+                f"\n{posicion}. [{clave}] total {datos['total_ms']:.1f} ms · {datos['veces']} veces · "
+                f"media {datos['total_ms'] / datos['veces']:.1f} ms · máx {datos['max_ms']:.1f} ms"
+            )
+            if datos['vistas']:
+                self.stdout.write(f"   Vistas: {', '.join(sorted(datos['vistas']))}")
+            self.stdout.write(f"   {datos['sql'][:300]}")
+            for paso in plan:
+                self.stdout.write(f'   · {paso}')
+            for tabla in recorridos:
+                self.stdout.write(self.style.WARNING(f'   ⚠ Recorrido completo de {tabla}'))
+
+        self.stdout.write(self.style.SUCCESS(f'\n✅ {len(consultas)} consultas distintas en {ruta}'))
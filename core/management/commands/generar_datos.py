@@ -0,0 +1,377 @@
+import hashlib
+import random
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from itertools import accumulate
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.utils.text import slugify
+
+from clientes.models import Cliente
+from pedidos.informes import actualizar_resumenes
+from pedidos.models import ItemPedido, Pedido
+from productos.bitmap import registrar_cambio
+from productos.facetas import recalcular_facetas
+from productos.models import Categoria, ImagenProducto, Marca, Producto, TallaProducto
+
+TIPOS = ['Pelota', 'Cuerda', 'Ratón', 'Varita', 'Peluche', 'Mordedor', 'Frisbee', 'Túnel',
+         'Rascador', 'Dispensador', 'Lanzador', 'Hueso', 'Puzzle', 'Pluma', 'Disco', 'Aro']
+ADJETIVOS = ['Clásico', 'Resistente', 'Interactivo', 'XXL', 'Mini', 'Luminoso', 'Sonoro',
+             'Flotante', 'Dental', 'Suave', 'Trenzado', 'Elástico']
+COLORES = ['Rojo', 'Azul', 'Verde', 'Amarillo', 'Naranja', 'Gris', 'Rosa', 'Multicolor']
+MATERIALES = ['Caucho natural', 'Algodón', 'Plástico', 'Peluche', 'Nylon', 'Goma', 'Sisal']
+CATEGORIAS = ['Juguetes para Perros', 'Juguetes para Gatos', 'Juguetes Interactivos',
+              'Peluches y Mordedores', 'Accesorios de Juego', 'Juguetes para Roedores']
+MARCAS = ['Kong', 'Trixie', 'Ferplast', 'Catit', 'Chuckit', 'Petstages', 'Nylabone', 'Outward']
+NOMBRES = ['Lucía', 'Hugo', 'Martina', 'Mateo', 'Sofía', 'Leo', 'Julia', 'Daniel', 'Paula', 'Álvaro']
+APELLIDOS = ['García', 'Martínez', 'López', 'Sánchez', 'Pérez', 'Gómez', 'Martín', 'Jiménez', 'Ruiz']
+CIUDADES = ['Madrid', 'Barcelona', 'Sevilla', 'Valencia', 'Bilbao', 'Málaga', 'Zaragoza', 'Murcia']
+TALLAS = ['S', 'M', 'L', 'XL']
+
+# Estacionalidad de los pedidos: pico en Navidad y rebajas, valle en verano
+PESO_MES = {1: 1.3, 2: 0.8, 3: 0.9, 4: 0.9, 5: 1.0, 6: 0.8, 7: 0.9, 8: 0.6, 9: 0.9, 10: 1.0, 11: 1.6, 12: 2.2}
+PESO_DIA_SEMANA = [1.0, 0.95, 0.95, 1.0, 1.1, 1.2, 1.25]
+PESO_HORA = [0.2, 0.1, 0.05, 0.05, 0.05, 0.1, 0.3, 0.6, 0.9, 1.1, 1.2, 1.3,
+             1.4, 1.3, 1.1, 1.1, 1.2, 1.4, 1.6, 1.8, 1.9, 1.7, 1.2, 0.6]
+
+IMAGEN_GENERADA = 'productos/generado.png'
+IVA = Decimal('0.21')
+CENTIMO = Decimal('0.01')
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera de forma determinista un conjunto de datos grande y realista '
+        '(catálogo, clientes, carritos en sesión y pedidos históricos) para pruebas de carga. '
+        'Con la misma semilla y la misma --fecha el resultado es idéntico; si la BD ya tiene '
+        'datos, los nuevos se añaden a continuación'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categorias', type=int, default=20)
+        parser.add_argument('--marcas', type=int, default=50)
+        parser.add_argument('--productos', type=int, default=2000)
+        parser.add_argument('--clientes', type=int, default=5000)
+        parser.add_argument('--sesiones', type=int, default=2000, help='Sesiones anónimas con carrito')
+        parser.add_argument('--pedidos', type=int, default=20000)
+        parser.add_argument('--anios', type=int, default=3, help='Años de histórico de pedidos')
+        parser.add_argument('--zipf', type=float, default=1.1, help='Exponente de popularidad de productos')
+        parser.add_argument('--semilla', type=int, default=42)
+        parser.add_argument(
+            '--fecha', help='Día (AAAA-MM-DD) en que termina el histórico; por defecto, hoy',
+        )
+        parser.add_argument('--lote', type=int, default=10000, help='Filas por inserción')
+
+    def handle(self, *args, **options):
+        self.semilla = options['semilla']
+        self.rng = random.Random(self.semilla)
+        self.lote = options['lote']
+        # El histórico acaba al empezar el día de referencia, no en el instante actual,
+        # para que dos ejecuciones del mismo día (o con la misma --fecha) coincidan
+        try:
+            fecha = parse_date(options['fecha']) if options['fecha'] else timezone.localdate()
+        except ValueError:
+            fecha = None
+        if fecha is None:
+            raise CommandError(f"Fecha no válida: {options['fecha']}")
+        self.ahora = timezone.make_aware(datetime.combine(fecha, datetime.min.time()))
+        self.inicio_historico = self.ahora - timedelta(days=365 * options['anios'])
+        inicio = time.perf_counter()
+
+        with transaction.atomic():
+            categorias = self._generar_categorias(options['categorias'])
+            marcas = self._generar_marcas(options['marcas'])
+            productos = self._generar_productos(options['productos'], categorias, marcas)
+            # Las inserciones directas no lanzan las señales que mantienen las facetas
+            # ni el registro de cambios del índice del catálogo
+            recalcular_facetas()
+            registrar_cambio(None)
+
+        if not productos:
+            self.stdout.write(self.style.WARNING('Sin productos no se pueden generar carritos ni pedidos'))
+            return
+
+        # Popularidad Zipf: el producto de rango r se elige con peso 1 / r^s
+        ranking = [producto[0] for producto in productos]
+        self.rng.shuffle(ranking)
+        pesos = accumulate(1 / (rango ** options['zipf']) for rango in range(1, len(ranking) + 1))
+        self.popularidad = (ranking, list(pesos))
+        self.precios = {producto[0]: producto[1] for producto in productos}
+        self.nombres_producto = {producto[0]: producto[2] for producto in productos}
+        self.primer_producto = productos[0][0]  # distinto en cada ejecución sobre la misma BD
+
+        with transaction.atomic():
+            clientes = self._generar_clientes(options['clientes'])
+        with transaction.atomic():
+            self._generar_sesiones(options['sesiones'])
+        self._generar_pedidos(options['pedidos'], clientes)
+
+        segundos = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(f'✅ Datos generados en {segundos:.1f}s'))
+
+    # Utilidades
+
+    def _siguiente_id(self, modelo):
+        return (modelo.objects.aggregate(maximo=Max('pk'))['maximo'] or 0) + 1
+
+    def _insertar(self, modelo, campos, filas):
+        """
+        Inserta tuplas ya preparadas con executemany.
+
+        Evita la compilación por objeto de bulk_create, que con millones de
+        filas es el cuello de botella; los valores deben venir ya en el tipo
+        que espera SQLite (texto para fechas y decimales, enteros para booleanos).
+        """
+        opts = modelo._meta
+        columnas = ', '.join(connection.ops.quote_name(opts.get_field(campo).column) for campo in campos)
+        marcadores = ', '.join(['%s'] * len(campos))
+        sql = f'INSERT INTO {connection.ops.quote_name(opts.db_table)} ({columnas}) VALUES ({marcadores})'
+        total = 0
+        with connection.cursor() as cursor:
+            bloque = []
+            for fila in filas:
+                bloque.append(fila)
+                if len(bloque) >= self.lote:
+                    cursor.executemany(sql, bloque)
+                    total += len(bloque)
+                    bloque = []
+            if bloque:
+                cursor.executemany(sql, bloque)
+                total += len(bloque)
+        return total
+
+    def _fecha(self, valor):
+        return connection.ops.adapt_datetimefield_value(valor)
+
+    def _decimal(self, valor):
+        return str(valor.quantize(CENTIMO))
+
+    def _progreso(self, texto, cantidad, inicio):
+        segundos = time.perf_counter() - inicio
+        velocidad = cantidad / segundos if segundos else cantidad
+        self.stdout.write(f'  {texto}: {cantidad} filas ({velocidad:.0f} filas/s)')
+
+    def _producto_popular(self, k=1):
+        ranking, pesos = self.popularidad
+        return self.rng.choices(ranking, cum_weights=pesos, k=k)
+
+    # Catálogo
+
+    def _generar_categorias(self, cantidad):
+        inicio_id = self._siguiente_id(Categoria)
+        creado = self._fecha(self.inicio_historico)
+        filas = [
+            (id_, f'{CATEGORIAS[n % len(CATEGORIAS)]} {id_}', 'Categoría generada', creado)
+            for n, id_ in enumerate(range(inicio_id, inicio_id + cantidad))
+        ]
+        self._insertar(Categoria, ['id', 'nombre', 'descripcion', 'fecha_actualizacion'], filas)
+        return [fila[0] for fila in filas]
+
+    def _generar_marcas(self, cantidad):
+        inicio_id = self._siguiente_id(Marca)
+        creado = self._fecha(self.inicio_historico)
+        filas = [
+            (id_, f'{MARCAS[n % len(MARCAS)]} {id_}', creado)
+            for n, id_ in enumerate(range(inicio_id, inicio_id + cantidad))
+        ]
+        self._insertar(Marca, ['id', 'nombre', 'fecha_actualizacion'], filas)
+        return [fila[0] for fila in filas]
+
+    def _generar_productos(self, cantidad, categorias, marcas):
+        rng = self.rng
+        inicio = time.perf_counter()
+        inicio_id = self._siguiente_id(Producto)
+        imagen_id = self._siguiente_id(ImagenProducto)
+        self._asegurar_imagen()
+
+        # Altas repartidas por el histórico, en orden creciente de id
+        paso = (self.ahora - self.inicio_historico) / max(cantidad, 1)
+        generos = [clave for clave, _ in Producto.GENERO_CHOICES] + ['']
+        productos, imagenes, tallas = [], [], []
+
+        for n in range(cantidad):
+            id_ = inicio_id + n
+            nombre = f'{rng.choice(TIPOS)} {rng.choice(ADJETIVOS)} {rng.choice(COLORES)} {id_}'
+            precio = Decimal(min(max(rng.lognormvariate(2.5, 0.6), 1.99), 199.99)).quantize(CENTIMO)
+            oferta = (precio * Decimal(rng.uniform(0.6, 0.9))).quantize(CENTIMO) if rng.random() < 0.2 else None
+            creado = self._fecha(self.inicio_historico + paso * n)
+            productos.append((
+                id_, nombre, f'Juguete generado para pruebas de carga. {nombre}.', str(precio),
+                str(oferta) if oferta else None, rng.choice(marcas) if marcas else None,
+                rng.choice(categorias) if categorias else None,
+                rng.choices(generos, weights=[1, 1, 6, 1, 1])[0], rng.choice(COLORES),
+                rng.choice(MATERIALES), 0 if rng.random() < 0.05 else rng.randint(1, 200),
+                int(rng.random() < 0.95), int(rng.random() < 0.02), slugify(nombre), creado, creado,
+            ))
+            for orden in range(rng.choice([1, 1, 2, 3])):
+                imagenes.append((imagen_id, id_, IMAGEN_GENERADA, int(orden == 0)))
+                imagen_id += 1
+            if rng.random() < 0.3:
+                tallas.extend((id_, talla, rng.randint(0, 50)) for talla in TALLAS)
+
+        self._insertar(Producto, [
+            'id', 'nombre', 'descripcion', 'precio', 'precio_oferta', 'marca', 'categoria', 'genero',
+            'color', 'material', 'stock', 'esta_disponible', 'es_destacado', 'slug',
+            'fecha_creacion', 'fecha_actualizacion',
+        ], productos)
+        self._insertar(ImagenProducto, ['id', 'producto', 'imagen', 'es_principal'], imagenes)
+        self._insertar(TallaProducto, ['producto', 'talla', 'stock'], tallas)
+        self._progreso('Productos, imágenes y tallas', len(productos) + len(imagenes) + len(tallas), inicio)
+        return [(fila[0], Decimal(fila[4] or fila[3]), fila[1]) for fila in productos]
+
+    def _asegurar_imagen(self):
+        """Crea una única imagen de muestra compartida por todos los productos generados"""
+        ruta = Path(settings.MEDIA_ROOT) / IMAGEN_GENERADA
+        if not ruta.exists():
+            from PIL import Image
+            ruta.parent.mkdir(parents=True, exist_ok=True)
+            Image.new('RGB', (400, 400), (98, 0, 238)).save(ruta)
+
+    # Clientes y carritos
+
+    def _generar_clientes(self, cantidad):
+        rng = self.rng
+        inicio = time.perf_counter()
+        inicio_id = self._siguiente_id(Cliente)
+        # Un único hash para todos: calcular PBKDF2 por cliente llevaría horas
+        password = make_password('petjoy-generado', salt=f'petjoy{self.semilla}')
+        filas = []
+        for n in range(cantidad):
+            id_ = inicio_id + n
+            email = f'cliente{id_}@ejemplo.com'
+            alta = self.inicio_historico + timedelta(seconds=rng.uniform(0, (self.ahora - self.inicio_historico).total_seconds()))
+            filas.append((
+                id_, password, email, rng.choice(NOMBRES), rng.choice(APELLIDOS), email,
+                0, 1, 0, self._fecha(alta), f'6{rng.randint(10000000, 99999999)}',
+                f'Calle Generada {rng.randint(1, 200)}', rng.choice(CIUDADES), f'{rng.randint(1000, 52999):05d}',
+            ))
+        self._insertar(Cliente, [
+            'id', 'password', 'username', 'first_name', 'last_name', 'email', 'is_superuser',
+            'is_active', 'is_staff', 'date_joined', 'telefono', 'direccion', 'ciudad', 'codigo_postal',
+        ], filas)
+        self._progreso('Clientes', len(filas), inicio)
+        return [(fila[0], fila[3], fila[4], fila[5], fila[10], fila[11], fila[12], fila[13]) for fila in filas]
+
+    def _carrito(self):
+        carrito = {}
+        for producto_id in self._producto_popular(self.rng.randint(1, 4)):
+            clave = str(producto_id)
+            item = carrito.setdefault(clave, {
+                'producto_id': clave, 'cantidad': 0, 'precio': str(self.precios[producto_id]), 'talla': '',
+            })
+            item['cantidad'] += self.rng.randint(1, 3)
+        return carrito
+
+    def _generar_sesiones(self, cantidad):
+        rng = self.rng
+        inicio = time.perf_counter()
+        store = SessionStore()
+        edad = settings.SESSION_COOKIE_AGE
+        filas = []
+        for n in range(cantidad):
+            # Del azar saldría la misma clave al repetir la semilla: se deriva de la ejecución
+            clave = hashlib.sha256(f'{self.semilla}:{self.primer_producto}:{n}'.encode()).hexdigest()[:32]
+            # Mezcla de sesiones vigentes y caducadas (carritos abandonados)
+            expira = self.ahora + timedelta(seconds=rng.uniform(-7 * edad, edad))
+            filas.append((clave, store.encode({'carrito': self._carrito()}), self._fecha(expira)))
+        self._insertar(Session, ['session_key', 'session_data', 'expire_date'], filas)
+        self._progreso('Sesiones con carrito', len(filas), inicio)
+
+    # Pedidos
+
+    def _dias_ponderados(self):
+        dias, pesos = [], []
+        total = (self.ahora.date() - self.inicio_historico.date()).days
+        for n in range(total):
+            dia = self.inicio_historico.date() + timedelta(days=n)
+            crecimiento = 0.5 + n / total  # el negocio crece con el tiempo
+            dias.append(dia)
+            pesos.append(PESO_MES[dia.month] * PESO_DIA_SEMANA[dia.weekday()] * crecimiento)
+        return dias, list(accumulate(pesos))
+
+    def _generar_pedidos(self, cantidad, clientes):
+        rng = self.rng
+        inicio = time.perf_counter()
+        dias, pesos_dia = self._dias_ponderados()
+        pesos_hora = list(accumulate(PESO_HORA))
+        # Los días se sortean primero y se ordenan para que los ids crezcan con la fecha
+        indices = sorted(rng.choices(range(len(dias)), cum_weights=pesos_dia, k=cantidad))
+        zona = timezone.get_current_timezone()
+        metodos = [clave for clave, _ in Pedido.METODO_PAGO_CHOICES]
+
+        pedido_id = self._siguiente_id(Pedido)
+        item_id = self._siguiente_id(ItemPedido)
+        campos_pedido = [
+            'id', 'numero_pedido', 'cliente', 'nombre_cliente', 'apellidos_cliente', 'email_cliente',
+            'telefono_cliente', 'direccion_envio', 'ciudad_envio', 'codigo_postal_envio', 'fecha_creacion',
+            'estado', 'subtotal', 'impuestos', 'coste_entrega', 'descuento', 'total', 'metodo_pago', 'notas',
+            'resumido',
+        ]
+        campos_item = ['id', 'pedido', 'producto', 'nombre_producto', 'talla', 'cantidad', 'precio_unitario', 'total']
+        n_pedidos = n_items = 0
+
+        for desde in range(0, cantidad, self.lote):
+            pedidos, items = [], []
+            for indice in indices[desde:desde + self.lote]:
+                hora = rng.choices(range(24), cum_weights=pesos_hora)[0]
+                fecha = datetime.combine(dias[indice], datetime.min.time()) + timedelta(hours=hora, seconds=rng.randint(0, 3599))
+                fecha = timezone.make_aware(fecha, zona)
+                if fecha > self.ahora:
+                    fecha = self.ahora
+
+                subtotal = Decimal('0.00')
+                for producto_id in self._producto_popular(min(1 + int(rng.expovariate(0.9)), 8)):
+                    cantidad_item = rng.choices([1, 2, 3, 4], weights=[70, 20, 7, 3])[0]
+                    precio = self.precios[producto_id]
+                    total_item = precio * cantidad_item
+                    subtotal += total_item
+                    items.append((item_id, pedido_id, producto_id, self.nombres_producto[producto_id], '',
+                                  cantidad_item, str(precio), str(total_item)))
+                    item_id += 1
+
+                impuestos = (subtotal * IVA).quantize(CENTIMO)
+                envio = Decimal('0.00') if subtotal >= 50 else Decimal('5.00')
+                antiguedad = (self.ahora - fecha).days
+                if antiguedad > 14:
+                    estado = rng.choices(['entregado', 'cancelado'], weights=[95, 5])[0]
+                else:
+                    estado = rng.choice(['pendiente', 'procesando', 'enviado', 'entregado'])
+                cliente = rng.choice(clientes) if clientes and rng.random() < 0.6 else None
+                if cliente:
+                    cliente_id, nombre, apellidos, email, telefono, direccion, ciudad, cp = cliente
+                else:
+                    cliente_id, nombre, apellidos = None, rng.choice(NOMBRES), rng.choice(APELLIDOS)
+                    email, telefono = f'invitado{pedido_id}@ejemplo.com', f'6{rng.randint(10000000, 99999999)}'
+                    direccion, ciudad = f'Calle Generada {rng.randint(1, 200)}', rng.choice(CIUDADES)
+                    cp = f'{rng.randint(1000, 52999):05d}'
+
+                pedidos.append((
+                    pedido_id, f'G{pedido_id:011d}', cliente_id, nombre, apellidos, email, telefono,
+                    direccion, ciudad, cp, self._fecha(fecha), estado, self._decimal(subtotal),
+                    self._decimal(impuestos), self._decimal(envio), '0.00',
+                    self._decimal(subtotal + impuestos + envio),
+                    rng.choices(metodos, weights=[15, 75, 10])[0], '', 0,
+                ))
+                pedido_id += 1
+
+            with transaction.atomic():
+                n_pedidos += self._insertar(Pedido, campos_pedido, pedidos)
+                n_items += self._insertar(ItemPedido, campos_item, items)
+
+        self._progreso('Pedidos', n_pedidos, inicio)
+        self._progreso('Líneas de pedido', n_items, inicio)
+
+        # Los pedidos se reparten por el histórico, también por detrás de los ya
+        # resumidos si la BD tenía datos: se incorporan ya a los informes de ventas
+        inicio = time.perf_counter()
+        self._progreso('Pedidos resumidos', actualizar_resumenes(retraso=timedelta(0)), inicio)
@@ -0,0 +1,50 @@
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core.routers import ALIAS_REPLICA, hay_replica
+
+
+class Command(BaseCommand):
+    help = (
+        'Copia la base de datos primaria sobre la réplica de solo lectura con la API de '
+        'backup de SQLite (una vez, o en bucle con --intervalo)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--intervalo', type=float, default=0,
+            help='Segundos entre copias; 0 copia una sola vez',
+        )
+        parser.add_argument(
+            '--paginas', type=int, default=1024,
+            help='Páginas copiadas por paso (entre pasos la primaria puede seguir escribiendo)',
+        )
+
+    def handle(self, *args, **options):
+        if not hay_replica():
+            raise CommandError("No hay alias 'replica' en DATABASES (define PETJOY_DB_REPLICA)")
+        primaria = connections[DEFAULT_DB_ALIAS]
+        if primaria.vendor != 'sqlite' or connections[ALIAS_REPLICA].vendor != 'sqlite':
+            raise CommandError('sincronizar_replica solo sabe copiar bases de datos SQLite')
+
+        while True:
+            inicio = time.perf_counter()
+            self.sincronizar(primaria, connections[ALIAS_REPLICA].settings_dict['NAME'], options['paginas'])
+            self.stdout.write(self.style.SUCCESS(
+                f'✅ Réplica sincronizada en {(time.perf_counter() - inicio) * 1000:.0f} ms'
+            ))
+            if not options['intervalo']:
+                break
+            time.sleep(options['intervalo'])
+
+    def sincronizar(self, primaria, ruta_replica, paginas):
+        primaria.ensure_connection()
+        destino = sqlite3.connect(str(ruta_replica))
+        try:
+            # La copia es consistente: si la primaria cambia a mitad, backup() vuelve a empezar
+            primaria.connection.backup(destino, pages=paginas)
+        finally:
+            destino.close()
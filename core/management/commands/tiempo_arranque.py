@@ -0,0 +1,45 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.arranque import diferidos_cargados, medir_arranque
+
+
+class Command(BaseCommand):
+    help = (
+        'Desglosa con `python -X importtime` lo que cuesta arrancar un worker '
+        '(django.setup() y carga de las URLs) por módulo y por paquete'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=25, help='Número de módulos a mostrar')
+        parser.add_argument(
+            '--propio', action='store_true',
+            help='Ordena por tiempo propio del módulo en lugar de por acumulado',
+        )
+
+    def handle(self, *args, **options):
+        resultado = medir_arranque(importtime=True)
+        imports = resultado['imports']
+        if not imports:
+            raise CommandError('El intérprete no devolvió datos de -X importtime')
+
+        columna = 1 if options['propio'] else 2
+        self.stdout.write(f"\n{'Módulo':<50}  {'propio ms':>9}  {'acumulado ms':>12}")
+        for modulo, propio, acumulado, nivel in sorted(imports, key=lambda i: i[columna], reverse=True)[:options['top']]:
+            self.stdout.write(f"{('  ' * nivel + modulo)[:50]:<50}  {propio:>9.1f}  {acumulado:>12.1f}")
+
+        # Por paquete raíz, sumando el tiempo propio de todos sus módulos
+        paquetes = defaultdict(float)
+        for modulo, propio, _, _ in imports:
+            paquetes[modulo.split('.')[0]] += propio
+        self.stdout.write(f"\n{'Paquete':<30}  {'ms':>8}")
+        for paquete, total in sorted(paquetes.items(), key=lambda par: par[1], reverse=True)[:options['top']]:
+            self.stdout.write(f'{paquete:<30}  {total:>8.1f}')
+
+        # Con -X importtime el intérprete va algo más lento: el total es orientativo
+        self.stdout.write(f"\nArranque: {resultado['ms']:.0f} ms · {len(imports)} módulos importados")
+        cargados = diferidos_cargados(resultado['modulos'])
+        if cargados:
+            raise CommandError(f"Se importan al arrancar módulos que deberían ser diferidos: {', '.join(cargados)}")
+        self.stdout.write(self.style.SUCCESS('✅ Los imports diferidos no se cargan al arrancar'))
@@ -0,0 +1,313 @@
+"""
+Métricas de la aplicación en formato de exposición de Prometheus.
+
+Cada hilo acumula sus valores en su propio diccionario, así que registrar una
+métrica no toma ningún lock; al exponerlas se suman los diccionarios de todos
+los hilos del proceso.
+
+Con varios workers (gunicorn) se define METRICAS_DIRECTORIO: cada proceso
+vuelca periódicamente su instantánea en un fichero propio del directorio y
+/metrics suma todos los ficheros. Los ficheros de procesos ya terminados se
+siguen sumando para que los contadores no retrocedan. Cada fichero lleva el
+pid del proceso padre (el master de gunicorn, común a sus workers): el primer
+volcado de un proceso borra los de arranques anteriores del servidor, así que
+el directorio no debe compartirse entre servidores distintos.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import wraps
+from importlib import import_module
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger('petjoy.metricas')
+
+_almacenes = []
+_lock_registro = threading.Lock()
+_metricas = {}
+
+# Contador de consultas SQL de la petición en curso (lista de un elemento, mutable)
+_consultas_peticion = ContextVar('consultas_peticion', default=None)
+
+
+class _Almacen(threading.local):
+    def __init__(self):
+        self.valores = {}
+        with _lock_registro:
+            _almacenes.append(self.valores)
+
+
+_local = _Almacen()
+
+
+class Metrica:
+    tipo = None
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        _metricas[nombre] = self
+
+
+class Contador(Metrica):
+    tipo = 'counter'
+
+    def inc(self, *etiquetas, cantidad=1):
+        valores = _local.valores
+        clave = (self.nombre, etiquetas)
+        valores[clave] = valores.get(clave, 0) + cantidad
+
+
+class Histograma(Metrica):
+    tipo = 'histogram'
+
+    def __init__(self, nombre, ayuda, etiquetas=(), cubos=()):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.cubos = tuple(cubos)
+
+    def observar(self, valor, *etiquetas):
+        valores = _local.valores
+        clave = (self.nombre, etiquetas)
+        fila = valores.get(clave)
+        if fila is None:
+            # Un contador por cubo (no acumulado), +Inf, suma y número de observaciones
+            fila = valores[clave] = [0] * (len(self.cubos) + 3)
+        fila[bisect_left(self.cubos, valor)] += 1
+        fila[-2] += valor
+        fila[-1] += 1
+
+
+class Indicador(Metrica):
+    """
+    Valor que se lee al exponer las métricas (p. ej. de la base de datos) en
+    lugar de acumularse por hilo. `leer` devuelve {etiquetas: valor}.
+    """
+    tipo = 'gauge'
+
+    def __init__(self, nombre, ayuda, etiquetas=(), leer=None):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.leer = leer
+
+    def valores(self):
+        try:
+            return list(self.leer().items())
+        except Exception:
+            # Sin BD, /metrics sigue respondiendo con el resto de métricas
+            return []
+
+
+CUBOS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+PETICIONES = Contador('petjoy_peticiones_total', 'Peticiones atendidas', ('vista', 'metodo', 'estado'))
+LATENCIA = Histograma(
+    'petjoy_peticion_segundos', 'Latencia de las peticiones por vista', ('vista', 'metodo'), CUBOS_LATENCIA,
+)
+CONSULTAS = Histograma(
+    'petjoy_consultas_sql_por_peticion', 'Consultas SQL ejecutadas por petición', ('vista',),
+    (1, 2, 5, 10, 20, 50, 100),
+)
+LECTURAS_CACHE = Contador('petjoy_cache_lecturas_total', 'Lecturas de caché', ('cache', 'resultado'))
+EVENTOS_CACHE = Contador(
+    'petjoy_cache_eventos_total',
+    'Caché de dos niveles (core.cache), todas sus claves: aciertos por nivel, fallos, obsoletos, esperas, '
+    'recálculos y desalojos',
+    ('alias', 'evento'),
+)
+ESCRITURAS_SESION = Contador('petjoy_sesion_escrituras_total', 'Sesiones guardadas en su backend')
+CHECKOUT = Contador(
+    'petjoy_checkout_total', 'Embudo de compra: checkout, sesion_pago, pagado, pedido', ('paso',),
+)
+
+
+# Agregación y exposición
+
+def instantanea():
+    """Suma de los valores de todos los hilos de este proceso"""
+    total = {}
+    with _lock_registro:
+        almacenes = list(_almacenes)
+    for valores in almacenes:
+        _sumar(total, valores.copy().items())
+    return total
+
+
+def _sumar(total, elementos):
+    for clave, valor in elementos:
+        if isinstance(valor, list):
+            acumulado = total.get(clave)
+            total[clave] = list(valor) if acumulado is None else [a + b for a, b in zip(acumulado, valor)]
+        else:
+            total[clave] = total.get(clave, 0) + valor
+
+
+def _directorio():
+    return getattr(settings, 'METRICAS_DIRECTORIO', None)
+
+
+_fichero_proceso = None
+_ultimo_volcado = 0.0
+
+
+def volcar():
+    """Escribe la instantánea de este proceso en METRICAS_DIRECTORIO (de forma atómica)"""
+    global _fichero_proceso, _ultimo_volcado
+    directorio = _directorio()
+    if not directorio:
+        return
+    if _fichero_proceso is None or not _fichero_proceso.name.startswith(f'{os.getppid()}-{os.getpid()}-'):
+        directorio = Path(directorio)
+        directorio.mkdir(parents=True, exist_ok=True)
+        _limpiar(directorio)
+        # pid + instante de arranque, para que un pid reutilizado no pise al de un worker muerto
+        _fichero_proceso = directorio / f'{os.getppid()}-{os.getpid()}-{time.time_ns()}.json'
+    filas = [[nombre, list(etiquetas), valor] for (nombre, etiquetas), valor in instantanea().items()]
+    temporal = _fichero_proceso.with_suffix('.tmp')
+    temporal.write_text(json.dumps(filas), encoding='utf-8')
+    os.replace(temporal, _fichero_proceso)
+    _ultimo_volcado = time.monotonic()
+
+
+def _limpiar(directorio):
+    """Borra los ficheros de arranques anteriores (los de otro proceso padre)"""
+    prefijo = f'{os.getppid()}-'
+    for fichero in directorio.iterdir():
+        if fichero.suffix in ('.json', '.tmp') and not fichero.name.startswith(prefijo):
+            fichero.unlink(missing_ok=True)
+
+
+def volcar_si_toca():
+    """Volcado periódico desde el middleware; un fallo de disco no tumba la petición"""
+    global _ultimo_volcado
+    if _directorio() and time.monotonic() - _ultimo_volcado >= getattr(settings, 'METRICAS_INTERVALO_VOLCADO', 5):
+        try:
+            volcar()
+        except OSError:
+            logger.exception('No se pudieron volcar las métricas en %s', _directorio())
+            _ultimo_volcado = time.monotonic()  # se reintenta en el siguiente intervalo
+
+
+def agregado():
+    """Valores de todos los workers (o solo de este proceso sin METRICAS_DIRECTORIO)"""
+    directorio = _directorio()
+    if not directorio:
+        return instantanea()
+    volcar()
+    total = {}
+    for fichero in Path(directorio).glob('*.json'):
+        try:
+            filas = json.loads(fichero.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            continue
+        _sumar(total, (((nombre, tuple(etiquetas)), valor) for nombre, etiquetas, valor in filas))
+    return total
+
+
+def _etiquetas(nombres, valores, extra=None):
+    pares = [f'{nombre}="{_escapar(valor)}"' for nombre, valor in zip(nombres, valores)]
+    if extra:
+        pares.append(extra)
+    return '{' + ','.join(pares) + '}' if pares else ''
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def exponer(valores=None):
+    """Texto en formato de exposición de Prometheus (versión 0.0.4)"""
+    valores = agregado() if valores is None else valores
+    por_metrica = {}
+    for (nombre, etiquetas), valor in valores.items():
+        por_metrica.setdefault(nombre, []).append((etiquetas, valor))
+
+    lineas = []
+    for nombre, metrica in _metricas.items():
+        lineas.append(f'# HELP {nombre} {metrica.ayuda}')
+        lineas.append(f'# TYPE {nombre} {metrica.tipo}')
+        filas = metrica.valores() if metrica.tipo == 'gauge' else por_metrica.get(nombre, [])
+        for etiquetas, valor in sorted(filas, key=lambda fila: [str(e) for e in fila[0]]):
+            if metrica.tipo == 'histogram':
+                acumulado = 0
+                for limite, cuenta in zip(metrica.cubos + ('+Inf',), valor):
+                    acumulado += cuenta
+                    le = f'le="{limite}"'
+                    lineas.append(f'{nombre}_bucket{_etiquetas(metrica.etiquetas, etiquetas, le)} {acumulado}')
+                lineas.append(f'{nombre}_sum{_etiquetas(metrica.etiquetas, etiquetas)} {valor[-2]}')
+                lineas.append(f'{nombre}_count{_etiquetas(metrica.etiquetas, etiquetas)} {valor[-1]}')
+            else:
+                lineas.append(f'{nombre}{_etiquetas(metrica.etiquetas, etiquetas)} {valor}')
+    return '\n'.join(lineas) + '\n'
+
+
+# Ganchos: consultas SQL, lecturas de caché y escrituras de sesión
+
+def _contar_sql(execute, sql, params, many, context):
+    contador = _consultas_peticion.get()
+    if contador is not None:
+        contador[0] += 1
+    return execute(sql, params, many, context)
+
+
+def _conexion_creada(sender, connection, **kwargs):
+    if _contar_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_contar_sql)
+
+
+def _contar_lecturas(cache, alias):
+    get = cache.get
+    centinela = object()
+
+    @wraps(get)
+    def envoltorio(key, default=None, version=None):
+        valor = get(key, centinela, version)
+        if valor is centinela:
+            LECTURAS_CACHE.inc(alias, 'fallo')
+            return default
+        LECTURAS_CACHE.inc(alias, 'acierto')
+        return valor
+    cache.get = envoltorio
+    return cache
+
+
+def _contar_escrituras(save):
+    @wraps(save)
+    def envoltorio(self, *args, **kwargs):
+        ESCRITURAS_SESION.inc()
+        return save(self, *args, **kwargs)
+    envoltorio.metricas = True
+    return envoltorio
+
+
+def instalar():
+    """Engancha los contadores a SQL, cachés y sesiones (una sola vez)"""
+    from django.core.cache import CacheHandler, caches
+    from django.db import connections
+    from django.db.backends.signals import connection_created
+
+    connection_created.connect(_conexion_creada, dispatch_uid='metricas_sql')
+    for conexion in connections.all(initialized_only=True):
+        _conexion_creada(None, conexion)
+
+    # Las instancias de caché son por hilo: se envuelven al crearlas, con su alias
+    crear = CacheHandler.create_connection
+    if not getattr(crear, 'metricas', False):
+        @wraps(crear)
+        def create_connection(self, alias):
+            return _contar_lecturas(crear(self, alias), alias)
+        create_connection.metricas = True
+        CacheHandler.create_connection = create_connection
+        for cache_alias in caches.settings:
+            caches[cache_alias].__dict__.pop('get', None)
+            _contar_lecturas(caches[cache_alias], cache_alias)
+
+    sesiones = import_module(settings.SESSION_ENGINE).SessionStore
+    if not getattr(sesiones.save, 'metricas', False):
+        sesiones.save = _contar_escrituras(sesiones.save)
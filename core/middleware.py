@@ -0,0 +1,260 @@
+import json
+import logging
+import random
+import time
+from contextlib import contextmanager, nullcontext
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from . import instrumentacion, metricas, routers
+from .estaticos import ServidorEstaticos
+from .consultas import PresupuestoConsultasExcedido, RegistroConsultas, vista_actual
+
+logger = logging.getLogger('petjoy.consultas')
+logger_rendimiento = logging.getLogger('petjoy.rendimiento')
+
+
+class MiddlewarePetJoy:
+    """
+    Base de los middleware propios, válidos con WSGI y con ASGI.
+
+    Cada middleware define antes() (puede devolver ya la respuesta),
+    envolver() (contexto alrededor del resto de la cadena) y despues(); la
+    base se encarga de llamar a get_response de forma síncrona o asíncrona
+    para no obligar a Django a cambiar de modo en medio de la cadena.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.asincrono = iscoroutinefunction(get_response)
+        if self.asincrono:
+            markcoroutinefunction(self)
+
+    def antes(self, request):
+        return None
+
+    def envolver(self, request):
+        return nullcontext()
+
+    def despues(self, request, response, estado):
+        return response
+
+    def __call__(self, request):
+        if self.asincrono:
+            return self.__acall__(request)
+        response = self.antes(request)
+        if response is not None:
+            return response
+        with self.envolver(request) as estado:
+            response = self.get_response(request)
+        return self.despues(request, response, estado)
+
+    async def __acall__(self, request):
+        response = self.antes(request)
+        if response is not None:
+            return response
+        with self.envolver(request) as estado:
+            response = await self.get_response(request)
+        return self.despues(request, response, estado)
+
+
+class DetectorConsultasMiddleware(MiddlewarePetJoy):
+    """
+    Registra las consultas SQL de cada petición (activo con DETECTOR_CONSULTAS).
+
+    Avisa de los patrones N+1 y de las vistas que superan el presupuesto
+    declarado con @presupuesto_consultas; con CONSULTAS_ESTRICTO el exceso de
+    presupuesto lanza una excepción, que es lo que se usa en los tests.
+    """
+
+    def envolver(self, request):
+        if not getattr(settings, 'DETECTOR_CONSULTAS', False):
+            return nullcontext()
+        return RegistroConsultas().activo()
+
+    def despues(self, request, response, registro):
+        if registro is None:
+            return response
+
+        vista = getattr(request, 'resolver_match', None)
+        nombre_vista = vista.view_name if vista else request.path
+        repetidas = registro.repetidas(getattr(settings, 'N_MAS_1_UMBRAL', 3))
+        for patron in repetidas:
+            logger.warning(
+                'Posible N+1 en %s: %d veces %s desde %s',
+                nombre_vista, patron['veces'], patron['sql'], ' <- '.join(patron['llamada']),
+            )
+
+        presupuesto = getattr(request, 'presupuesto_consultas', None)
+        response['X-Consultas-SQL'] = str(registro.total)
+        response.informe_consultas = {
+            'vista': nombre_vista,
+            'total': registro.total,
+            'presupuesto': presupuesto,
+            'n_mas_1': repetidas,
+            'consultas': registro.consultas,
+        }
+        if presupuesto is not None and registro.total > presupuesto:
+            mensaje = f'{nombre_vista} ejecutó {registro.total} consultas (presupuesto: {presupuesto})'
+            if getattr(settings, 'CONSULTAS_ESTRICTO', False):
+                raise PresupuestoConsultasExcedido(mensaje)
+            logger.warning(mensaje)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        presupuesto = getattr(view_func, 'presupuesto_consultas', None)
+        if presupuesto is not None:
+            request.presupuesto_consultas = presupuesto
+
+
+class ServerTimingMiddleware(MiddlewarePetJoy):
+    """
+    Mide las fases de una fracción de las peticiones (INSTRUMENTACION_MUESTREO).
+
+    Añade la cabecera Server-Timing y escribe una línea JSON por petición en
+    el logger petjoy.rendimiento. Con el muestreo a 0 el middleware se
+    desactiva al arrancar y no cuesta nada.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.muestreo = getattr(settings, 'INSTRUMENTACION_MUESTREO', 0)
+        if self.muestreo <= 0:
+            raise MiddlewareNotUsed
+        instrumentacion.instalar()
+
+    def envolver(self, request):
+        if self.muestreo < 1 and random.random() >= self.muestreo:
+            return nullcontext()
+        return instrumentacion.medicion()
+
+    def despues(self, request, response, medicion):
+        if medicion is None:
+            return response
+        response['Server-Timing'] = medicion.server_timing()
+        vista = getattr(request, 'resolver_match', None)
+        logger_rendimiento.info(json.dumps({
+            'metodo': request.method,
+            'ruta': request.path,
+            'vista': vista.view_name if vista else None,
+            'estado': response.status_code,
+            **medicion.como_dict(),
+        }, ensure_ascii=False))
+        return response
+
+
+class MetricasMiddleware(MiddlewarePetJoy):
+    """
+    Latencia, estado y número de consultas SQL de cada petición por nombre de vista.
+
+    Se desactiva con METRICAS = False. Los valores se exponen en /metrics.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        if not getattr(settings, 'METRICAS', True):
+            raise MiddlewareNotUsed
+        metricas.instalar()
+
+    @contextmanager
+    def envolver(self, request):
+        estado = {'consultas': [0], 'inicio': time.perf_counter()}
+        token = metricas._consultas_peticion.set(estado['consultas'])
+        try:
+            yield estado
+        finally:
+            metricas._consultas_peticion.reset(token)
+
+    def despues(self, request, response, estado):
+        duracion = time.perf_counter() - estado['inicio']
+        vista = getattr(request, 'resolver_match', None)
+        nombre_vista = vista.view_name if vista else 'sin_resolver'
+        metricas.PETICIONES.inc(nombre_vista, request.method, str(response.status_code))
+        metricas.LATENCIA.observar(duracion, nombre_vista, request.method)
+        metricas.CONSULTAS.observar(estado['consultas'][0], nombre_vista)
+        metricas.volcar_si_toca()
+        return response
+
+
+class ConsultasLentasMiddleware(MiddlewarePetJoy):
+    """Anota el nombre de la vista en curso para el log de consultas lentas"""
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        if not getattr(settings, 'CONSULTAS_LENTAS_MS', 0):
+            raise MiddlewareNotUsed
+
+    @contextmanager
+    def envolver(self, request):
+        request._vista_actual = [request.path]
+        token = vista_actual.set(request._vista_actual)
+        try:
+            yield
+        finally:
+            vista_actual.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._vista_actual[0] = request.resolver_match.view_name
+
+
+class ReplicaMiddleware(MiddlewarePetJoy):
+    """
+    Lectura de lo propio con réplica: las peticiones que escriben leen de la
+    primaria y dejan una cookie para que las siguientes lo sigan haciendo
+    durante REPLICA_LECTURA_PROPIA_SEGUNDOS.
+    """
+    COOKIE = 'petjoy_primaria'
+    METODOS_SEGUROS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        if not routers.hay_replica():
+            raise MiddlewareNotUsed
+        self.ventana = getattr(settings, 'REPLICA_LECTURA_PROPIA_SEGUNDOS', 10)
+
+    def envolver(self, request):
+        if request.method in self.METODOS_SEGUROS and self.COOKIE not in request.COOKIES:
+            return nullcontext()
+        return routers.leer_de_primaria()
+
+    def despues(self, request, response, estado):
+        if request.method not in self.METODOS_SEGUROS or getattr(request, 'escribe_en_primaria', False):
+            response.set_cookie(self.COOKIE, '1', max_age=self.ventana, httponly=True, samesite='Lax')
+        return response
+
+
+class EstaticosMiddleware(MiddlewarePetJoy):
+    """
+    Sirve STATIC_ROOT sin pasar por las vistas (activo con SERVIR_ESTATICOS).
+
+    Usa la variante .br/.gz que acepte el cliente, con Vary: Accept-Encoding, y
+    cachea un año como inmutables los ficheros con hash en el nombre. Lo que no
+    está en STATIC_ROOT sigue su camino (en desarrollo, las vistas de staticfiles).
+    """
+    CACHE_INMUTABLE = 'public, max-age=31536000, immutable'
+    CACHE_SIN_HASH = 'public, max-age=3600'
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        if not getattr(settings, 'SERVIR_ESTATICOS', False) or not settings.STATIC_ROOT:
+            raise MiddlewareNotUsed
+        self.prefijo = '/' + settings.STATIC_URL.lstrip('/')
+        self.servidor = ServidorEstaticos(settings.STATIC_ROOT)
+
+    def antes(self, request):
+        if request.method not in ('GET', 'HEAD') or not request.path.startswith(self.prefijo):
+            return None
+        nombre = request.path[len(self.prefijo):]
+        encontrado = self.servidor.buscar(nombre, request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encontrado is None:
+            return None
+
+        return self.servidor.responder(
+            request, nombre, encontrado,
+            self.CACHE_INMUTABLE if self.servidor.inmutable(nombre) else self.CACHE_SIN_HASH,
+            asincrono=self.asincrono,
+        )
@@ -1,4 +1,13 @@
-from django.db import models
+import logging
+
+from django.conf import settings
+from django.db import DatabaseError, models, transaction
+
+from .cache import cache
+
+CLAVE_DATOS_EMPRESA = 'core:datos_empresa'
+
+logger = logging.getLogger('petjoy.cache')
 
 
 class DatosEmpresa(models.Model):
@@ -32,8 +41,38 @@ class DatosEmpresa(models.Model):
     def __str__(self):
         return self.nombre
     
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._olvidar_cache(kwargs.get('using'))
+    
+    def delete(self, *args, **kwargs):
+        using = kwargs.get('using') or self._state.db
+        resultado = super().delete(*args, **kwargs)
+        self._olvidar_cache(using)
+        return resultado
+    
+    def _olvidar_cache(self, using):
+        # Al confirmar: antes, otra petición podría volver a cachear los datos sin el cambio
+        transaction.on_commit(lambda: cache.delete(CLAVE_DATOS_EMPRESA), using=using or self._state.db)
+    
     @classmethod
     def get_datos(cls):
-        """Obtiene los datos de la empresa (singleton)"""
+        """
+        Obtiene los datos de la empresa (singleton, se lee en casi todas las
+        páginas: va a la caché). Si la BD no responde se sirve la última copia
+        hasta DATOS_EMPRESA_OBSOLETO segundos, y si no la hay, los valores por
+        defecto sin guardar.
+        """
+        try:
+            return cache.obtener(CLAVE_DATOS_EMPRESA, cls._cargar_datos, obsoleto=settings.DATOS_EMPRESA_OBSOLETO)
+        except DatabaseError:
+            logger.exception('No se pudieron leer los datos de la empresa')
+            return cls(pk=1)
+    
+    @classmethod
+    def _cargar_datos(cls):
         obj, created = cls.objects.get_or_create(pk=1)
+        if created:
+            # Releer para que los valores por defecto lleguen como Decimal y no como float
+            obj.refresh_from_db()
         return obj
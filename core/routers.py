@@ -0,0 +1,80 @@
+"""
+Enrutado de lecturas del catálogo a una réplica de solo lectura.
+
+Solo se activa si DATABASES define el alias 'replica'. Las lecturas de las
+apps de APPS_REPLICA van a la réplica salvo que:
+
+- haya una transacción abierta en la primaria (transaction.atomic),
+- la petición escriba (método no seguro) o la vista esté marcada con
+  @en_primaria (checkout y pago), o
+- el usuario haya escrito hace menos de REPLICA_LECTURA_PROPIA_SEGUNDOS
+  (cookie puesta por ReplicaMiddleware), para que lea sus propios cambios.
+
+Todas las escrituras y migraciones van a 'default'; la réplica se mantiene
+con el comando sincronizar_replica.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+ALIAS_REPLICA = 'replica'
+APPS_REPLICA = {'productos', 'core'}
+
+_leer_de_primaria = ContextVar('leer_de_primaria', default=False)
+
+
+@contextmanager
+def leer_de_primaria():
+    """Fuerza que las lecturas del bloque vayan a la base de datos primaria"""
+    token = _leer_de_primaria.set(True)
+    try:
+        yield
+    finally:
+        _leer_de_primaria.reset(token)
+
+
+def en_primaria(vista):
+    """Vista que lee y escribe solo en la primaria aunque se llame por GET (checkout, pago)"""
+    if iscoroutinefunction(vista):
+        @wraps(vista)
+        async def envoltorio_async(request, *args, **kwargs):
+            request.escribe_en_primaria = True
+            with leer_de_primaria():
+                return await vista(request, *args, **kwargs)
+        return envoltorio_async
+
+    @wraps(vista)
+    def envoltorio(request, *args, **kwargs):
+        request.escribe_en_primaria = True
+        with leer_de_primaria():
+            return vista(request, *args, **kwargs)
+    return envoltorio
+
+
+def hay_replica():
+    return ALIAS_REPLICA in settings.DATABASES
+
+
+class RouterReplica:
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label not in APPS_REPLICA or not hay_replica():
+            return None
+        if _leer_de_primaria.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return ALIAS_REPLICA
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Ambos alias contienen los mismos datos
+        return {obj1._state.db, obj2._state.db} <= {DEFAULT_DB_ALIAS, ALIAS_REPLICA, None}
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != ALIAS_REPLICA
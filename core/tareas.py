@@ -0,0 +1,19 @@
+"""Tareas de core que se ejecutan fuera de la petición (ver tareas.cola)"""
+
+from django.core.mail import send_mail
+
+from tareas.cola import tarea
+
+from .models import DatosEmpresa
+
+
+@tarea(max_intentos=5)
+def enviar_contacto(nombre, email, mensaje):
+    """Reenvía a la tienda el mensaje del formulario de contacto"""
+    send_mail(
+        f'Contacto desde la web - {nombre}',
+        f'Nombre: {nombre}\nEmail: {email}\n\nMensaje:\n{mensaje}',
+        email,
+        [DatosEmpresa.get_datos().email],
+        fail_silently=False,
+    )
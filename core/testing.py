@@ -0,0 +1,107 @@
+import importlib
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.test.runner import DiscoverRunner
+from django.urls import clear_url_caches
+
+
+class EjecutorTests(DiscoverRunner):
+    """Ejecuta los tests con la caché compartida en un directorio temporal vacío"""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.directorio_cache = tempfile.mkdtemp(prefix='petjoy-cache-')
+        self.caches_temporales = override_settings(
+            CACHES={'default': {**settings.CACHES['default'], 'LOCATION': self.directorio_cache}},
+        )
+        self.caches_temporales.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.caches_temporales.disable()
+        shutil.rmtree(self.directorio_cache, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
+
+
+def _recargar_urls():
+    # Cada app elige sus vistas con VISTAS_ASYNC al importar su urls.py
+    for modulo in ('productos.urls', 'pedidos.urls', settings.ROOT_URLCONF):
+        importlib.reload(importlib.import_module(modulo))
+    clear_url_caches()
+
+
+@contextmanager
+def vistas_async():
+    """Enruta el catálogo, el carrito y el checkout a las vistas asíncronas, como con ASGI"""
+    try:
+        with override_settings(VISTAS_ASYNC=True):
+            _recargar_urls()
+            yield
+    finally:
+        _recargar_urls()
+
+
+@override_settings(DETECTOR_CONSULTAS=True, CONSULTAS_ESTRICTO=True)
+class ConsultasTestCase(TestCase):
+    """
+    TestCase con el detector de consultas activo en modo estricto.
+
+    Cualquier petición del cliente de pruebas que supere el presupuesto de su
+    vista lanza PresupuestoConsultasExcedido y hace fallar el test.
+    """
+
+    def assertSinNMas1(self, response):
+        """Falla si la respuesta ejecutó consultas repetidas desde el mismo punto (N+1)"""
+        patrones = response.informe_consultas['n_mas_1']
+        if patrones:
+            detalle = '\n'.join(
+                f"  {p['veces']}x {p['sql']}\n     desde {' <- '.join(p['llamada'])}" for p in patrones
+            )
+            self.fail(f"N+1 en {response.informe_consultas['vista']}:\n{detalle}")
+
+    def assertPresupuestoConsultas(self, response):
+        """Falla si la vista no declara presupuesto o lo supera"""
+        informe = response.informe_consultas
+        self.assertIsNotNone(informe['presupuesto'], f"{informe['vista']} no declara @presupuesto_consultas")
+        self.assertLessEqual(informe['total'], informe['presupuesto'])
+
+
+def pasos_sin_indice(queryset):
+    """Pasos del EXPLAIN QUERY PLAN de SQLite que recorren una tabla entera u ordenan en memoria"""
+    pasos = []
+    for linea in queryset.explain().splitlines():
+        paso = linea.split(maxsplit=3)[-1]
+        if (paso.startswith('SCAN') and ' USING ' not in paso) or 'TEMP B-TREE' in paso:
+            pasos.append(paso)
+    return pasos
+
+
+def crear_catalogo(productos=12, imagenes=2, tallas=('S', 'M')):
+    """Crea un catálogo pequeño con imágenes y tallas para los tests de vistas"""
+    from core.models import DatosEmpresa
+    from core.cache import cache
+    from productos.bitmap import indice_catalogo
+    from productos.models import Categoria, ImagenProducto, Marca, Producto, TallaProducto
+
+    # La caché y el índice del catálogo no se enteran de los rollbacks entre tests
+    cache.clear()
+    indice_catalogo.reiniciar()
+    DatosEmpresa.get_datos()
+    categoria = Categoria.objects.create(nombre='Juguetes para Perros')
+    marca = Marca.objects.create(nombre='Kong')
+    creados = []
+    for n in range(productos):
+        producto = Producto.objects.create(
+            nombre=f'Pelota {n}', descripcion='Pelota de prueba', precio=10 + n,
+            categoria=categoria, marca=marca, genero='unisex', stock=10, es_destacado=n % 2 == 0,
+        )
+        ImagenProducto.objects.bulk_create([
+            ImagenProducto(producto=producto, imagen=f'productos/prueba{i}.png', es_principal=i == 0)
+            for i in range(imagenes)
+        ])
+        TallaProducto.objects.bulk_create([TallaProducto(producto=producto, talla=t, stock=5) for t in tallas])
+        creados.append(producto)
+    return creados
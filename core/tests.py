@@ -1,3 +1,640 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import OperationalError, connection, connections, transaction
+from django.db.models import Sum
+from django.test import Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.template import Context, Engine
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from clientes.models import Cliente
+from core.arranque import diferidos_cargados, medir_arranque
+from core import escaparate, instrumentacion, metricas
+from core.cache import cache
+from core.consultas import RegistroConsultasLentas
+from core.estaticos import codificaciones_aceptadas
+from core.routers import leer_de_primaria
+from core.models import CLAVE_DATOS_EMPRESA, DatosEmpresa
+from core.testing import ConsultasTestCase, crear_catalogo, pasos_sin_indice
+from pedidos.exportacion import filtrar_pedidos
+from pedidos.informes import actualizar_resumenes
+from pedidos.models import ItemPedido, Pedido, VentaDiaria
+from productos.condicionales import _filtro_categoria
+from productos.facetas import recalcular_facetas
+from productos.models import Categoria, ConteoFaceta, Marca, Producto
+from productos.views import filtrar_catalogo
+
+
+class PresupuestoConsultasCoreTests(ConsultasTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        crear_catalogo()
+
+    def test_inicio(self):
+        response = self.client.get(reverse('core:inicio'))
+        self.assertEqual(response.status_code, 200)
+        self.assertPresupuestoConsultas(response)
+        self.assertSinNMas1(response)
+
+
+class PlanesEscaparateTests(TestCase):
+    """Las consultas del escaparate van por índice: ni recorren tablas enteras ni ordenan en memoria"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.producto = crear_catalogo(productos=3, imagenes=1, tallas=())[0]
+        cls.cliente = Cliente.objects.create_user(username='ana', email='ana@ejemplo.com', password='x')
+
+    def consultas(self):
+        producto, ayer = self.producto, timezone.now() - timedelta(days=1)
+        tarjetas = Producto.objects.para_tarjeta()
+        yield 'inicio', tarjetas.filter(es_destacado=True, esta_disponible=True)[:8]
+        categoria, marca = str(producto.categoria_id), str(producto.marca_id)
+        for parametros in [{}, {'categoria': categoria}, {'marca': marca}, {'genero': 'unisex'}, {'precio': '1'},
+                           {'categoria': categoria, 'genero': 'mujer'}]:
+            yield f'catálogo {parametros}', filtrar_catalogo(parametros)[0][:12]
+        yield 'relacionados', tarjetas.filter(
+            categoria=producto.categoria, esta_disponible=True).exclude(id=producto.id)[:4]
+        yield 'ETag de categoría', Producto.objects.filter(_filtro_categoria(producto.categoria_id))
+        yield 'seguimiento', Pedido.objects.filter(numero_pedido='ABC123', email_cliente='ana@ejemplo.com')
+        yield 'mis pedidos', Pedido.objects.filter(cliente=self.cliente).order_by('-fecha_creacion')
+        yield 'exportación', filtrar_pedidos(desde=ayer.date()).order_by('fecha_creacion', 'id')
+        yield 'resúmenes de ventas', Pedido.objects.filter(fecha_creacion__gt=ayer).order_by('fecha_creacion', 'id')[:1000]
+
+    def test_sin_recorridos_completos(self):
+        for nombre, queryset in self.consultas():
+            with self.subTest(nombre):
+                self.assertEqual(pasos_sin_indice(queryset), [], queryset.explain())
+
+
+class DetectorNMas1Tests(ConsultasTestCase):
+
+    def test_detecta_consultas_repetidas(self):
+        from core.consultas import RegistroConsultas
+        from productos.models import Producto
+
+        crear_catalogo(productos=5)
+        registro = RegistroConsultas()
+        with registro.activo():
+            for producto in Producto.objects.all():
+                producto.imagenes.first()
+        patrones = registro.repetidas(3)
+        self.assertEqual(len(patrones), 1)
+        self.assertEqual(patrones[0]['veces'], 5)
+        self.assertIn('productos_imagenproducto', patrones[0]['sql'])
+
+
+class InstrumentacionTests(TestCase):
+    def test_plantillas_con_tiempo_propio(self):
+        instrumentacion.instalar()
+        motor = Engine(loaders=[('django.template.loaders.locmem.Loader', {
+            'padre.html': 'a{% include "hijo.html" %}b',
+            'hijo.html': 'x',
+        })])
+        # Cada lectura del reloj avanza un segundo: padre de 1 a 4, hijo de 2 a 3
+        with mock.patch('core.instrumentacion.time') as reloj:
+            reloj.perf_counter.side_effect = iter(range(100))
+            with instrumentacion.medicion() as actual:
+                motor.get_template('padre.html').render(Context())
+        self.assertEqual(actual.plantillas, {'hijo.html': (1, 1), 'padre.html': (2, 1)})
+
+    @override_settings(INSTRUMENTACION_MUESTREO=1)
+    def test_cabecera_server_timing(self):
+        crear_catalogo(productos=3)
+        with self.assertLogs('petjoy.rendimiento') as registro:
+            response = Client().get(reverse('productos:catalogo'))
+
+        fases = {parte.split(';')[0] for parte in response['Server-Timing'].split(', ')}
+        self.assertTrue({'sql', 'tpl', 'total'} <= fases)
+        linea = json.loads(registro.records[0].getMessage())
+        self.assertEqual((linea['vista'], linea['estado']), ('productos:catalogo', 200))
+
+    def test_sin_muestreo_no_hay_cabecera(self):
+        response = Client().get(reverse('productos:catalogo'))
+        self.assertNotIn('Server-Timing', response)
+
+
+class MetricasTests(TestCase):
+    def test_exposicion_prometheus(self):
+        Client().get(reverse('core:contacto'))
+        response = Client().get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        texto = response.content.decode()
+        self.assertIn('# TYPE petjoy_peticiones_total counter', texto)
+        self.assertIn('petjoy_peticiones_total{vista="core:contacto",metodo="GET",estado="200"}', texto)
+        self.assertIn('petjoy_peticion_segundos_bucket{vista="core:contacto",metodo="GET",le="+Inf"}', texto)
+        # Los datos de la empresa pasan por core.cache
+        self.assertRegex(texto, r'petjoy_cache_eventos_total\{alias="default",evento="(fallo|acierto_\w+)"\} \d')
+
+    def test_solo_ips_permitidas(self):
+        self.assertEqual(Client(REMOTE_ADDR='10.0.0.7').get('/metrics').status_code, 404)
+        with override_settings(METRICAS_IPS_PERMITIDAS=['10.0.0.7']):
+            self.assertEqual(Client(REMOTE_ADDR='10.0.0.7').get('/metrics').status_code, 200)
+
+    def test_suma_los_ficheros_de_todos_los_workers(self):
+        with tempfile.TemporaryDirectory() as raiz, \
+                mock.patch.object(metricas, '_fichero_proceso', None):
+            directorio = Path(raiz) / 'metricas'
+            with override_settings(METRICAS_DIRECTORIO=str(directorio)):
+                metricas.volcar()  # crea el directorio que falta
+                # Otro worker del mismo servidor y uno de un arranque anterior
+                otro = directorio / f'{os.getppid()}-1-1.json'
+                otro.write_text(json.dumps([['petjoy_checkout_total', ['prueba'], 2]]), encoding='utf-8')
+                viejo = directorio / f'{os.getppid() + 1}-1-1.json'
+                viejo.write_text(json.dumps([['petjoy_checkout_total', ['prueba'], 40]]), encoding='utf-8')
+                metricas.CHECKOUT.inc('prueba', cantidad=3)
+                propios = metricas.instantanea()[('petjoy_checkout_total', ('prueba',))]
+
+                metricas._fichero_proceso = None  # nuevo proceso: borra lo del arranque anterior
+                self.assertEqual(metricas.agregado()[('petjoy_checkout_total', ('prueba',))], propios + 2)
+                self.assertFalse(viejo.exists())
+                self.assertEqual(len(list(directorio.glob('*.json'))), 3)
+
+    def test_fallo_al_volcar_no_rompe_la_peticion(self):
+        with tempfile.NamedTemporaryFile() as fichero, \
+                override_settings(METRICAS_DIRECTORIO=fichero.name + '/metricas'), \
+                mock.patch.object(metricas, '_fichero_proceso', None), \
+                mock.patch.object(metricas, '_ultimo_volcado', 0.0), \
+                self.assertLogs('petjoy.metricas', 'ERROR'):
+            response = Client().get(reverse('core:contacto'))
+        self.assertEqual(response.status_code, 200)
+
+
+class ConsultasLentasTests(TestCase):
+    def setUp(self):
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        self.ruta = Path(directorio) / 'lentas.jsonl'
+
+    def test_log_sin_parametros(self):
+        registro = RegistroConsultasLentas(0, self.ruta)  # umbral 0: todas son lentas
+        with connection.execute_wrapper(registro):
+            Cliente.objects.filter(email='ana.secreta@example.com').exists()
+            Cliente.objects.filter(email='otra@example.com').exists()
+
+        contenido = self.ruta.read_text(encoding='utf-8')
+        self.assertNotIn('example.com', contenido)
+        consultas = [json.loads(linea) for linea in contenido.splitlines()]
+        self.assertEqual([c['tipo'] for c in consultas], ['consulta', 'plan', 'consulta'])
+        self.assertNotIn('parametros', consultas[0])
+        self.assertEqual(consultas[0]['sql'], consultas[2]['sql'])
+        self.assertIn('"email" = ?', consultas[0]['sql'])
+
+    def test_resumen_del_comando(self):
+        lineas = [
+            {'tipo': 'consulta', 'huella': 'a1', 'ms': 150.0, 'sql': 'SELECT * FROM productos_producto',
+             'vista': 'productos:catalogo'},
+            {'tipo': 'plan', 'huella': 'a1', 'sql': 'SELECT * FROM productos_producto',
+             'plan': ['SCAN productos_producto']},
+            {'tipo': 'consulta', 'huella': 'a1', 'ms': 250.0, 'sql': 'SELECT * FROM productos_producto',
+             'vista': None},
+            {'tipo': 'consulta', 'huella': 'b2', 'ms': 120.0, 'sql': 'SELECT * FROM clientes_cliente',
+             'vista': 'clientes:perfil'},
+        ]
+        self.ruta.write_text(
+            ''.join(json.dumps(linea) + '\n' for linea in lineas) + 'línea rota\n', encoding='utf-8',
+        )
+        salida = StringIO()
+        call_command('consultas_lentas', fichero=str(self.ruta), stdout=salida)
+        texto = salida.getvalue()
+
+        self.assertIn('1. [a1] total 400.0 ms · 2 veces · media 200.0 ms · máx 250.0 ms', texto)
+        self.assertIn('Vistas: productos:catalogo', texto)
+        self.assertIn('⚠ Recorrido completo de productos_producto', texto)
+        self.assertIn('2. [b2]', texto)
+        self.assertIn('2 consultas distintas', texto)
+
+    def test_fichero_inexistente(self):
+        with self.assertRaisesMessage(CommandError, 'No existe'):
+            call_command('consultas_lentas', fichero=str(self.ruta), stdout=StringIO())
+
+
+class ReplicaTests(TransactionTestCase):
+    """
+    En los tests 'replica' es un espejo de 'default' (TEST MIRROR). Con TestCase
+    todo corre dentro de atomic y se leería siempre de la primaria.
+    """
+    databases = {'default', 'replica'}
+
+    def consultas_en(self, alias, funcion):
+        with CaptureQueriesContext(connections[alias]) as capturadas:
+            resultado = funcion()
+        return len(capturadas), resultado
+
+    def test_lecturas_del_catalogo_en_la_replica(self):
+        self.assertEqual(Producto.objects.all().db, 'replica')
+        self.assertEqual(DatosEmpresa.objects.all().db, 'replica')
+        self.assertEqual(Pedido.objects.all().db, 'default')  # pedidos no se replica
+
+    def test_primaria_en_transacciones_y_bloques_forzados(self):
+        with transaction.atomic():
+            self.assertEqual(Producto.objects.all().db, 'default')
+        with leer_de_primaria():
+            self.assertEqual(Producto.objects.all().db, 'default')
+
+    def test_escrituras_en_la_primaria(self):
+        producto = crear_catalogo(productos=1)[0]
+        self.assertEqual(producto._state.db, 'default')
+        self.assertEqual(Producto.objects.get(pk=producto.pk)._state.db, 'replica')
+
+    def test_guardar_productos_no_lee_de_la_replica(self):
+        producto = crear_catalogo(productos=1)[0]
+        producto.precio = producto.precio + 100
+
+        def guardar_y_borrar():
+            producto.save()
+            recalcular_facetas()
+            producto.delete()
+        en_replica, _ = self.consultas_en('replica', guardar_y_borrar)
+        self.assertEqual(en_replica, 0)
+        self.assertFalse(ConteoFaceta.objects.filter(total__gt=0).exists())
+
+    def test_get_lee_de_la_replica(self):
+        crear_catalogo(productos=2)
+        en_replica, response = self.consultas_en('replica', lambda: self.client.get(reverse('productos:catalogo')))
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(en_replica, 0)
+        self.assertNotIn('petjoy_primaria', response.cookies)
+
+    def test_tras_escribir_lee_de_la_primaria(self):
+        producto = crear_catalogo(productos=1)[0]
+        response = self.client.post(reverse('pedidos:agregar_carrito', args=[producto.id]), {'cantidad': 1})
+        cookie = response.cookies['petjoy_primaria']
+        self.assertEqual(cookie['max-age'], settings.REPLICA_LECTURA_PROPIA_SEGUNDOS)
+
+        en_replica, response = self.consultas_en('replica', lambda: self.client.get(reverse('productos:catalogo')))
+        self.assertEqual((en_replica, response.status_code), (0, 200))
+
+    def test_vistas_en_primaria(self):
+        producto = crear_catalogo(productos=1)[0]
+        self.client.post(reverse('pedidos:agregar_carrito', args=[producto.id]), {'cantidad': 1})
+        self.client.cookies.pop('petjoy_primaria')
+
+        en_replica, response = self.consultas_en('replica', lambda: self.client.get(reverse('pedidos:checkout')))
+        self.assertEqual((en_replica, response.status_code), (0, 200))
+        self.assertIn('petjoy_primaria', response.cookies)
+
+    def test_sincronizar_replica(self):
+        crear_catalogo(productos=3)
+        with tempfile.TemporaryDirectory() as directorio:
+            ruta = Path(directorio) / 'replica.sqlite3'
+            with mock.patch.dict(connections['replica'].settings_dict, {'NAME': ruta}):
+                salida = StringIO()
+                call_command('sincronizar_replica', stdout=salida)
+            copia = sqlite3.connect(ruta)
+            try:
+                total, = copia.execute('SELECT COUNT(*) FROM productos_producto').fetchone()
+            finally:
+                copia.close()
+        self.assertEqual(total, 3)
+        self.assertIn('✅ Réplica sincronizada', salida.getvalue())
+
+    def test_sincronizar_sin_replica(self):
+        with mock.patch('core.management.commands.sincronizar_replica.hay_replica', return_value=False), \
+                self.assertRaisesMessage(CommandError, "No hay alias 'replica'"):
+            call_command('sincronizar_replica', stdout=StringIO())
+
+
+class EstaticosTests(TestCase):
+    CSS = b'.tarjeta { color: #333; margin: 0 auto; }\n' * 200
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        directorio = Path(tempfile.mkdtemp())
+        cls.addClassCleanup(shutil.rmtree, directorio)
+        (directorio / 'origen' / 'css').mkdir(parents=True)
+        (directorio / 'origen' / 'css' / 'app.css').write_bytes(cls.CSS)
+        (directorio / 'origen' / 'logo.png').write_bytes(b'\x89PNG' + bytes(range(256)))
+        cls.enterClassContext(override_settings(
+            STATICFILES_DIRS=[directorio / 'origen'], STATIC_ROOT=directorio / 'destino', SERVIR_ESTATICOS=True,
+        ))
+        call_command('collectstatic', interactive=False, verbosity=0)
+        cls.css = staticfiles_storage.stored_name('css/app.css')
+
+    def pedir(self, nombre, **cabeceras):
+        return self.client.get(f'/static/{nombre}', **cabeceras)
+
+    def test_almacen_con_hash_y_variantes(self):
+        self.assertRegex(self.css, r'^css/app\.[0-9a-f]{12}\.css$')
+        for nombre in (self.css, 'css/app.css'):
+            with staticfiles_storage.open(nombre + '.gz') as fichero:
+                self.assertEqual(gzip.decompress(fichero.read()), self.CSS)
+        self.assertFalse(staticfiles_storage.exists(staticfiles_storage.stored_name('logo.png') + '.gz'))
+        self.assertEqual(staticfiles_storage.stored_name('no/existe.css'), 'no/existe.css')
+
+    def test_codificaciones_aceptadas(self):
+        self.assertEqual(codificaciones_aceptadas('gzip, deflate, br'), {'gzip', 'br'})
+        self.assertEqual(codificaciones_aceptadas('br;q=0, GZIP;q=0.5'), {'gzip'})
+        self.assertEqual(codificaciones_aceptadas('gzip;q=0, *'), {'br'})
+        self.assertEqual(codificaciones_aceptadas('*;q=0'), set())
+        self.assertEqual(codificaciones_aceptadas('identity'), set())
+        self.assertEqual(codificaciones_aceptadas('gzip;q=nada'), set())
+
+    def test_variante_comprimida_en_streaming(self):
+        response = self.pedir(self.css, HTTP_ACCEPT_ENCODING='gzip, br;q=0')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(response['Content-Type'], 'text/css; charset=utf-8')
+        cuerpo = response.getvalue()
+        self.assertEqual(int(response['Content-Length']), len(cuerpo))
+        self.assertEqual(gzip.decompress(cuerpo), self.CSS)
+
+    def test_q_cero_sirve_sin_comprimir(self):
+        response = self.pedir(self.css, HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(response.getvalue(), self.CSS)
+
+    def test_sin_hash_y_no_comprimibles(self):
+        response = self.pedir('css/app.css')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=3600')
+        response = self.pedir(staticfiles_storage.stored_name('logo.png'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Vary', response)
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(response['Content-Type'], 'image/png')
+
+    def test_not_modified(self):
+        primera = self.pedir(self.css, HTTP_ACCEPT_ENCODING='gzip')
+        response = self.pedir(
+            self.css, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_MODIFIED_SINCE=primera['Last-Modified'],
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+
+    def test_head_y_ficheros_que_no_existen(self):
+        response = self.client.head(f'/static/{self.css}')
+        self.assertEqual((response.content, response['Content-Length']), (b'', str(len(self.CSS))))
+        self.assertEqual(self.pedir('css/otro.css').status_code, 404)
+        self.assertEqual(self.pedir('../manage.py').status_code, 404)
+
+    async def test_streaming_asincrono(self):
+        response = await self.async_client.get(f'/static/{self.css}')
+        self.assertEqual(b''.join([trozo async for trozo in response.streaming_content]), self.CSS)
+
+
+class ArranqueTests(SimpleTestCase):
+    """Arranque en frío de un worker en un intérprete nuevo"""
+
+    def test_imports_diferidos(self):
+        self.assertEqual(diferidos_cargados(medir_arranque()['modulos']), [])
+
+    def test_presupuesto_arranque(self):
+        # El mejor de tres arranques, para no fallar por ruido de la máquina
+        mejor = min(medir_arranque()['ms'] for _ in range(3))
+        self.assertLess(mejor, settings.ARRANQUE_MAXIMO_MS, f'Arranque en frío de {mejor:.0f} ms')
+
+
+@override_settings(CACHE_JITTER=0, CACHE_REVALIDAR_EN_SEGUNDO_PLANO=False)
+class CacheDosNivelesTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_lru_delante_de_la_compartida(self):
+        with self.settings(CACHE_LOCAL_MAXIMO=2):
+            for clave in 'abc':
+                cache.set(clave, clave.upper())
+            self.assertEqual(cache.get('c'), 'C')
+            self.assertEqual(cache.get('a'), 'A')  # desalojada del LRU: sale de la compartida
+            self.assertIsNone(cache.get('z'))
+        estadisticas = cache.estadisticas()
+        self.assertEqual(estadisticas['desalojo'], 2)
+        self.assertEqual(estadisticas['acierto_local'], 1)
+        self.assertEqual(estadisticas['acierto_compartida'], 1)
+        self.assertEqual(estadisticas['fallo'], 1)
+        self.assertEqual(estadisticas['entradas_locales'], 2)
+
+    def test_un_solo_calculo_por_clave(self):
+        llamadas = []
+
+        def calcular():
+            llamadas.append(1)
+            time.sleep(0.1)
+            return 'valor'
+
+        resultados = []
+        hilos = [threading.Thread(target=lambda: resultados.append(cache.obtener('lenta', calcular)))
+                 for _ in range(8)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        self.assertEqual(resultados, ['valor'] * 8)
+        self.assertEqual(len(llamadas), 1)
+        self.assertEqual(cache.estadisticas()['recalculo'], 1)
+
+    def test_sirve_obsoleto_mientras_recalcula(self):
+        cache.set('portada', 'vieja', ttl=0.01, obsoleto=60)
+        time.sleep(0.02)
+        self.assertEqual(cache.obtener('portada', lambda: 'nueva'), 'vieja')
+        self.assertEqual(cache.obtener('portada', lambda: 'otra'), 'nueva')
+        estadisticas = cache.estadisticas()
+        self.assertEqual((estadisticas['obsoleto'], estadisticas['recalculo']), (1, 1))
+
+    def test_jitter_del_ttl(self):
+        with self.settings(CACHE_JITTER=0.2):
+            inicio = time.time()
+            for n in range(20):
+                cache.set(f'clave{n}', n, ttl=100)
+            frescos = {cache.local[f'clave{n}'][1] - inicio for n in range(20)}
+        self.assertGreater(len(frescos), 1)
+        self.assertTrue(all(79 < fresco < 121 for fresco in frescos))
+
+    def test_datos_empresa(self):
+        datos = DatosEmpresa.get_datos()
+        with self.assertNumQueries(0):
+            self.assertEqual(DatosEmpresa.get_datos().pk, datos.pk)
+        editados = DatosEmpresa.objects.get(pk=datos.pk)
+        editados.nombre = 'PetJoy Madrid'
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            editados.save()
+            # Hasta el commit otras peticiones no ven el cambio: se sigue sirviendo la caché
+            self.assertNotEqual(DatosEmpresa.get_datos().nombre, 'PetJoy Madrid')
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(DatosEmpresa.get_datos().nombre, 'PetJoy Madrid')
+
+    def test_datos_empresa_sin_base_de_datos(self):
+        caida = mock.patch.object(DatosEmpresa, '_cargar_datos', side_effect=OperationalError('BD caída'))
+        # Sin copia en caché: valores por defecto, sin guardar nada
+        with caida, self.assertLogs('petjoy.cache', 'ERROR'):
+            self.assertEqual(DatosEmpresa.get_datos().iva_porcentaje, 21)
+        self.assertIsNone(cache.get(CLAVE_DATOS_EMPRESA))
+        # Con copia, aunque esté caducada, se sigue sirviendo
+        datos = DatosEmpresa.get_datos()
+        cache.caducar(CLAVE_DATOS_EMPRESA)
+        with caida, self.assertLogs('petjoy.cache', 'ERROR'):
+            self.assertEqual(DatosEmpresa.get_datos().pk, datos.pk)
+
+
+@override_settings(CACHE_REVALIDAR_EN_SEGUNDO_PLANO=False)
+class EscaparateTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.productos = crear_catalogo(productos=4)
+
+    def setUp(self):
+        cache.clear()
+        self.client.get(reverse('core:inicio'))  # genera la instantánea
+
+    def test_no_consulta_el_catalogo(self):
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(reverse('core:inicio'))
+        self.assertContains(response, self.productos[0].nombre)
+        self.assertEqual([c['sql'] for c in consultas.captured_queries if 'productos_' in c['sql']], [])
+
+    def test_token_csrf_de_cada_visitante(self):
+        visitante = Client(enforce_csrf_checks=True)
+        response = visitante.get(reverse('core:inicio'))
+        self.assertNotContains(response, escaparate.MARCA_CSRF)
+        token = re.search(r'name="csrfmiddlewaretoken" value="([^"]+)"', response.content.decode()).group(1)
+        url = reverse('pedidos:agregar_carrito', args=[self.productos[0].id])
+        self.assertEqual(visitante.post(url, {'cantidad': 1, 'csrfmiddlewaretoken': token}).status_code, 302)
+
+    def test_cambiar_destacados_la_regenera(self):
+        destacado = self.productos[0]
+        destacado.es_destacado = False
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            destacado.save()
+            # Hasta el commit se sigue sirviendo como fresca
+            self.assertEqual(cache.estadisticas().get('obsoleto', 0), 0)
+            self.client.get(reverse('core:inicio'))
+            self.assertEqual(cache.estadisticas().get('obsoleto', 0), 0)
+        self.assertEqual(len(callbacks), 1)
+        # La visita que la encuentra obsoleta aún recibe la copia anterior
+        self.assertContains(self.client.get(reverse('core:inicio')), destacado.nombre)
+        self.assertNotContains(self.client.get(reverse('core:inicio')), destacado.nombre)
+
+    def test_sin_base_de_datos_sirve_la_copia_anterior(self):
+        escaparate.caducar()
+        with mock.patch('core.escaparate.renderizar', side_effect=Exception('BD caída')), \
+                self.assertLogs('petjoy.cache', 'ERROR'):
+            response = self.client.get(reverse('core:inicio'))
+        self.assertContains(response, self.productos[0].nombre)
+
+    def test_sin_base_de_datos_ni_copia_sale_sin_escaparate(self):
+        cache.clear()
+        with mock.patch('core.escaparate.renderizar', side_effect=OperationalError('BD caída')), \
+                self.assertLogs('petjoy.cache', 'ERROR'):
+            response = self.client.get(reverse('core:inicio'))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, self.productos[0].nombre)
+        self.assertIsNone(cache.get(escaparate.CLAVE))
+
+
+class CargarTests(TransactionTestCase):
+    """Las vistas síncronas corren en otro hilo: los datos tienen que estar confirmados"""
+    databases = {'default', 'replica'}
+
+    def test_recorridos_en_proceso(self):
+        crear_catalogo(productos=3)
+        with tempfile.TemporaryDirectory() as directorio:
+            ruta = Path(directorio) / 'carga.json'
+            # La BD configurada de los tests ya es la de pruebas
+            call_command(
+                'cargar', usuarios=2, duracion=0.3, semilla=1, recorridos='comprar=1,buscar=1',
+                usar_bd_configurada=True, json=str(ruta), stdout=StringIO(),
+            )
+            resumen = json.loads(ruta.read_text(encoding='utf-8'))
+
+        self.assertEqual((resumen['errores'], resumen['fallos']), (0, {}))
+        compras = resumen['recorridos']['comprar']['completados']
+        self.assertGreater(compras, 0)
+        self.assertEqual(Pedido.objects.count(), compras)
+        self.assertEqual(resumen['urls']['pedidos:confirmacion']['peticiones'], compras)
+        self.assertEqual(resumen['configuracion']['usuarios'], 2)
+
+    def test_recorrido_desconocido(self):
+        with self.assertRaisesMessage(CommandError, 'Recorrido desconocido: volar'):
+            call_command('cargar', recorridos='mirar=1,volar=2', stdout=StringIO())
+
+    def test_productos_solo_con_bd_de_pruebas(self):
+        with self.assertRaisesMessage(CommandError, 'no se combina con --usar-bd-configurada'):
+            call_command('cargar', productos=10, usar_bd_configurada=True, stdout=StringIO())
+
+
+class GenerarDatosTests(TestCase):
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        ajustes = override_settings(MEDIA_ROOT=media)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def generar(self, **opciones):
+        call_command(
+            'generar_datos', categorias=3, marcas=3, productos=20, clientes=5, sesiones=5, pedidos=30,
+            fecha='2025-06-30', stdout=StringIO(), **opciones,
+        )
+
+    def instantanea(self):
+        return (
+            list(Producto.objects.order_by('id').values_list('id', 'nombre', 'precio', 'stock', 'fecha_creacion')),
+            list(Cliente.objects.order_by('id').values_list('id', 'email', 'password', 'date_joined')),
+            # La firma de session_data lleva la hora de la firma: se compara su contenido
+            [(sesion.session_key, sesion.get_decoded(), sesion.expire_date)
+             for sesion in Session.objects.order_by('session_key')],
+            list(Pedido.objects.order_by('id').values_list('id', 'fecha_creacion', 'estado', 'total')),
+            list(ItemPedido.objects.order_by('id').values_list('pedido_id', 'producto_id', 'cantidad')),
+        )
+
+    def test_determinista_con_la_misma_semilla_y_fecha(self):
+        self.generar()
+        primera = self.instantanea()
+        self.assertEqual([len(filas) for filas in primera[:4]], [20, 5, 5, 30])
+        self.assertLess(max(fila[1] for fila in primera[3]), timezone.make_aware(datetime(2025, 6, 30)))
+
+        for modelo in (ItemPedido, Pedido, Session, Cliente, Producto, Categoria, Marca):
+            modelo.objects.all().delete()
+        self.generar()
+        self.assertEqual(self.instantanea(), primera)
+
+    def test_repetir_sobre_la_misma_bd_añade_datos(self):
+        self.generar()
+        self.generar()
+        self.assertEqual(Producto.objects.count(), 40)
+        self.assertEqual(Session.objects.count(), 10)
+        self.assertEqual(Pedido.objects.count(), 60)
+
+    def assertResumenesCuadran(self):
+        vendidos = ItemPedido.objects.exclude(pedido__estado='cancelado').aggregate(
+            unidades=Sum('cantidad'), ingresos=Sum('total'),
+        )
+        self.assertEqual(VentaDiaria.objects.aggregate(unidades=Sum('unidades'), ingresos=Sum('ingresos')), vendidos)
+
+    def test_los_pedidos_añadidos_entran_en_los_resumenes(self):
+        self.generar()
+        actualizar_resumenes(retraso=timedelta(0))
+        self.generar(semilla=7)  # pedidos con fechas anteriores a los ya resumidos
+        self.assertResumenesCuadran()
+        # Cancelar uno de los añadidos resta lo que se sumó, ni más ni menos
+        pedido = Pedido.objects.exclude(estado='cancelado').order_by('-id').first()
+        pedido.estado = 'cancelado'
+        pedido.save()
+        self.assertResumenesCuadran()
@@ -7,4 +7,5 @@ urlpatterns = [
     path('', views.inicio, name='inicio'),
     path('acerca-de/', views.acerca_de, name='acerca_de'),
     path('contacto/', views.contacto, name='contacto'),
+    path('metrics', views.metricas, name='metricas'),
 ]
@@ -1,19 +1,23 @@
+from django.conf import settings
+from django.http import Http404, HttpResponse
 from django.shortcuts import render
-from productos.models import Producto, Categoria
+from django.views.decorators.cache import never_cache
 from core.models import DatosEmpresa
-from django.core.mail import send_mail
+from core.escaparate import escaparate
+from core.consultas import presupuesto_consultas
+from core import metricas as registro_metricas
+from core.tareas import enviar_contacto
 from django.contrib import messages
 
 
+@presupuesto_consultas(8)
 def inicio(request):
     """Página de inicio/escaparate"""
-    productos_destacados = Producto.objects.filter(es_destacado=True, esta_disponible=True)[:8]
-    categorias = Categoria.objects.all()[:6]
     datos_empresa = DatosEmpresa.get_datos()
     
     context = {
-        'productos_destacados': productos_destacados,
-        'categorias': categorias,
+        # Categorías y destacados salen de una instantánea en caché (core.escaparate)
+        'escaparate': escaparate(request),
         'datos_empresa': datos_empresa,
     }
     return render(request, 'core/inicio.html', context)
@@ -37,22 +41,20 @@ def contacto(request):
         email = request.POST.get('email')
         mensaje = request.POST.get('mensaje')
         
-        # Enviar email
-        try:
-            asunto = f'Contacto desde la web - {nombre}'
-            cuerpo = f'Nombre: {nombre}\nEmail: {email}\n\nMensaje:\n{mensaje}'
-            send_mail(
-                asunto,
-                cuerpo,
-                email,
-                [datos_empresa.email],
-                fail_silently=False,
-            )
-            messages.success(request, '¡Mensaje enviado correctamente! Te responderemos pronto.')
-        except Exception as e:
-            messages.error(request, 'Error al enviar el mensaje. Por favor, inténtalo de nuevo.')
+        # El email sale desde la cola de tareas (runworkers, o aquí mismo con TAREAS_SINCRONAS),
+        # que lo reintenta si el SMTP falla
+        enviar_contacto.encolar(nombre, email, mensaje)
+        messages.success(request, '¡Mensaje enviado correctamente! Te responderemos pronto.')
     
     context = {
         'datos_empresa': datos_empresa,
     }
     return render(request, 'core/contacto.html', context)
+
+
+@never_cache
+def metricas(request):
+    """Métricas en formato Prometheus, solo para las IPs de METRICAS_IPS_PERMITIDAS"""
+    if request.META.get('REMOTE_ADDR') not in settings.METRICAS_IPS_PERMITIDAS:
+        raise Http404
+    return HttpResponse(registro_metricas.exponer(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -32,6 +32,10 @@ echo "Para iniciar el proyecto:"
 echo "  1. source venv/bin/activate"
 echo "  2. python manage.py runserver"
 echo ""
+echo "Con DEBUG los emails (contacto, confirmación de pedido) se envían desde la propia"
+echo "petición. Con PETJOY_TAREAS_SINCRONAS=0 o DEBUG = False hace falta, en otra terminal:"
+echo "  python manage.py runworkers"
+echo ""
 echo "Luego abre: http://127.0.0.1:8000/"
 echo "Admin: http://127.0.0.1:8000/admin/"
 echo "Usuario: admin@tienda.com"
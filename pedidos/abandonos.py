@@ -0,0 +1,148 @@
+"""
+Purga de sesiones caducadas con estadísticas de carritos abandonados.
+
+clearsessions borra todas las sesiones caducadas en una sola sentencia, que
+en SQLite bloquea la base de datos mientras dura. Aquí se borran por lotes
+pequeños, cada uno en su transacción, y el tamaño del lote se ajusta para
+que cada transacción dure alrededor de `objetivo` segundos.
+
+Antes de borrar un lote se decodifican sus sesiones una a una y los carritos
+que contienen (los de quien no llegó a pagar: al pagar se vacía) se suman a
+CarritoAbandonadoDiario y ProductoAbandonadoDiario. Se suman en la misma
+transacción que borra las sesiones, así que una interrupción nunca cuenta
+un carrito dos veces. El día es el de la última vez que se guardó la sesión
+(su caducidad menos SESSION_COOKIE_AGE).
+"""
+
+import time
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.db import transaction
+from django.utils import timezone
+
+from productos.models import Producto
+
+from .models import CarritoAbandonadoDiario, ProductoAbandonadoDiario
+
+LOTE_MINIMO = 50
+
+
+def _carrito(store, datos):
+    """Líneas válidas (producto_id, cantidad, importe) del carrito de una sesión"""
+    lineas = []
+    for item in store.decode(datos).get('carrito', {}).values():
+        try:
+            cantidad = int(item['cantidad'])
+            lineas.append((int(item['producto_id']), cantidad, Decimal(item['precio']) * cantidad))
+        except (KeyError, TypeError, ValueError, InvalidOperation):
+            continue  # línea de una versión antigua del carrito o corrupta
+    return [linea for linea in lineas if linea[1] > 0]
+
+
+def _acumular_lote(sesiones):
+    """Agrega los carritos de un lote de sesiones (clave, datos, caducidad) por día y producto"""
+    store = import_module(settings.SESSION_ENGINE).SessionStore()
+    edad = timedelta(seconds=settings.SESSION_COOKIE_AGE)
+    dias = defaultdict(lambda: {'carritos': 0, 'unidades': 0, 'importe': Decimal('0.00')})
+    productos = defaultdict(lambda: {'carritos': 0, 'unidades': 0, 'importe': Decimal('0.00')})
+
+    for _, datos, caducidad in sesiones:
+        lineas = _carrito(store, datos)
+        if not lineas:
+            continue
+        fecha = timezone.localdate(caducidad - edad)
+        dia = dias[fecha]
+        dia['carritos'] += 1
+        en_este_carrito = set()
+        for producto_id, cantidad, importe in lineas:
+            fila = productos[(fecha, producto_id)]
+            if producto_id not in en_este_carrito:  # varias tallas del mismo producto: un carrito
+                fila['carritos'] += 1
+                en_este_carrito.add(producto_id)
+            fila['unidades'] += cantidad
+            fila['importe'] += importe
+            dia['unidades'] += cantidad
+            dia['importe'] += importe
+    return dias, productos
+
+
+def _volcar(dias, productos):
+    """Suma lo acumulado a las filas existentes de los resúmenes (un upsert por tabla)"""
+    existentes = {resumen.fecha: resumen for resumen in CarritoAbandonadoDiario.objects.filter(fecha__in=dias)}
+    resumenes = []
+    for fecha, fila in dias.items():
+        resumen = existentes.get(fecha) or CarritoAbandonadoDiario(fecha=fecha)
+        resumen.carritos += fila['carritos']
+        resumen.unidades += fila['unidades']
+        resumen.importe += fila['importe']
+        resumenes.append(resumen)
+    CarritoAbandonadoDiario.objects.bulk_create(
+        resumenes, update_conflicts=True, unique_fields=['fecha'], update_fields=['carritos', 'unidades', 'importe'],
+    )
+
+    ids = {clave[1] for clave in productos}
+    nombres = dict(Producto.objects.filter(id__in=ids).values_list('id', 'nombre'))
+    existentes = {
+        (resumen.fecha, resumen.producto_id): resumen
+        for resumen in ProductoAbandonadoDiario.objects.filter(
+            fecha__in={clave[0] for clave in productos}, producto_id__in=ids,
+        )
+    }
+    resumenes = []
+    for (fecha, producto_id), fila in productos.items():
+        resumen = existentes.get((fecha, producto_id)) or ProductoAbandonadoDiario(fecha=fecha, producto_id=producto_id)
+        resumen.nombre_producto = nombres.get(producto_id, resumen.nombre_producto)
+        resumen.carritos += fila['carritos']
+        resumen.unidades += fila['unidades']
+        resumen.importe += fila['importe']
+        resumenes.append(resumen)
+    # Con los totales ya sumados, insertar o sobrescribir es más barato que bulk_update (CASE por fila)
+    ProductoAbandonadoDiario.objects.bulk_create(
+        resumenes, batch_size=500, update_conflicts=True, unique_fields=['fecha', 'producto'],
+        update_fields=['nombre_producto', 'carritos', 'unidades', 'importe'],
+    )
+
+
+def purgar_sesiones(lote=500, lote_maximo=5000, objetivo=0.1, pausa=0.01, limite=None):
+    """
+    Borra las sesiones caducadas por lotes, resumiendo antes sus carritos.
+
+    El lote empieza en `lote` sesiones y se duplica o se reduce a la mitad para
+    que cada transacción dure cerca de `objetivo` segundos; entre lotes se
+    espera `pausa` segundos para dejar pasar otras escrituras. Con `limite`
+    (segundos) se para al agotarlo aunque queden sesiones.
+    Devuelve (sesiones borradas, carritos abandonados).
+    """
+    ahora = timezone.now()
+    fin = time.monotonic() + limite if limite is not None else None
+    borradas = carritos = 0
+
+    while fin is None or time.monotonic() < fin:
+        inicio = time.monotonic()
+        with transaction.atomic():
+            caducadas = Session.objects.filter(expire_date__lt=ahora)
+            sesiones = list(
+                caducadas.order_by('expire_date').values_list('session_key', 'session_data', 'expire_date')[:lote]
+            )
+            if not sesiones:
+                break
+            dias, productos = _acumular_lote(sesiones)
+            _volcar(dias, productos)
+            caducadas.filter(session_key__in=[sesion[0] for sesion in sesiones]).delete()
+        borradas += len(sesiones)
+        carritos += sum(dia['carritos'] for dia in dias.values())
+        if len(sesiones) < lote:
+            break
+
+        duracion = time.monotonic() - inicio
+        if duracion > objetivo:
+            lote = max(lote // 2, LOTE_MINIMO)
+        elif duracion < objetivo / 2:
+            lote = min(lote * 2, lote_maximo)
+        time.sleep(pausa)
+    return borradas, carritos
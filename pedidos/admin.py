@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Pedido, ItemPedido, Carrito, ItemCarrito
+from .models import (
+    CarritoAbandonadoDiario, Carrito, ItemCarrito, ItemPedido, Pedido, ProductoAbandonadoDiario, VentaDiaria,
+)
 
 
 class ItemPedidoInline(admin.TabularInline):
@@ -48,3 +50,40 @@ class CarritoAdmin(admin.ModelAdmin):
     search_fields = ['cliente__username', 'cliente__email']
     inlines = [ItemCarritoInline]
     readonly_fields = ['fecha_creacion', 'fecha_actualizacion']
+
+
+@admin.register(VentaDiaria)
+class VentaDiariaAdmin(admin.ModelAdmin):
+    list_display = ['fecha', 'nombre_producto', 'metodo_pago', 'pedidos', 'unidades', 'ingresos']
+    list_filter = ['metodo_pago', 'fecha']
+    search_fields = ['nombre_producto']
+    date_hierarchy = 'fecha'
+    
+    def has_add_permission(self, request):
+        # Los resúmenes solo los genera el comando actualizar_ventas
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+class ResumenSoloLecturaAdmin(admin.ModelAdmin):
+    date_hierarchy = 'fecha'
+    
+    def has_add_permission(self, request):
+        # Los genera el comando purgar_sesiones al borrar las sesiones caducadas
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(CarritoAbandonadoDiario)
+class CarritoAbandonadoDiarioAdmin(ResumenSoloLecturaAdmin):
+    list_display = ['fecha', 'carritos', 'unidades', 'importe']
+
+
+@admin.register(ProductoAbandonadoDiario)
+class ProductoAbandonadoDiarioAdmin(ResumenSoloLecturaAdmin):
+    list_display = ['fecha', 'nombre_producto', 'carritos', 'unidades', 'importe']
+    search_fields = ['nombre_producto']
@@ -1,4 +1,5 @@
 from decimal import Decimal
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from productos.models import Producto
 from core.models import DatosEmpresa
@@ -10,10 +11,27 @@ class Carrito:
     def __init__(self, request):
         """Inicializar el carrito"""
         self.session = request.session
-        carrito = self.session.get('carrito')
-        if not carrito:
-            carrito = self.session['carrito'] = {}
-        self.carrito = carrito
+        # Solo se escribe en la sesión al añadir algo: mirar la tienda no crea sesiones
+        self.carrito = self.session.get('carrito', {})
+        self._datos_empresa = None
+        self._items = None
+    
+    @classmethod
+    async def acargar(cls, request):
+        """Carrito con productos y datos de empresa ya leídos, para pintarlo desde una vista async"""
+        await request.session.aget('carrito')  # carga la sesión sin bloquear
+        carrito = cls(request)
+        carrito._datos_empresa = await sync_to_async(DatosEmpresa.get_datos)()
+        productos = [producto async for producto in carrito._productos()]
+        carrito._items = list(carrito._combinar(productos))
+        return carrito
+    
+    @property
+    def datos_empresa(self):
+        """Datos de la empresa, leídos una sola vez por carrito"""
+        if self._datos_empresa is None:
+            self._datos_empresa = DatosEmpresa.get_datos()
+        return self._datos_empresa
     
     def agregar(self, producto, cantidad=1, talla='', actualizar_cantidad=False):
         """Agregar un producto al carrito o actualizar su cantidad"""
@@ -36,8 +54,8 @@ class Carrito:
         self.guardar()
     
     def guardar(self):
-        """Marcar la sesión como modificada"""
-        self.session.modified = True
+        """Guarda el carrito en la sesión (y la marca como modificada)"""
+        self.session['carrito'] = self.carrito
     
     def eliminar(self, producto, talla=''):
         """Eliminar un producto del carrito"""
@@ -48,11 +66,15 @@ class Carrito:
             del self.carrito[talla_key]
             self.guardar()
     
-    def __iter__(self):
-        """Iterar sobre los items del carrito y obtener los productos de la BD"""
-        productos_ids = [item['producto_id'] for item in self.carrito.values()]
-        productos = Producto.objects.filter(id__in=productos_ids)
-        carrito = self.carrito.copy()
+    def productos_ids(self):
+        return [item['producto_id'] for item in self.carrito.values()]
+    
+    def _productos(self):
+        return Producto.objects.para_tarjeta().filter(id__in=self.productos_ids())
+    
+    def _combinar(self, productos):
+        # Copia de cada línea: el producto y los Decimal no deben acabar en la sesión
+        carrito = {key: item.copy() for key, item in self.carrito.items()}
         
         for producto in productos:
             for key, item in carrito.items():
@@ -62,6 +84,12 @@ class Carrito:
                     item['total'] = item['precio'] * item['cantidad']
                     yield item
     
+    def __iter__(self):
+        """Iterar sobre los items del carrito y obtener los productos de la BD"""
+        if self._items is not None:
+            return iter(self._items)
+        return self._combinar(self._productos())
+    
     def __len__(self):
         """Contar todos los items en el carrito"""
         return sum(item['cantidad'] for item in self.carrito.values())
@@ -72,7 +100,7 @@ class Carrito:
     
     def obtener_coste_envio(self):
         """Calcular el coste de envío"""
-        datos_empresa = DatosEmpresa.get_datos()
+        datos_empresa = self.datos_empresa
         total = self.obtener_precio_total()
         
         if total >= datos_empresa.envio_gratuito_desde:
@@ -81,7 +109,7 @@ class Carrito:
     
     def obtener_impuestos(self):
         """Calcular los impuestos"""
-        datos_empresa = DatosEmpresa.get_datos()
+        datos_empresa = self.datos_empresa
         subtotal = self.obtener_precio_total()
         return (subtotal * datos_empresa.iva_porcentaje) / Decimal('100')
     
@@ -94,5 +122,6 @@ class Carrito:
     
     def limpiar(self):
         """Vaciar el carrito"""
-        del self.session['carrito']
-        self.guardar()
+        self.carrito = {}
+        self._items = None
+        self.session.pop('carrito', None)
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.checks import Error, register
+from django.utils.module_loading import import_string
+
+from .pasarela import PasarelaFalsa, pasarela_falsa_permitida
+
+
+@register()
+def comprobar_pasarela(app_configs, **kwargs):
+    """Con la pasarela falsa cualquiera puede pagar un pedido sin pagar: nunca en producción"""
+    ruta = getattr(settings, 'PASARELA_PAGO', 'pedidos.pasarela.PasarelaStripe')
+    try:
+        pasarela = import_string(ruta)
+    except ImportError as e:
+        return [Error(f'PASARELA_PAGO no se puede importar: {e}', id='pedidos.E001')]
+    if issubclass(pasarela, PasarelaFalsa) and not pasarela_falsa_permitida():
+        return [Error(
+            'PASARELA_PAGO es PasarelaFalsa con DEBUG desactivado',
+            hint='Quita PETJOY_PASARELA del entorno; la pasarela falsa da por pagado cualquier pedido.',
+            id='pedidos.E002',
+        )]
+    return []
@@ -1,6 +1,9 @@
+from core.instrumentacion import medir
+
 from .carrito import Carrito as CarritoSesion
 
 
 def carrito(request):
     """Context processor para hacer el carrito disponible en todas las plantillas"""
-    return {'carrito': CarritoSesion(request)}
+    with medir('carrito'):
+        return {'carrito': CarritoSesion(request)}
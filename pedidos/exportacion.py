@@ -0,0 +1,105 @@
+"""
+Exportación en streaming de pedidos y sus líneas en CSV o JSONL.
+
+Pedidos e items se recorren con dos iteradores ordenados por id de pedido
+que avanzan a la par, así que la memoria usada es constante sea cual sea
+el número de pedidos y el primer registro sale en cuanto llega de la BD.
+"""
+
+import csv
+import json
+from datetime import datetime, time, timedelta
+from itertools import groupby
+
+from django.utils import timezone
+
+from core.flujos import Eco
+
+from .models import ItemPedido, Pedido
+
+FORMATOS = ('csv', 'jsonl')
+
+CAMPOS_PEDIDO = [
+    'numero_pedido', 'fecha_creacion', 'estado', 'cliente_id',
+    'nombre_cliente', 'apellidos_cliente', 'email_cliente', 'telefono_cliente',
+    'direccion_envio', 'ciudad_envio', 'codigo_postal_envio',
+    'subtotal', 'impuestos', 'coste_entrega', 'descuento', 'total', 'metodo_pago',
+]
+
+CAMPOS_ITEM = ['producto_id', 'nombre_producto', 'talla', 'cantidad', 'precio_unitario', 'total']
+
+
+
+def filtrar_pedidos(desde=None, hasta=None, estado=None):
+    """Pedidos del rango de fechas (inclusive) y estado indicados"""
+    pedidos = Pedido.objects.all()
+    # Límites como instantes (y no con __date) para que el filtro pueda usar índices
+    if desde:
+        pedidos = pedidos.filter(fecha_creacion__gte=timezone.make_aware(datetime.combine(desde, time.min)))
+    if hasta:
+        pedidos = pedidos.filter(fecha_creacion__lt=timezone.make_aware(datetime.combine(hasta + timedelta(days=1), time.min)))
+    if estado:
+        pedidos = pedidos.filter(estado=estado)
+    return pedidos
+
+
+def _texto(valor):
+    """Convierte fechas y decimales a texto para CSV/JSON"""
+    if valor is None:
+        return ''
+    if hasattr(valor, 'isoformat'):
+        return valor.isoformat()
+    return str(valor)
+
+
+def _pedidos_con_items(pedidos, chunk_size):
+    """Genera (pedido, [items]) recorriendo pedidos e items en paralelo"""
+    filas_pedido = (
+        pedidos.order_by('id')
+        .values_list('id', *CAMPOS_PEDIDO)
+        .iterator(chunk_size=chunk_size)
+    )
+    filas_item = (
+        ItemPedido.objects.filter(pedido__in=pedidos.values('id'))
+        .order_by('pedido_id', 'id')
+        .values_list('pedido_id', *CAMPOS_ITEM)
+        .iterator(chunk_size=chunk_size)
+    )
+    grupos = groupby(filas_item, key=lambda fila: fila[0])
+    pendiente = next(grupos, None)
+
+    for fila in filas_pedido:
+        pedido_id = fila[0]
+        pedido = dict(zip(CAMPOS_PEDIDO, fila[1:]))
+        items = []
+        # Descartar grupos de pedidos creados entre las dos lecturas
+        while pendiente is not None and pendiente[0] < pedido_id:
+            pendiente = next(grupos, None)
+        if pendiente is not None and pendiente[0] == pedido_id:
+            items = [dict(zip(CAMPOS_ITEM, item[1:])) for item in pendiente[1]]
+            pendiente = next(grupos, None)
+        yield pedido, items
+
+
+def exportar_csv(pedidos, chunk_size=2000):
+    """Una fila por línea de pedido; los pedidos sin líneas salen con las columnas de item vacías"""
+    escritor = csv.writer(Eco())
+    yield escritor.writerow(CAMPOS_PEDIDO + [f'item_{campo}' for campo in CAMPOS_ITEM])
+    for pedido, items in _pedidos_con_items(pedidos, chunk_size):
+        columnas_pedido = [_texto(pedido[campo]) for campo in CAMPOS_PEDIDO]
+        for item in items or [{}]:
+            yield escritor.writerow(columnas_pedido + [_texto(item.get(campo)) for campo in CAMPOS_ITEM])
+
+
+def exportar_jsonl(pedidos, chunk_size=2000):
+    """Un objeto JSON por pedido con sus líneas anidadas en 'items'"""
+    for pedido, items in _pedidos_con_items(pedidos, chunk_size):
+        pedido['items'] = items
+        yield json.dumps(pedido, default=_texto, ensure_ascii=False) + '\n'
+
+
+def exportar(pedidos, formato='csv', chunk_size=2000):
+    """Generador de líneas de texto en el formato pedido"""
+    if formato == 'jsonl':
+        return exportar_jsonl(pedidos, chunk_size)
+    return exportar_csv(pedidos, chunk_size)
@@ -0,0 +1,171 @@
+"""
+Resúmenes de ventas incrementales.
+
+Los informes nunca agregan sobre el histórico completo de Pedido/ItemPedido:
+leen la tabla VentaDiaria, que se actualiza por lotes con los pedidos que aún
+no están resumidos (Pedido.resumido). Cada pedido lleva su propia marca, así
+que uno que llega con una fecha anterior a los ya resumidos (importado,
+generado) se incorpora igual en la siguiente pasada. MarcaAguaVentas solo
+informa del más reciente.
+
+Los pedidos cancelados no cuentan como ventas. Si un pedido se cancela (o
+deja de estarlo) cuando ya está resumido, corregir_pedido le resta (o le
+vuelve a sumar) sus líneas.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import ItemPedido, MarcaAguaVentas, Pedido, VentaDiaria
+
+CENTIMO = Decimal('0.01')
+CAMPOS_RESUMEN = ('id', 'fecha_creacion', 'metodo_pago', 'subtotal', 'impuestos', 'coste_entrega')
+
+
+def _repartir(importe, parte, total):
+    """Reparte un importe del pedido entre sus líneas en proporción a su total"""
+    if not importe or not total:
+        return Decimal('0.00')
+    return (importe * parte / total).quantize(CENTIMO)
+
+
+def _acumular_lote(pedidos):
+    """Agrega las líneas de un lote de pedidos por (día, producto, categoría, método de pago)"""
+    acumulado = defaultdict(lambda: {
+        'nombre_producto': '', 'pedidos': set(), 'unidades': 0,
+        'ingresos': Decimal('0.00'), 'impuestos': Decimal('0.00'), 'coste_entrega': Decimal('0.00'),
+    })
+    por_id = {pedido['id']: pedido for pedido in pedidos}
+    items = (
+        ItemPedido.objects
+        .filter(pedido_id__in=por_id)
+        .values_list('pedido_id', 'producto_id', 'producto__categoria_id', 'nombre_producto', 'cantidad', 'total')
+    )
+
+    for pedido_id, producto_id, categoria_id, nombre, cantidad, total in items:
+        pedido = por_id[pedido_id]
+        clave = (timezone.localdate(pedido['fecha_creacion']), producto_id, categoria_id, pedido['metodo_pago'])
+        fila = acumulado[clave]
+        fila['nombre_producto'] = nombre
+        fila['pedidos'].add(pedido_id)
+        fila['unidades'] += cantidad
+        fila['ingresos'] += total
+        fila['impuestos'] += _repartir(pedido['impuestos'], total, pedido['subtotal'])
+        fila['coste_entrega'] += _repartir(pedido['coste_entrega'], total, pedido['subtotal'])
+    return acumulado
+
+
+def _volcar(acumulado, signo=1):
+    """Suma (o resta, con signo=-1) el acumulado de un lote a las filas existentes de VentaDiaria"""
+    dias = {clave[0] for clave in acumulado}
+    existentes = {
+        (venta.fecha, venta.producto_id, venta.categoria_id, venta.metodo_pago): venta
+        for venta in VentaDiaria.objects.filter(fecha__in=dias)
+    }
+    nuevas, modificadas = [], []
+
+    for clave, fila in acumulado.items():
+        venta = existentes.get(clave)
+        if venta is None:
+            venta = VentaDiaria(
+                fecha=clave[0], producto_id=clave[1], categoria_id=clave[2], metodo_pago=clave[3],
+            )
+            nuevas.append(venta)
+        else:
+            modificadas.append(venta)
+        venta.nombre_producto = fila['nombre_producto']
+        venta.pedidos += signo * len(fila['pedidos'])
+        venta.unidades += signo * fila['unidades']
+        venta.ingresos += signo * fila['ingresos']
+        venta.impuestos += signo * fila['impuestos']
+        venta.coste_entrega += signo * fila['coste_entrega']
+
+    VentaDiaria.objects.bulk_create(nuevas, batch_size=500)
+    VentaDiaria.objects.bulk_update(
+        modificadas,
+        ['nombre_producto', 'pedidos', 'unidades', 'ingresos', 'impuestos', 'coste_entrega'],
+        batch_size=500,
+    )
+    return len(nuevas) + len(modificadas)
+
+
+def actualizar_resumenes(tamano_lote=1000, retraso=timedelta(minutes=1), reconstruir=False):
+    """
+    Incorpora a VentaDiaria los pedidos aún no resumidos.
+
+    Solo se procesan pedidos con más de `retraso` de antigüedad, para no leer
+    un pedido cuyas líneas todavía se están guardando. Cada lote se aplica en
+    una transacción junto con la marca de sus pedidos, de modo que una
+    interrupción nunca cuenta un pedido dos veces.
+    Devuelve el número de pedidos procesados.
+    """
+    if reconstruir:
+        with transaction.atomic():
+            VentaDiaria.objects.all().delete()
+            Pedido.objects.filter(resumido=True).update(resumido=False)
+            MarcaAguaVentas.objects.filter(pk=1).update(fecha_creacion=None, pedido_id=0)
+
+    limite = timezone.now() - retraso
+    procesados = 0
+
+    while True:
+        with transaction.atomic():
+            lote = list(
+                Pedido.objects.filter(resumido=False, fecha_creacion__lte=limite)
+                .order_by('fecha_creacion', 'id')
+                .values(*CAMPOS_RESUMEN, 'estado')[:tamano_lote]
+            )
+            if not lote:
+                break
+
+            _volcar(_acumular_lote([pedido for pedido in lote if pedido['estado'] != 'cancelado']))
+            Pedido.objects.filter(pk__in=[pedido['id'] for pedido in lote]).update(resumido=True)
+            marca, ultimo = MarcaAguaVentas.get_marca(), lote[-1]
+            if marca.fecha_creacion is None or (
+                (ultimo['fecha_creacion'], ultimo['id']) > (marca.fecha_creacion, marca.pedido_id)
+            ):
+                marca.fecha_creacion = ultimo['fecha_creacion']
+                marca.pedido_id = ultimo['id']
+                marca.save()
+
+        procesados += len(lote)
+        if len(lote) < tamano_lote:
+            break
+    return procesados
+
+
+def corregir_pedido(pedido, signo):
+    """
+    Resta (signo=-1) o vuelve a sumar (signo=1) un pedido ya resumido.
+
+    Los pedidos sin resumir no se tocan: ya se resumirán, o no, según su
+    estado cuando les llegue el turno.
+    """
+    with transaction.atomic():
+        # De la BD, no de la instancia: puede haberse leído antes de resumirlo
+        if not Pedido.objects.filter(pk=pedido.pk, resumido=True).exists():
+            return
+        _volcar(_acumular_lote([{campo: getattr(pedido, campo) for campo in CAMPOS_RESUMEN}]), signo)
+
+
+def resumen_ventas(desde, hasta):
+    """Totales del periodo leyendo únicamente los resúmenes diarios"""
+    ventas = VentaDiaria.objects.filter(fecha__gte=desde, fecha__lte=hasta)
+    metricas = {
+        'unidades': Sum('unidades'),
+        'ingresos': Sum('ingresos'),
+        'impuestos': Sum('impuestos'),
+        'coste_entrega': Sum('coste_entrega'),
+    }
+    return {
+        'totales': ventas.aggregate(**metricas),
+        'por_dia': ventas.values('fecha').annotate(**metricas).order_by('fecha'),
+        'por_producto': ventas.values('producto_id', 'nombre_producto').annotate(**metricas).order_by('-ingresos')[:20],
+        'por_categoria': ventas.values('categoria_id').annotate(**metricas).order_by('-ingresos'),
+        'por_metodo_pago': ventas.values('metodo_pago').annotate(**metricas).order_by('-ingresos'),
+    }
@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from pedidos.informes import actualizar_resumenes
+
+
+class Command(BaseCommand):
+    help = 'Actualiza de forma incremental los resúmenes diarios de ventas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help='Pedidos procesados por transacción')
+        parser.add_argument(
+            '--retraso', type=int, default=60,
+            help='Segundos de antigüedad mínima de un pedido para resumirlo',
+        )
+        parser.add_argument(
+            '--reconstruir', action='store_true',
+            help='Borra los resúmenes y los recalcula desde el primer pedido',
+        )
+
+    def handle(self, *args, **options):
+        procesados = actualizar_resumenes(
+            tamano_lote=options['lote'],
+            retraso=timedelta(seconds=options['retraso']),
+            reconstruir=options['reconstruir'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'✅ {procesados} pedidos incorporados a los resúmenes de ventas'))
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from pedidos.exportacion import FORMATOS, exportar, filtrar_pedidos
+from pedidos.models import Pedido
+
+
+class Command(BaseCommand):
+    help = 'Exporta pedidos y sus líneas en CSV o JSONL sin cargarlos en memoria'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--formato', choices=FORMATOS, default='csv')
+        parser.add_argument('--desde', help='Fecha inicial (AAAA-MM-DD), inclusive')
+        parser.add_argument('--hasta', help='Fecha final (AAAA-MM-DD), inclusive')
+        parser.add_argument('--estado', choices=[clave for clave, _ in Pedido.ESTADO_CHOICES])
+        parser.add_argument('--salida', help='Fichero de salida (por defecto, la salida estándar)')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Filas leídas de la BD por bloque')
+
+    def _fecha(self, valor):
+        if not valor:
+            return None
+        try:
+            fecha = parse_date(valor)
+        except ValueError:  # bien formada pero imposible, como 2024-13-45
+            fecha = None
+        if fecha is None:
+            raise CommandError(f'Fecha no válida: {valor}')
+        return fecha
+
+    def handle(self, *args, **options):
+        pedidos = filtrar_pedidos(
+            desde=self._fecha(options['desde']),
+            hasta=self._fecha(options['hasta']),
+            estado=options['estado'],
+        )
+        lineas = exportar(pedidos, options['formato'], chunk_size=options['chunk_size'])
+
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8', newline='') as fichero:
+                fichero.writelines(lineas)
+            self.stderr.write(self.style.SUCCESS(f"✅ Pedidos exportados a {options['salida']}"))
+        else:
+            for linea in lineas:
+                self.stdout.write(linea, ending='')
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from pedidos.abandonos import purgar_sesiones
+
+
+class Command(BaseCommand):
+    help = (
+        'Borra las sesiones caducadas por lotes cortos (en lugar de clearsessions) y guarda '
+        'antes las estadísticas de sus carritos abandonados'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500, help='Sesiones del primer lote')
+        parser.add_argument('--lote-maximo', type=int, default=5000)
+        parser.add_argument(
+            '--objetivo-ms', type=float, default=100,
+            help='Duración buscada de cada transacción; el lote se ajusta para acercarse',
+        )
+        parser.add_argument('--pausa-ms', type=float, default=10, help='Espera entre lotes')
+        parser.add_argument('--max-segundos', type=float, help='Para al agotar este tiempo aunque queden sesiones')
+
+    def handle(self, *args, **options):
+        borradas, carritos = purgar_sesiones(
+            lote=options['lote'],
+            lote_maximo=options['lote_maximo'],
+            objetivo=options['objetivo_ms'] / 1000,
+            pausa=options['pausa_ms'] / 1000,
+            limite=options['max_segundos'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {borradas} sesiones caducadas borradas ({carritos} con carrito abandonado)'
+        ))
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.7 on 2026-10-19 16:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0003_indices_pedidos'),
+        ('productos', '0004_indices_escaparate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CarritoAbandonadoDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(unique=True)),
+                ('carritos', models.PositiveIntegerField(default=0)),
+                ('unidades', models.PositiveIntegerField(default=0)),
+                ('importe', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'verbose_name': 'Carritos Abandonados por Día',
+                'verbose_name_plural': 'Carritos Abandonados por Día',
+                'ordering': ['-fecha'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductoAbandonadoDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('nombre_producto', models.CharField(max_length=300)),
+                ('carritos', models.PositiveIntegerField(default=0)),
+                ('unidades', models.PositiveIntegerField(default=0)),
+                ('importe', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('producto', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='productos.producto')),
+            ],
+            options={
+                'verbose_name': 'Producto Abandonado por Día',
+                'verbose_name_plural': 'Productos Abandonados por Día',
+                'ordering': ['-fecha', '-importe'],
+                'unique_together': {('fecha', 'producto')},
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-19 17:18
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Q
+
+
+def marcar_resumidos(apps, schema_editor):
+    """Los pedidos hasta la marca de agua ya están en VentaDiaria"""
+    MarcaAguaVentas = apps.get_model('pedidos', 'MarcaAguaVentas')
+    Pedido = apps.get_model('pedidos', 'Pedido')
+    marca = MarcaAguaVentas.objects.filter(pk=1).first()
+    if marca is None or marca.fecha_creacion is None:
+        return
+    Pedido.objects.filter(
+        Q(fecha_creacion__lt=marca.fecha_creacion) |
+        Q(fecha_creacion=marca.fecha_creacion, id__lte=marca.pedido_id)
+    ).update(resumido=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0004_carritos_abandonados'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedido',
+            name='resumido',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(marcar_resumidos, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(condition=models.Q(('resumido', False)), fields=['fecha_creacion', 'id'], name='pedido_sin_resumir_idx'),
+        ),
+    ]
@@ -92,10 +92,22 @@ class Pedido(models.Model):
     # Notas adicionales
     notas = models.TextField(blank=True)
     
+    # Ya incorporado a VentaDiaria (pedidos.informes), con el estado que tenía entonces
+    resumido = models.BooleanField(default=False, editable=False)
+    
     class Meta:
         verbose_name = 'Pedido'
         verbose_name_plural = 'Pedidos'
         ordering = ['-fecha_creacion']
+        # El seguimiento por (numero_pedido, email_cliente) ya va por el índice único de numero_pedido
+        indexes = [
+            models.Index(fields=['cliente', '-fecha_creacion'], name='pedido_cliente_fecha_idx'),  # Mis pedidos
+            models.Index(fields=['fecha_creacion', 'id'], name='pedido_fecha_idx'),  # informes y exportación
+            # Los que faltan por resumir, que son pocos: actualizar_resumenes no recorre el histórico
+            models.Index(
+                fields=['fecha_creacion', 'id'], condition=models.Q(resumido=False), name='pedido_sin_resumir_idx',
+            ),
+        ]
     
     def __str__(self):
         return f"Pedido {self.numero_pedido}"
@@ -104,6 +116,11 @@ class Pedido(models.Model):
         if not self.numero_pedido:
             # Generar número de pedido único
             self.numero_pedido = str(uuid.uuid4().hex[:12]).upper()
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # resumido solo lo cambia pedidos.informes: una instancia leída antes no lo deshace
+            kwargs['update_fields'] = [
+                campo.name for campo in self._meta.concrete_fields if not campo.primary_key and campo.name != 'resumido'
+            ]
         super().save(*args, **kwargs)
 
 
@@ -123,3 +140,84 @@ class ItemPedido(models.Model):
     
     def __str__(self):
         return f"{self.cantidad} x {self.nombre_producto}"
+
+
+class VentaDiaria(models.Model):
+    """Resumen de ventas por día, producto, categoría y método de pago"""
+    fecha = models.DateField()
+    # Sin restricción de clave foránea: el resumen es histórico y debe sobrevivir
+    # a productos o categorías eliminados
+    producto = models.ForeignKey(Producto, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='+')
+    nombre_producto = models.CharField(max_length=300)
+    categoria = models.ForeignKey('productos.Categoria', on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='+')
+    metodo_pago = models.CharField(max_length=20, choices=Pedido.METODO_PAGO_CHOICES)
+    pedidos = models.PositiveIntegerField(default=0)
+    unidades = models.PositiveIntegerField(default=0)
+    ingresos = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    impuestos = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    coste_entrega = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        verbose_name = 'Venta Diaria'
+        verbose_name_plural = 'Ventas Diarias'
+        ordering = ['-fecha']
+        unique_together = ['fecha', 'producto', 'categoria', 'metodo_pago']
+    
+    def __str__(self):
+        return f"{self.fecha} - {self.nombre_producto} ({self.unidades} uds.)"
+
+
+class CarritoAbandonadoDiario(models.Model):
+    """Carritos de sesiones caducadas sin llegar a comprar, por día de su última actividad"""
+    fecha = models.DateField(unique=True)
+    carritos = models.PositiveIntegerField(default=0)
+    unidades = models.PositiveIntegerField(default=0)
+    importe = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        verbose_name = 'Carritos Abandonados por Día'
+        verbose_name_plural = 'Carritos Abandonados por Día'
+        ordering = ['-fecha']
+    
+    def __str__(self):
+        return f"{self.fecha} - {self.carritos} carritos ({self.importe}€)"
+
+
+class ProductoAbandonadoDiario(models.Model):
+    """Productos que se quedaron en carritos abandonados, por día (ver pedidos.abandonos)"""
+    fecha = models.DateField()
+    # Igual que en VentaDiaria: el histórico sobrevive a los productos eliminados
+    producto = models.ForeignKey(Producto, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='+')
+    nombre_producto = models.CharField(max_length=300)
+    carritos = models.PositiveIntegerField(default=0)
+    unidades = models.PositiveIntegerField(default=0)
+    importe = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        verbose_name = 'Producto Abandonado por Día'
+        verbose_name_plural = 'Productos Abandonados por Día'
+        ordering = ['-fecha', '-importe']
+        unique_together = ['fecha', 'producto']
+    
+    def __str__(self):
+        return f"{self.fecha} - {self.nombre_producto} ({self.unidades} uds.)"
+
+
+class MarcaAguaVentas(models.Model):
+    """Pedido más reciente incluido en los resúmenes de ventas (singleton, informativo)"""
+    fecha_creacion = models.DateTimeField(null=True, blank=True)
+    pedido_id = models.BigIntegerField(default=0)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Marca de Agua de Ventas'
+        verbose_name_plural = 'Marca de Agua de Ventas'
+    
+    def __str__(self):
+        return f"Ventas resumidas hasta {self.fecha_creacion}"
+    
+    @classmethod
+    def get_marca(cls):
+        """Obtiene la marca de agua (singleton)"""
+        obj, created = cls.objects.get_or_create(pk=1)
+        return obj
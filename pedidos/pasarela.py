@@ -0,0 +1,179 @@
+"""
+Pasarelas de pago.
+
+Las vistas de checkout no hablan con Stripe directamente sino con la pasarela
+configurada en settings.PASARELA_PAGO, lo que permite sustituirla por
+PasarelaFalsa en benchmarks y pruebas de carga.
+
+Cada operación tiene versión asíncrona (prefijo a) para las vistas ASGI, que
+esperan a la pasarela sin ocupar un hilo.
+
+El SDK de Stripe se importa al crear la pasarela (primer checkout) y no al
+cargar las vistas, para que arrancar un worker no pague su coste.
+"""
+
+import asyncio
+import time
+import uuid
+from dataclasses import dataclass
+from functools import lru_cache
+from importlib.util import find_spec
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import mail, signing
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from core.instrumentacion import medir
+
+
+class ErrorPasarela(Exception):
+    """La pasarela rechazó la operación o no pudo verificar el pago"""
+
+
+@dataclass
+class SesionPago:
+    id: str
+    url: str = ''
+    pagada: bool = False
+
+
+class PasarelaStripe:
+    """Stripe Checkout"""
+
+    def __init__(self):
+        import stripe
+        stripe.api_key = settings.STRIPE_SECRET_KEY
+        self.stripe = stripe
+        # Las llamadas *_async de stripe necesitan httpx o aiohttp; sin ellos se usa un hilo
+        self.http_asincrono = find_spec('httpx') is not None or find_spec('aiohttp') is not None
+
+    def _parametros(self, importe_centimos, descripcion, email, success_url, cancel_url, metadata):
+        return dict(
+            payment_method_types=['card'],
+            line_items=[{
+                'price_data': {
+                    'currency': settings.SESSION_CURRENCY,
+                    'product_data': {
+                        'name': 'Pedido PetJoy',
+                        'description': descripcion,
+                    },
+                    'unit_amount': importe_centimos,
+                },
+                'quantity': 1,
+            }],
+            mode='payment',
+            success_url=success_url,
+            cancel_url=cancel_url,
+            customer_email=email,
+            metadata=metadata or {},
+        )
+
+    @staticmethod
+    def _sesion_pago(sesion):
+        return SesionPago(id=sesion.id, url=sesion.url or '', pagada=sesion.payment_status == 'paid')
+
+    def crear_sesion(self, importe_centimos, descripcion, email, success_url, cancel_url, metadata=None):
+        parametros = self._parametros(importe_centimos, descripcion, email, success_url, cancel_url, metadata)
+        with medir('pasarela'):
+            sesion = self.stripe.checkout.Session.create(**parametros)
+        return SesionPago(id=sesion.id, url=sesion.url)
+
+    def recuperar_sesion(self, sesion_id):
+        try:
+            with medir('pasarela'):
+                sesion = self.stripe.checkout.Session.retrieve(sesion_id)
+        except self.stripe.error.InvalidRequestError as e:
+            raise ErrorPasarela(str(e)) from e
+        return self._sesion_pago(sesion)
+
+    async def acrear_sesion(self, importe_centimos, descripcion, email, success_url, cancel_url, metadata=None):
+        if not self.http_asincrono:
+            return await sync_to_async(self.crear_sesion, thread_sensitive=False)(
+                importe_centimos, descripcion, email, success_url, cancel_url, metadata,
+            )
+        parametros = self._parametros(importe_centimos, descripcion, email, success_url, cancel_url, metadata)
+        with medir('pasarela'):
+            sesion = await self.stripe.checkout.Session.create_async(**parametros)
+        return SesionPago(id=sesion.id, url=sesion.url)
+
+    async def arecuperar_sesion(self, sesion_id):
+        if not self.http_asincrono:
+            return await sync_to_async(self.recuperar_sesion, thread_sensitive=False)(sesion_id)
+        try:
+            with medir('pasarela'):
+                sesion = await self.stripe.checkout.Session.retrieve_async(sesion_id)
+        except self.stripe.error.InvalidRequestError as e:
+            raise ErrorPasarela(str(e)) from e
+        return self._sesion_pago(sesion)
+
+
+class PasarelaFalsa:
+    """
+    Pasarela sin red para benchmarks y pruebas de carga.
+
+    Redirige directamente a la URL de éxito y da por pagada cualquier sesión
+    que ella misma haya emitido: los ids van firmados con SECRET_KEY, así que
+    valen en cualquier proceso y no se pueden inventar. PASARELA_FALSA_LATENCIA
+    (segundos) simula lo que tarda Stripe en responder.
+
+    Como cualquier pedido sale gratis, solo se puede usar con DEBUG o dentro
+    de un entorno de pruebas (tests, benchmark, cargar).
+    """
+    PREFIJO = 'falsa_'
+
+    def __init__(self):
+        if not pasarela_falsa_permitida():
+            raise ImproperlyConfigured('PasarelaFalsa solo se puede usar con DEBUG o en pruebas')
+        self.firmante = signing.Signer(salt='pedidos.pasarela.PasarelaFalsa')
+
+    @property
+    def latencia(self):
+        return getattr(settings, 'PASARELA_FALSA_LATENCIA', 0)
+
+    def _crear(self, success_url):
+        sesion_id = self.firmante.sign(f'{self.PREFIJO}{uuid.uuid4().hex}')
+        return SesionPago(id=sesion_id, url=success_url.replace('{CHECKOUT_SESSION_ID}', sesion_id))
+
+    def _recuperar(self, sesion_id):
+        try:
+            self.firmante.unsign(sesion_id)
+        except signing.BadSignature:
+            raise ErrorPasarela(f'Sesión desconocida: {sesion_id}')
+        return SesionPago(id=sesion_id, pagada=True)
+
+    def crear_sesion(self, importe_centimos, descripcion, email, success_url, cancel_url, metadata=None):
+        with medir('pasarela'):
+            time.sleep(self.latencia)
+        return self._crear(success_url)
+
+    def recuperar_sesion(self, sesion_id):
+        with medir('pasarela'):
+            time.sleep(self.latencia)
+        return self._recuperar(sesion_id)
+
+    async def acrear_sesion(self, importe_centimos, descripcion, email, success_url, cancel_url, metadata=None):
+        with medir('pasarela'):
+            await asyncio.sleep(self.latencia)
+        return self._crear(success_url)
+
+    async def arecuperar_sesion(self, sesion_id):
+        with medir('pasarela'):
+            await asyncio.sleep(self.latencia)
+        return self._recuperar(sesion_id)
+
+
+def pasarela_falsa_permitida():
+    # El entorno de pruebas (setup_test_environment) es el que crea mail.outbox
+    return settings.DEBUG or hasattr(mail, 'outbox')
+
+
+@lru_cache(maxsize=None)
+def _pasarela(ruta):
+    return import_string(ruta)()
+
+
+def obtener_pasarela():
+    """Instancia (compartida) de la pasarela configurada"""
+    return _pasarela(getattr(settings, 'PASARELA_PAGO', 'pedidos.pasarela.PasarelaStripe'))
@@ -0,0 +1,24 @@
+"""
+Mantiene los resúmenes de ventas (pedidos.informes) al cancelar un pedido
+que ya estaba resumido, o al deshacer la cancelación.
+"""
+
+from django.db.models.signals import post_init, post_save
+from django.dispatch import receiver
+
+from .informes import corregir_pedido
+from .models import Pedido
+
+
+@receiver(post_init, sender=Pedido)
+def recordar_estado(sender, instance, **kwargs):
+    # Sin consulta: el estado con el que se leyó (None si se difirió con only/defer)
+    instance._estado_anterior = instance.__dict__.get('estado')
+
+
+@receiver(post_save, sender=Pedido)
+def corregir_resumenes(sender, instance, created, **kwargs):
+    anterior, instance._estado_anterior = instance._estado_anterior, instance.estado
+    if created or anterior is None or (anterior == 'cancelado') == (instance.estado == 'cancelado'):
+        return
+    corregir_pedido(instance, -1 if instance.estado == 'cancelado' else 1)
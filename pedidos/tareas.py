@@ -0,0 +1,28 @@
+"""Tareas de pedidos que se ejecutan fuera de la petición (ver tareas.cola)"""
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.template.loader import render_to_string
+
+from core.models import DatosEmpresa
+from tareas.cola import tarea
+
+from .models import Pedido
+
+
+def mensaje_confirmacion(pedido, datos_empresa):
+    """Asunto y HTML del email de confirmación (lee las líneas del pedido)"""
+    asunto = f'🎉 Confirmación de Pedido PetJoy #{pedido.numero_pedido}'
+    html_content = render_to_string('pedidos/email_confirmacion.html', {
+        'pedido': pedido,
+        'datos_empresa': datos_empresa,
+    })
+    return asunto, html_content
+
+
+@tarea(prioridad=10, max_intentos=5)
+def enviar_confirmacion(pedido_id):
+    """Email de confirmación del pedido al cliente; si el SMTP falla se reintenta"""
+    pedido = Pedido.objects.prefetch_related('items').get(pk=pedido_id)
+    asunto, html_content = mensaje_confirmacion(pedido, DatosEmpresa.get_datos())
+    send_mail(asunto, '', settings.DEFAULT_FROM_EMAIL, [pedido.email_cliente], html_message=html_content)
@@ -1,3 +1,358 @@
-from django.test import TestCase
+import csv
+import json
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core import mail
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core.flujos import iterar_async
+from core.management.commands.benchmark import DATOS_ENVIO
+from core.testing import ConsultasTestCase, crear_catalogo, vistas_async
+from pedidos.abandonos import purgar_sesiones
+from pedidos.checks import comprobar_pasarela
+from pedidos.exportacion import exportar
+from pedidos.informes import actualizar_resumenes
+from pedidos.pasarela import PasarelaFalsa
+from pedidos.models import (
+    CarritoAbandonadoDiario, ItemPedido, MarcaAguaVentas, Pedido, ProductoAbandonadoDiario, VentaDiaria,
+)
+
+
+class PresupuestoConsultasPedidosTests(ConsultasTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.productos = crear_catalogo()
+        cls.cliente = get_user_model().objects.create_user('ana@ejemplo.com', 'ana@ejemplo.com', 'secreta-123')
+        for _ in range(4):
+            pedido = Pedido.objects.create(
+                cliente=cls.cliente, nombre_cliente='Ana', apellidos_cliente='Pérez',
+                email_cliente='ana@ejemplo.com', telefono_cliente='600000000', direccion_envio='Calle 1',
+                ciudad_envio='Madrid', codigo_postal_envio='28001', subtotal=Decimal('30'),
+                total=Decimal('36.30'), metodo_pago='tarjeta',
+            )
+            ItemPedido.objects.bulk_create([
+                ItemPedido(pedido=pedido, producto=producto, nombre_producto=producto.nombre,
+                           cantidad=1, precio_unitario=producto.precio, total=producto.precio)
+                for producto in cls.productos[:5]
+            ])
+        cls.pedido = pedido
+
+    def llenar_carrito(self):
+        for producto in self.productos[:5]:
+            self.client.post(reverse('pedidos:agregar_carrito', args=[producto.id]), {'cantidad': 1})
+
+    def test_ver_carrito(self):
+        self.llenar_carrito()
+        response = self.client.get(reverse('pedidos:carrito'))
+        self.assertEqual(response.status_code, 200)
+        self.assertPresupuestoConsultas(response)
+        self.assertSinNMas1(response)
+
+    def test_carrito_con_vistos(self):
+        self.llenar_carrito()
+        for producto in self.productos[3:11]:
+            self.client.get(reverse('productos:detalle', args=[producto.slug]))
+        response = self.client.get(reverse('pedidos:carrito'))
+        # Los que ya están en el carrito no se repiten en la tira
+        self.assertEqual([p.id for p in response.context['productos_vistos']], [p.id for p in self.productos[10:4:-1]])
+        self.assertPresupuestoConsultas(response)
+        self.assertSinNMas1(response)
+
+    def test_checkout(self):
+        self.llenar_carrito()
+        response = self.client.get(reverse('pedidos:checkout'))
+        self.assertEqual(response.status_code, 200)
+        self.assertPresupuestoConsultas(response)
+        self.assertSinNMas1(response)
+
+    def test_mis_pedidos(self):
+        self.client.force_login(self.cliente)
+        response = self.client.get(reverse('pedidos:mis_pedidos'))
+        self.assertEqual(response.status_code, 200)
+        self.assertPresupuestoConsultas(response)
+        self.assertSinNMas1(response)
+
+    def test_confirmacion(self):
+        response = self.client.get(reverse('pedidos:confirmacion', args=[self.pedido.numero_pedido]))
+        self.assertEqual(response.status_code, 200)
+        self.assertPresupuestoConsultas(response)
+        self.assertSinNMas1(response)
+
+
+@override_settings(PASARELA_PAGO='pedidos.pasarela.PasarelaFalsa')
+class VistasAsyncPedidosTests(ConsultasTestCase):
+    """El carrito y el checkout de pedidos.vistas_async, que solo se enrutan con ASGI"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.enterClassContext(vistas_async())
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.productos = crear_catalogo(productos=3)
+
+    async def test_checkout_hasta_la_confirmacion(self):
+        for producto in self.productos:
+            await self.async_client.post(reverse('pedidos:agregar_carrito', args=[producto.id]), {'cantidad': 2})
+        response = await self.async_client.get(reverse('pedidos:checkout'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.resolver_match.func.__module__, 'pedidos.vistas_async')
+        self.assertPresupuestoConsultas(response)
+        self.assertSinNMas1(response)
+
+        await self.async_client.post(reverse('pedidos:checkout'), DATOS_ENVIO)
+        response = await self.async_client.get(reverse('pedidos:crear_sesion_stripe'), follow=True)
+        self.assertEqual(response.status_code, 200)
+        pedido = await Pedido.objects.aget()
+        self.assertEqual(response.redirect_chain[-1][0], reverse('pedidos:confirmacion', args=[pedido.numero_pedido]))
+        self.assertEqual(await pedido.items.acount(), 3)
+
+
+class PurgaSesionesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.productos = crear_catalogo(productos=2)
+
+    def sesion(self, carrito=None, guardada_hace=timedelta(days=3)):
+        """Sesión guardada hace `guardada_hace` (caducada si es más que SESSION_COOKIE_AGE)"""
+        store = SessionStore()
+        if carrito is not None:
+            store['carrito'] = carrito
+        store.save()
+        edad = timedelta(seconds=settings.SESSION_COOKIE_AGE)
+        Session.objects.filter(session_key=store.session_key).update(
+            expire_date=timezone.now() - guardada_hace + edad,
+        )
+        return store.session_key
+
+    def linea(self, producto, cantidad, talla=''):
+        return {'producto_id': str(producto.id), 'cantidad': cantidad, 'precio': '10.00', 'talla': talla}
+
+    def test_resume_los_carritos_y_borra_por_lotes(self):
+        uno, dos = self.productos
+        for _ in range(3):
+            self.sesion()  # sin carrito: se borra sin contar
+        self.sesion({f'{uno.id}_S': self.linea(uno, 1, 'S'), f'{uno.id}_M': self.linea(uno, 2, 'M')})
+        self.sesion({str(dos.id): self.linea(dos, 1)})
+        viva = self.sesion({str(dos.id): self.linea(dos, 5)}, guardada_hace=timedelta(hours=1))
+
+        self.assertEqual(purgar_sesiones(lote=2, pausa=0), (5, 2))
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), [viva])
+
+        dia = CarritoAbandonadoDiario.objects.get()
+        self.assertEqual(dia.fecha, timezone.localdate(timezone.now() - timedelta(days=3)))
+        self.assertEqual((dia.carritos, dia.unidades, dia.importe), (2, 4, Decimal('40.00')))
+        por_producto = {
+            fila.producto_id: (fila.carritos, fila.unidades, fila.nombre_producto)
+            for fila in ProductoAbandonadoDiario.objects.all()
+        }
+        self.assertEqual(por_producto, {uno.id: (1, 3, uno.nombre), dos.id: (1, 1, dos.nombre)})
+
+    def test_suma_a_lo_ya_resumido(self):
+        producto = self.productos[0]
+        self.sesion({str(producto.id): self.linea(producto, 1)})
+        purgar_sesiones()
+        self.sesion({str(producto.id): self.linea(producto, 2)})
+        salida = StringIO()
+        call_command('purgar_sesiones', stdout=salida)
+        self.assertIn('1 sesiones caducadas borradas (1 con carrito abandonado)', salida.getvalue())
+        fila = ProductoAbandonadoDiario.objects.get()
+        self.assertEqual((fila.carritos, fila.unidades, fila.importe), (2, 3, Decimal('30.00')))
+
+    def test_mirar_la_tienda_no_crea_sesiones(self):
+        self.client.get(reverse('productos:catalogo'))
+        self.client.get(reverse('pedidos:carrito'))
+        self.assertFalse(Session.objects.exists())
+        self.client.post(reverse('pedidos:agregar_carrito', args=[self.productos[0].id]), {'cantidad': 1})
+        self.assertEqual(Session.objects.count(), 1)
+
+
+class ResumenVentasTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.producto = crear_catalogo(productos=1)[0]
+
+    def pedido(self, cantidad=1, hace=timedelta(hours=1), estado='pendiente'):
+        total = Decimal('10.00') * cantidad
+        pedido = Pedido.objects.create(
+            nombre_cliente='Ana', apellidos_cliente='Pérez', email_cliente='ana@ejemplo.com',
+            telefono_cliente='600000000', direccion_envio='Calle 1', ciudad_envio='Madrid',
+            codigo_postal_envio='28001', subtotal=total, impuestos=total * Decimal('0.21'),
+            total=total * Decimal('1.21'), metodo_pago='tarjeta', estado=estado,
+        )
+        ItemPedido.objects.create(
+            pedido=pedido, producto=self.producto, nombre_producto=self.producto.nombre,
+            cantidad=cantidad, precio_unitario=Decimal('10.00'), total=total,
+        )
+        Pedido.objects.filter(pk=pedido.pk).update(fecha_creacion=timezone.now() - hace)
+        return Pedido.objects.get(pk=pedido.pk)
+
+    def totales(self):
+        venta = VentaDiaria.objects.get()
+        return venta.pedidos, venta.unidades, venta.ingresos, venta.impuestos
+
+    def test_incremental_por_lotes(self):
+        for cantidad in (1, 2, 3):
+            self.pedido(cantidad)
+        self.assertEqual(actualizar_resumenes(tamano_lote=2), 3)
+        self.assertEqual(self.totales(), (3, 6, Decimal('60.00'), Decimal('12.60')))
+        self.assertEqual(actualizar_resumenes(), 0)  # nada se cuenta dos veces
+
+        self.pedido(4)
+        self.assertEqual(actualizar_resumenes(), 1)
+        self.assertEqual(self.totales(), (4, 10, Decimal('100.00'), Decimal('21.00')))
+
+    def test_retraso_para_pedidos_aun_sin_confirmar(self):
+        reciente = self.pedido(hace=timedelta(seconds=10))
+        self.assertEqual(actualizar_resumenes(), 0)
+        self.assertIsNone(MarcaAguaVentas.get_marca().fecha_creacion)  # la marca no lo salta
+
+        self.assertEqual(actualizar_resumenes(retraso=timedelta(0)), 1)
+        self.assertEqual(MarcaAguaVentas.get_marca().pedido_id, reciente.id)
+
+    def test_pedidos_cancelados(self):
+        self.pedido(1, estado='cancelado')
+        pedido = self.pedido(2)
+        self.assertEqual(actualizar_resumenes(), 2)  # la marca avanza también sobre el cancelado
+        self.assertEqual(self.totales(), (1, 2, Decimal('20.00'), Decimal('4.20')))
+
+        pedido.estado = 'cancelado'
+        pedido.save()
+        self.assertEqual(self.totales(), (0, 0, Decimal('0.00'), Decimal('0.00')))
+        pedido.estado = 'procesando'
+        pedido.save()
+        self.assertEqual(self.totales(), (1, 2, Decimal('20.00'), Decimal('4.20')))
+
+    def test_pedidos_que_llegan_con_fecha_anterior(self):
+        self.pedido(1)
+        self.assertEqual(actualizar_resumenes(), 1)
+        # Importado o generado después, con una fecha anterior a la del ya resumido
+        atrasado = self.pedido(2, hace=timedelta(hours=2))
+        atrasado.estado = 'cancelado'
+        atrasado.save()  # aún no está resumido: no hay nada que restar
+        self.assertEqual(self.totales(), (1, 1, Decimal('10.00'), Decimal('2.10')))
+        atrasado.estado = 'procesando'
+        atrasado.save()
+        self.assertEqual(actualizar_resumenes(), 1)
+        self.assertEqual(self.totales(), (2, 3, Decimal('30.00'), Decimal('6.30')))
+        self.assertEqual(actualizar_resumenes(reconstruir=True), 2)
+        self.assertEqual(self.totales(), (2, 3, Decimal('30.00'), Decimal('6.30')))
+
+    def test_informe_con_fechas_no_validas(self):
+        personal = get_user_model().objects.create_user('staff@ejemplo.com', 'staff@ejemplo.com', 'x', is_staff=True)
+        self.client.force_login(personal)
+        response = self.client.get(reverse('pedidos:informe_ventas'), {'desde': '2024-13-45', 'hasta': 'ayer'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['hasta'], timezone.localdate())
+
+
+class ExportacionPedidosTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        productos = crear_catalogo(productos=2)
+        cls.pedidos = []
+        for cantidades, estado in (((1, 2), 'pendiente'), ((), 'pendiente'), ((3,), 'enviado')):
+            pedido = Pedido.objects.create(
+                nombre_cliente='Ana', apellidos_cliente='Pérez', email_cliente='ana@ejemplo.com',
+                telefono_cliente='600000000', direccion_envio='Calle 1', ciudad_envio='Madrid',
+                codigo_postal_envio='28001', subtotal=Decimal('10'), total=Decimal('12.10'),
+                metodo_pago='tarjeta', estado=estado,
+            )
+            ItemPedido.objects.bulk_create([
+                ItemPedido(pedido=pedido, producto=producto, nombre_producto=producto.nombre,
+                           cantidad=cantidad, precio_unitario=Decimal('10'), total=Decimal('10') * cantidad)
+                for producto, cantidad in zip(productos, cantidades)
+            ])
+            cls.pedidos.append(pedido)
+        cls.personal = get_user_model().objects.create_user(
+            'staff@ejemplo.com', 'staff@ejemplo.com', 'x', is_staff=True,
+        )
+
+    def filas_csv(self, texto):
+        filas = list(csv.DictReader(texto.splitlines()))
+        return [(fila['numero_pedido'], fila['item_cantidad']) for fila in filas]
+
+    def test_csv_una_fila_por_linea(self):
+        texto = ''.join(exportar(Pedido.objects.all(), 'csv', chunk_size=1))
+        uno, vacio, tres = (pedido.numero_pedido for pedido in self.pedidos)
+        # El pedido sin líneas sale con las columnas de item vacías y no descoloca a los demás
+        self.assertEqual(self.filas_csv(texto), [(uno, '1'), (uno, '2'), (vacio, ''), (tres, '3')])
+
+    def test_jsonl_con_items_anidados(self):
+        lineas = [json.loads(linea) for linea in exportar(Pedido.objects.all(), 'jsonl', chunk_size=1)]
+        self.assertEqual([len(pedido['items']) for pedido in lineas], [2, 0, 1])
+        self.assertEqual(lineas[0]['subtotal'], '10.00')
+        self.assertEqual(lineas[2]['items'][0]['cantidad'], 3)
+
+    @override_settings(VISTAS_ASYNC=False)
+    def test_vista_filtra_y_valida(self):
+        self.client.force_login(self.personal)
+        url = reverse('pedidos:exportar_pedidos')
+        response = self.client.get(url, {'estado': 'enviado', 'desde': '2024-13-45'})
+        self.assertEqual(response.status_code, 200)
+        texto = b''.join(response.streaming_content).decode()
+        self.assertEqual(self.filas_csv(texto), [(self.pedidos[2].numero_pedido, '3')])
+        self.assertEqual(self.client.get(url, {'estado': 'perdido'}).status_code, 400)
+
+    @override_settings(VISTAS_ASYNC=True)
+    async def test_vista_async_no_carga_la_exportacion_en_memoria(self):
+        await self.async_client.aforce_login(self.personal)
+        response = await self.async_client.get(reverse('pedidos:exportar_pedidos'), {'formato': 'jsonl'})
+        self.assertTrue(response.is_async)
+        trozos = [trozo async for trozo in response.streaming_content]
+        self.assertEqual(b''.join(trozos).count(b'\n'), 3)
+
+    async def test_iterar_async_por_lotes(self):
+        trozos = [trozo async for trozo in iterar_async(exportar(Pedido.objects.all(), 'jsonl'), lote=2)]
+        self.assertEqual([trozo.count('\n') for trozo in trozos], [2, 1])
+
+
+@override_settings(PASARELA_PAGO='pedidos.pasarela.PasarelaFalsa')
+class PasarelaFalsaTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.producto = crear_catalogo(productos=1)[0]
+
+    def comprar(self):
+        self.client.post(reverse('pedidos:agregar_carrito', args=[self.producto.id]), {'cantidad': 1, 'talla': 'S'})
+        return self.client.post(reverse('pedidos:checkout'), DATOS_ENVIO)
+
+    def test_solo_da_por_pagadas_sus_sesiones(self):
+        self.comprar()
+        response = self.client.get(reverse('pedidos:pago_exitoso'), {'session_id': 'falsa_inventada'})
+        self.assertRedirects(response, reverse('pedidos:checkout'), fetch_redirect_response=False)
+        self.assertFalse(Pedido.objects.exists())
+
+        self.client.get(reverse('pedidos:crear_sesion_stripe'), follow=True)
+        self.assertEqual(Pedido.objects.count(), 1)
+
+    def fuera_de_pruebas(self):
+        """Quita mail.outbox (la marca del entorno de pruebas) hasta el final del test"""
+        outbox = mail.outbox
+        del mail.outbox
+        self.addCleanup(setattr, mail, 'outbox', outbox)
+
+    @override_settings(DEBUG=False)
+    def test_no_arranca_en_produccion(self):
+        self.fuera_de_pruebas()
+        self.assertEqual([error.id for error in comprobar_pasarela(None)], ['pedidos.E002'])
+        with self.assertRaises(ImproperlyConfigured):
+            PasarelaFalsa()
+        with override_settings(DEBUG=True):
+            self.assertEqual(comprobar_pasarela(None), [])
@@ -1,18 +1,28 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+# Con VISTAS_ASYNC (despliegue ASGI) el carrito y el checkout usan las vistas asíncronas;
+# con WSGI ni siquiera se importan
+if settings.VISTAS_ASYNC:
+    from . import vistas_async as vistas
+else:
+    vistas = views
+
 app_name = 'pedidos'
 
 urlpatterns = [
-    path('carrito/', views.ver_carrito, name='carrito'),
-    path('carrito/agregar/<int:producto_id>/', views.agregar_al_carrito, name='agregar_carrito'),
-    path('carrito/actualizar/<int:producto_id>/', views.actualizar_carrito, name='actualizar_carrito'),
-    path('carrito/eliminar/<int:producto_id>/', views.eliminar_del_carrito, name='eliminar_carrito'),
-    path('checkout/', views.checkout, name='checkout'),
-    path('crear_sesion_stripe/', views.crear_sesion_stripe, name='crear_sesion_stripe'),
-    path('pago_exitoso/', views.pago_exitoso, name='pago_exitoso'),
+    path('carrito/', vistas.ver_carrito, name='carrito'),
+    path('carrito/agregar/<int:producto_id>/', vistas.agregar_al_carrito, name='agregar_carrito'),
+    path('carrito/actualizar/<int:producto_id>/', vistas.actualizar_carrito, name='actualizar_carrito'),
+    path('carrito/eliminar/<int:producto_id>/', vistas.eliminar_del_carrito, name='eliminar_carrito'),
+    path('checkout/', vistas.checkout, name='checkout'),
+    path('crear_sesion_stripe/', vistas.crear_sesion_stripe, name='crear_sesion_stripe'),
+    path('pago_exitoso/', vistas.pago_exitoso, name='pago_exitoso'),
     path('pago_cancelado/', views.pago_cancelado, name='pago_cancelado'),
     path('confirmacion/<str:pedido_id>/', views.confirmacion_pedido, name='confirmacion'),
     path('seguimiento/', views.seguimiento_pedido, name='seguimiento'),
     path('mis-pedidos/', views.mis_pedidos, name='mis_pedidos'),
+    path('informes/ventas/', views.informe_ventas, name='informe_ventas'),
+    path('informes/exportar/', views.exportar_pedidos, name='exportar_pedidos'),
 ]
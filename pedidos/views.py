@@ -1,28 +1,38 @@
-import stripe
-from django.http import JsonResponse
+from django.http import HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.core.mail import send_mail
-from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.template.loader import render_to_string
-from productos.models import Producto
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from datetime import timedelta
+from productos.models import Producto, Categoria
+from productos.vistos import productos_vistos
 from .carrito import Carrito
 from .models import Pedido, ItemPedido
 from .forms import DatosEnvioForm
+from .informes import resumen_ventas
+from .exportacion import FORMATOS, exportar, filtrar_pedidos
+from .pasarela import ErrorPasarela, obtener_pasarela
+from .tareas import enviar_confirmacion
+from core.flujos import contenido_streaming
+from core.metricas import CHECKOUT
+from core.consultas import presupuesto_consultas
+from core.routers import en_primaria
 from core.models import DatosEmpresa
 from django.db import transaction
 
-stripe.api_key = settings.STRIPE_SECRET_KEY
-
+@presupuesto_consultas(10)  # dos de ellas, la tira de vistos recientemente
 def ver_carrito(request):
     """Muestra la página completa de la cesta."""
     carrito_obj = Carrito(request)
-    datos_empresa = DatosEmpresa.get_datos() # Usa el método get_datos del modelo
+    datos_empresa = carrito_obj.datos_empresa # Reutiliza la lectura que hace el propio carrito
     
     context = {
         'carrito': carrito_obj,
-        'datos_empresa': datos_empresa
+        'datos_empresa': datos_empresa,
+        'productos_vistos': productos_vistos(request.session, excluir=carrito_obj.productos_ids()),
     }
     return render(request, 'pedidos/carrito.html', context)
 
@@ -71,6 +81,8 @@ def eliminar_del_carrito(request, producto_id):
     return redirect('pedidos:carrito')
 
 
+@en_primaria
+@presupuesto_consultas(8)
 def checkout(request):
     """
     Captura los datos de envío y contacto. 
@@ -81,7 +93,7 @@ def checkout(request):
     
     if len(carrito) == 0:
         # No se puede ir al checkout con el carrito vacío
-        return redirect('pedidos:detalle_carrito')
+        return redirect('pedidos:carrito')
 
     datos_iniciales = {}
     if request.user.is_authenticated:
@@ -99,6 +111,7 @@ def checkout(request):
     if request.method == 'POST':
         form = DatosEnvioForm(request.POST)
         if form.is_valid():
+            CHECKOUT.inc('checkout')
             # Requisito 2: Guardar datos de envío en la sesión (para compra anónima/rápida)
             request.session['datos_envio_checkout'] = form.cleaned_data
             
@@ -113,6 +126,7 @@ def checkout(request):
     }
     return render(request, 'pedidos/checkout.html', context)
 
+@en_primaria
 def crear_sesion_stripe(request):
     """Crea la sesión de checkout en Stripe y devuelve la URL para redirigir."""
     carrito = Carrito(request)
@@ -123,73 +137,41 @@ def crear_sesion_stripe(request):
 
     # El total se calcula en la clase Carrito
     total_cents = int(carrito.obtener_total_final() * 100)
-    
-    line_items = [{
-        'price_data': {
-            'currency': 'eur', 
-            'product_data': {
-                'name': 'Pedido PetJoy',
-                'description': f'Compra de {len(carrito)} productos.',
-            },
-            'unit_amount': total_cents,
-        },
-        'quantity': 1,
-    }]
 
     try:
-        checkout_session = stripe.checkout.Session.create(
-            payment_method_types=['card'],
-            line_items=line_items,
-            mode='payment',
+        sesion_pago = obtener_pasarela().crear_sesion(
+            importe_centimos=total_cents,
+            descripcion=f'Compra de {len(carrito)} productos.',
+            email=datos_envio['email'],
             # URLs de redireccionamiento
             success_url=request.build_absolute_uri('/pedidos/pago_exitoso/') + '?session_id={CHECKOUT_SESSION_ID}', 
             cancel_url=request.build_absolute_uri('/pedidos/pago_cancelado/'),
-            customer_email=datos_envio['email'],
             metadata={
                 'user_id': request.user.id if request.user.is_authenticated else None,
             }
         )
-        return redirect(checkout_session.url, code=303)
+        CHECKOUT.inc('sesion_pago')
+        return redirect(sesion_pago.url, code=303)
         
     except Exception as e:
         messages.error(request, f"Error al iniciar el pago con Stripe: {e}. Inténtalo de nuevo.")
         return redirect('pedidos:checkout')
 
-def pago_exitoso(request):
+def crear_pedido(carrito, datos_envio, session_id, cliente=None):
     """
-    Verifica el pago, crea el pedido final en DB, envía el email y limpia la sesión.
-    Usa 'confirmacion.html' y 'email_confirmacion.html'.
+    Crea el pedido con sus líneas a partir del carrito, descuenta el stock y
+    encola el email de confirmación, todo en una transacción
     """
-    session_id = request.GET.get('session_id')
-    datos_envio = request.session.get('datos_envio_checkout')
-    
-    if not session_id or not datos_envio:
-        messages.error(request, "Error de sesión. Vuelve a intentar la compra.")
-        return redirect('pedidos:checkout')
-        
-    try:
-        # Verificar la Sesión de Stripe
-        session = stripe.checkout.Session.retrieve(session_id)
-        if session.payment_status != "paid":
-            return redirect('pedidos:pago_cancelado')
-
-        # Generar el Pedido 
-        carrito = Carrito(request)
-        datos_empresa = DatosEmpresa.get_datos()
-        
-        if len(carrito) == 0:
-             messages.info(request, "El pedido ya fue procesado. Revisa tu correo.")
-             return redirect('pedidos:seguimiento')
-
+    with transaction.atomic():
         # Totales del carrito antes de limpiarlo
         subtotal = carrito.obtener_precio_total()
         envio = carrito.obtener_coste_envio()
         impuestos = carrito.obtener_impuestos()
         total = carrito.obtener_total_final()
-        
+    
         # Crear el Objeto Pedido (Registro definitivo)
         pedido = Pedido.objects.create(
-            cliente=request.user if request.user.is_authenticated else None,
+            cliente=cliente,
             nombre_cliente=datos_envio['nombre'],
             apellidos_cliente=datos_envio['apellidos'],
             email_cliente=datos_envio['email'],
@@ -205,7 +187,7 @@ def pago_exitoso(request):
             estado='procesando', 
             notas=f"Stripe Session ID: {session_id}",
         )
-        
+    
         # Crear los Items del Pedido y Actualizar Stock
         for item in carrito:
             ItemPedido.objects.create(
@@ -219,15 +201,41 @@ def pago_exitoso(request):
             )
             producto = item['producto']
             producto.stock -= item['cantidad']
-            producto.save()
-            
-        # Enviar Email de Confirmación
-        asunto = f'🎉 Confirmación de Pedido PetJoy #{pedido.numero_pedido}'
-        html_content = render_to_string('pedidos/email_confirmacion.html', {
-            'pedido': pedido,
-            'datos_empresa': datos_empresa,
-        })
-        send_mail(asunto, '', settings.DEFAULT_FROM_EMAIL, [pedido.email_cliente], html_message=html_content, fail_silently=True)
+            producto.save(update_fields=['stock', 'fecha_actualizacion'])
+        enviar_confirmacion.encolar(pedido.id)
+    return pedido
+
+
+@en_primaria
+def pago_exitoso(request):
+    """
+    Verifica el pago, crea el pedido final en DB (que encola el email) y limpia la sesión.
+    Usa 'confirmacion.html' y 'email_confirmacion.html'.
+    """
+    session_id = request.GET.get('session_id')
+    datos_envio = request.session.get('datos_envio_checkout')
+    
+    if not session_id or not datos_envio:
+        messages.error(request, "Error de sesión. Vuelve a intentar la compra.")
+        return redirect('pedidos:checkout')
+        
+    try:
+        # Verificar la Sesión de Stripe
+        session = obtener_pasarela().recuperar_sesion(session_id)
+        if not session.pagada:
+            return redirect('pedidos:pago_cancelado')
+        CHECKOUT.inc('pagado')
+
+        # Generar el Pedido 
+        carrito = Carrito(request)
+        
+        if len(carrito) == 0:
+             messages.info(request, "El pedido ya fue procesado. Revisa tu correo.")
+             return redirect('pedidos:seguimiento')
+
+        cliente = request.user if request.user.is_authenticated else None
+        pedido = crear_pedido(carrito, datos_envio, session_id, cliente)
+        CHECKOUT.inc('pedido')
         
         # Limpiar Carrito y Datos de Sesión
         request.session['pedido_id_confirmacion'] = pedido.id 
@@ -239,7 +247,7 @@ def pago_exitoso(request):
         # Redirigir a la página de confirmación final
         return redirect('pedidos:confirmacion', pedido_id=pedido.numero_pedido)
 
-    except stripe.error.InvalidRequestError as e:
+    except ErrorPasarela as e:
         messages.error(request, f"Error de Stripe: {e}. El pago no pudo ser verificado.")
         return redirect('pedidos:checkout')
     except Exception as e:
@@ -250,6 +258,7 @@ def pago_cancelado(request):
     """Muestra una página informando que el pago ha sido cancelado."""
     return render(request, 'pedidos/pago_cancelado.html')
 
+@presupuesto_consultas(8)
 def confirmacion_pedido(request, pedido_id):
     """Página de confirmación del pedido. Obtiene el pedido ID de la sesión."""
 
@@ -286,14 +295,68 @@ def seguimiento_pedido(request):
 
 
 @login_required
+@presupuesto_consultas(8)
 def mis_pedidos(request):
     """Lista de pedidos del usuario autenticado"""
-    pedidos = Pedido.objects.filter(cliente=request.user).order_by('-fecha_creacion')
+    pedidos = Pedido.objects.filter(cliente=request.user).prefetch_related('items').order_by('-fecha_creacion')
     context = {
         'pedidos': pedidos,
     }
     return render(request, 'pedidos/mis_pedidos.html', context)
 
+def _fecha(request, nombre):
+    """Fecha de un parámetro GET; None si falta o no es válida"""
+    try:
+        return parse_date(request.GET.get(nombre) or '')
+    except ValueError:  # bien formada pero imposible, como 2024-13-45
+        return None
+
+@staff_member_required
+def informe_ventas(request):
+    """Panel de ventas para el personal. Solo lee los resúmenes diarios."""
+    hasta = _fecha(request, 'hasta') or timezone.localdate()
+    desde = _fecha(request, 'desde') or hasta - timedelta(days=30)
+    
+    resumen = resumen_ventas(desde, hasta)
+    por_categoria = list(resumen['por_categoria'])
+    nombres_categoria = Categoria.objects.in_bulk([fila['categoria_id'] for fila in por_categoria])
+    for fila in por_categoria:
+        categoria = nombres_categoria.get(fila['categoria_id'])
+        fila['categoria'] = categoria.nombre if categoria else 'Sin categoría'
+    metodos_pago = dict(Pedido.METODO_PAGO_CHOICES)
+    por_metodo_pago = list(resumen['por_metodo_pago'])
+    for fila in por_metodo_pago:
+        fila['metodo'] = metodos_pago.get(fila['metodo_pago'], fila['metodo_pago'])
+    
+    context = {
+        'desde': desde,
+        'hasta': hasta,
+        'totales': resumen['totales'],
+        'por_dia': resumen['por_dia'],
+        'por_producto': resumen['por_producto'],
+        'por_categoria': por_categoria,
+        'por_metodo_pago': por_metodo_pago,
+    }
+    return render(request, 'pedidos/informe_ventas.html', context)
+
+@staff_member_required
+def exportar_pedidos(request):
+    """Exporta pedidos y sus líneas en streaming (CSV o JSONL)"""
+    formato = request.GET.get('formato', 'csv')
+    if formato not in FORMATOS:
+        formato = 'csv'
+    estado = request.GET.get('estado') or None
+    if estado is not None and estado not in dict(Pedido.ESTADO_CHOICES):
+        return HttpResponseBadRequest(f'Estado no válido: {estado}')
+    pedidos = filtrar_pedidos(desde=_fecha(request, 'desde'), hasta=_fecha(request, 'hasta'), estado=estado)
+    
+    tipo = 'text/csv' if formato == 'csv' else 'application/x-ndjson'
+    response = StreamingHttpResponse(
+        contenido_streaming(exportar(pedidos, formato)), content_type=f'{tipo}; charset=utf-8',
+    )
+    response['Content-Disposition'] = f'attachment; filename="pedidos.{formato}"'
+    return response
+
 def email_confirmacion(request):
     pedido = get_object_or_404(Pedido, numero_pedido=1)  # Cambiar por un ID válido para pruebas
     datos_empresa = DatosEmpresa.get_datos()
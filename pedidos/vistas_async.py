@@ -0,0 +1,197 @@
+"""
+Versiones asíncronas de las vistas del carrito y del checkout (se usan con
+VISTAS_ASYNC, que activa tienda_online/asgi.py).
+
+Lo que más pesa en el checkout es la espera a la pasarela de pago; aquí esa
+espera no ocupa un hilo del servidor. La creación del pedido sigue siendo
+síncrona (transacción y descuento de stock) y se ejecuta con sync_to_async.
+"""
+
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.http import JsonResponse
+from django.shortcuts import aget_object_or_404, redirect, render
+
+from core.asincrono import preparar_peticion
+from core.consultas import presupuesto_consultas
+from core.metricas import CHECKOUT
+from core.routers import en_primaria
+from productos.models import Producto
+from productos.vistos import productos_vistos
+
+from .carrito import Carrito
+from .forms import DatosEnvioForm
+from .pasarela import ErrorPasarela, obtener_pasarela
+from .views import crear_pedido
+
+
+@presupuesto_consultas(10)  # dos de ellas, la tira de vistos recientemente
+async def ver_carrito(request):
+    """Muestra la página completa de la cesta."""
+    await preparar_peticion(request)
+    carrito_obj = await Carrito.acargar(request)
+
+    context = {
+        'carrito': carrito_obj,
+        'datos_empresa': carrito_obj.datos_empresa,
+        'productos_vistos': await sync_to_async(productos_vistos)(request.session, excluir=carrito_obj.productos_ids()),
+    }
+    return render(request, 'pedidos/carrito.html', context)
+
+
+async def agregar_al_carrito(request, producto_id):
+    """Agregar producto al carrito"""
+    producto = await aget_object_or_404(Producto, id=producto_id)
+    await preparar_peticion(request)
+    carrito = Carrito(request)
+
+    cantidad = int(request.POST.get('cantidad', 1))
+    talla = request.POST.get('talla', '')
+
+    carrito.agregar(producto=producto, cantidad=cantidad, talla=talla)
+    messages.success(request, f'{producto.nombre} añadido al carrito')
+
+    return redirect(request.META.get('HTTP_REFERER', 'productos:catalogo'))
+
+
+async def actualizar_carrito(request, producto_id):
+    """Actualizar cantidad de un producto en el carrito"""
+    producto = await aget_object_or_404(Producto, id=producto_id)
+    await preparar_peticion(request)
+    carrito = Carrito(request)
+
+    cantidad = int(request.POST.get('cantidad', 1))
+    talla = request.POST.get('talla', '')
+
+    if cantidad > 0:
+        carrito.agregar(producto=producto, cantidad=cantidad, talla=talla, actualizar_cantidad=True)
+        messages.success(request, 'Carrito actualizado')
+    else:
+        carrito.eliminar(producto, talla=talla)
+        messages.info(request, 'Producto eliminado del carrito')
+
+    return redirect('pedidos:carrito')
+
+
+async def eliminar_del_carrito(request, producto_id):
+    """Eliminar producto del carrito"""
+    producto = await aget_object_or_404(Producto, id=producto_id)
+    await preparar_peticion(request)
+    carrito = Carrito(request)
+    talla = request.GET.get('talla', '')
+
+    carrito.eliminar(producto, talla=talla)
+    messages.info(request, f'{producto.nombre} eliminado del carrito')
+
+    return redirect('pedidos:carrito')
+
+
+@en_primaria
+@presupuesto_consultas(8)
+async def checkout(request):
+    """Captura los datos de envío y contacto y los guarda en la sesión"""
+    await preparar_peticion(request)
+    carrito = await Carrito.acargar(request)
+
+    if len(carrito) == 0:
+        # No se puede ir al checkout con el carrito vacío
+        return redirect('pedidos:carrito')
+
+    datos_iniciales = {}
+    if request.user.is_authenticated:
+        datos_iniciales = {
+            'nombre': request.user.first_name,
+            'apellidos': request.user.last_name,
+            'email': request.user.email,
+            'telefono': request.user.telefono or '',
+            'direccion': request.user.direccion or '',
+            'ciudad': request.user.ciudad or '',
+            'codigo_postal': request.user.codigo_postal or '',
+        }
+
+    if request.method == 'POST':
+        form = DatosEnvioForm(request.POST)
+        if form.is_valid():
+            CHECKOUT.inc('checkout')
+            request.session['datos_envio_checkout'] = form.cleaned_data
+            return redirect('pedidos:crear_sesion_stripe')
+    else:
+        form = DatosEnvioForm(initial=datos_iniciales)
+
+    context = {
+        'form': form,
+        'carrito': carrito,
+    }
+    return render(request, 'pedidos/checkout.html', context)
+
+
+@en_primaria
+async def crear_sesion_stripe(request):
+    """Crea la sesión de pago sin bloquear un hilo mientras responde la pasarela"""
+    await preparar_peticion(request)
+    carrito = await Carrito.acargar(request)
+    datos_envio = request.session.get('datos_envio_checkout')
+
+    if not datos_envio or len(carrito) == 0:
+        return JsonResponse({'error': 'Faltan datos de envío o el carrito está vacío.'}, status=400)
+
+    total_cents = int(carrito.obtener_total_final() * 100)
+
+    try:
+        sesion_pago = await obtener_pasarela().acrear_sesion(
+            importe_centimos=total_cents,
+            descripcion=f'Compra de {len(carrito)} productos.',
+            email=datos_envio['email'],
+            success_url=request.build_absolute_uri('/pedidos/pago_exitoso/') + '?session_id={CHECKOUT_SESSION_ID}',
+            cancel_url=request.build_absolute_uri('/pedidos/pago_cancelado/'),
+            metadata={
+                'user_id': request.user.id if request.user.is_authenticated else None,
+            }
+        )
+        CHECKOUT.inc('sesion_pago')
+        return redirect(sesion_pago.url, code=303)
+
+    except Exception as e:
+        messages.error(request, f"Error al iniciar el pago con Stripe: {e}. Inténtalo de nuevo.")
+        return redirect('pedidos:checkout')
+
+
+@en_primaria
+async def pago_exitoso(request):
+    """Verifica el pago, crea el pedido (que encola el email) y limpia la sesión"""
+    await preparar_peticion(request)
+    session_id = request.GET.get('session_id')
+    datos_envio = request.session.get('datos_envio_checkout')
+
+    if not session_id or not datos_envio:
+        messages.error(request, "Error de sesión. Vuelve a intentar la compra.")
+        return redirect('pedidos:checkout')
+
+    try:
+        session = await obtener_pasarela().arecuperar_sesion(session_id)
+        if not session.pagada:
+            return redirect('pedidos:pago_cancelado')
+        CHECKOUT.inc('pagado')
+
+        carrito = await Carrito.acargar(request)
+        if len(carrito) == 0:
+            messages.info(request, "El pedido ya fue procesado. Revisa tu correo.")
+            return redirect('pedidos:seguimiento')
+
+        cliente = request.user if request.user.is_authenticated else None
+        pedido = await sync_to_async(crear_pedido)(carrito, datos_envio, session_id, cliente)
+        CHECKOUT.inc('pedido')
+
+        request.session['pedido_id_confirmacion'] = pedido.id
+        del request.session['datos_envio_checkout']
+        carrito.limpiar()
+
+        messages.success(request, f'¡Pedido realizado con éxito! Número de pedido: {pedido.numero_pedido}')
+        return redirect('pedidos:confirmacion', pedido_id=pedido.numero_pedido)
+
+    except ErrorPasarela as e:
+        messages.error(request, f"Error de Stripe: {e}. El pago no pudo ser verificado.")
+        return redirect('pedidos:checkout')
+    except Exception as e:
+        messages.error(request, f"Error inesperado durante la confirmación: {e}")
+        return redirect('pedidos:checkout')
@@ -1,6 +1,11 @@
 """
 Script para personalizar la tienda como PetJoy - Juguetes para Mascotas
 Ejecutar con: python personalizar_petjoy.py
+
+Para cargar catálogos grandes de proveedores usa en su lugar:
+    python manage.py importar_catalogo catalogo.csv
+y para volcar el catálogo actual en el mismo formato:
+    python manage.py exportar_catalogo --salida catalogo.csv
 """
 
 import os
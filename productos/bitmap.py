@@ -0,0 +1,254 @@
+"""
+Índice en memoria (uno por worker) para filtrar el catálogo sin SQL.
+
+Cada producto ocupa una posición según su orden en el catálogo
+(fecha_creacion, id); cada valor de filtro (disponible, categoría, marca,
+género, banda de precio) es un entero de Python usado como conjunto de bits
+de esas posiciones. Una combinación de filtros es un AND de enteros, el total
+es bit_count() y una página son las posiciones más altas que quedan tras
+saltar las anteriores, así que la base de datos solo recibe un id__in con los
+productos de la página.
+
+El índice se mantiene con el registro de cambios CambioProducto, que
+escriben las señales de productos: cada worker lee como mucho cada
+CATALOGO_BITMAP_REFRESCO segundos los cambios posteriores al último que
+aplicó y recarga solo esos productos. Un cambio sin producto (las cargas
+masivas) obliga a reconstruirlo entero. La búsqueda de texto sigue yendo
+por SQL.
+
+Las consultas leen el índice sin cerrojo: construir y aplicar cambios
+preparan un DatosIndice nuevo y lo sustituyen con una sola asignación, así
+que una consulta ve el índice de antes o el de después, nunca uno a medias.
+El índice se construye al arrancar el worker (calentar_indice, desde
+wsgi.py y asgi.py) para que no lo pague la primera petición.
+"""
+
+import logging
+import threading
+import time
+from array import array
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.utils import timezone
+
+from core.consultas import fuera_de_presupuesto
+
+from .facetas import DIMENSIONES, TODAS, clave, seleccion
+
+logger = logging.getLogger('petjoy.catalogo')
+
+CAMPOS = ('id', 'categoria_id', 'marca_id', 'genero', 'precio', 'precio_oferta', 'esta_disponible')
+DISPONIBLES = ('disponible', '1')
+
+
+def registrar_cambio(producto_id):
+    """Apunta en el registro que el producto cambió (None: cambió todo el catálogo)"""
+    from .models import CambioProducto
+
+    cambio = CambioProducto.objects.create(producto_id=producto_id)
+    if producto_id is None or cambio.pk % 1000 == 0:
+        # Los workers que lleven más de un día sin leer se reconstruyen enteros
+        CambioProducto.objects.filter(fecha__lt=timezone.now() - timedelta(days=1)).delete()
+
+
+def _bits(posiciones, tamano):
+    """Entero con los bits de `posiciones` a 1"""
+    mapa = bytearray((tamano + 7) // 8)
+    for posicion in posiciones:
+        mapa[posicion >> 3] |= 1 << (posicion & 7)
+    return int.from_bytes(mapa, 'little')
+
+
+def _mas_altas(bits, saltar, cuantas):
+    """Posiciones de los `cuantas` bits más altos tras saltar los `saltar` primeros"""
+    if saltar:
+        # Menor p con como mucho `saltar` bits por encima: lo que queda debajo es la página
+        bajo, alto = 0, bits.bit_length()
+        while bajo < alto:
+            medio = (bajo + alto) // 2
+            if (bits >> medio).bit_count() <= saltar:
+                alto = medio
+            else:
+                bajo = medio + 1
+        bits &= (1 << bajo) - 1
+    posiciones = []
+    while bits and len(posiciones) < cuantas:
+        posicion = bits.bit_length() - 1
+        posiciones.append(posicion)
+        bits ^= 1 << posicion
+    return posiciones
+
+
+class DatosIndice:
+    """Orden de los productos (ids), su posición por id y los bitsets; no se modifica una vez publicado"""
+
+    def __init__(self, ids=None, posiciones=None, bitsets=None):
+        self.ids = array('q') if ids is None else ids
+        self.posiciones = {} if posiciones is None else posiciones
+        self.bitsets = {} if bitsets is None else bitsets
+
+
+class ResultadoBitmap:
+    """Resultado de un filtro con la interfaz que usa Paginator (count() y cortes)"""
+
+    def __init__(self, datos, bits, queryset):
+        self.datos = datos
+        self.bits = bits
+        self.queryset = queryset
+        self._total = bits.bit_count()
+
+    def count(self):
+        return self._total
+
+    def __len__(self):
+        return self._total
+
+    def ids(self, inicio, fin):
+        posiciones = _mas_altas(self.bits, inicio, max(fin - inicio, 0))
+        return [self.datos.ids[posicion] for posicion in posiciones]
+
+    def __getitem__(self, corte):
+        if not isinstance(corte, slice):
+            raise TypeError('ResultadoBitmap solo admite cortes')
+        inicio, fin, _ = corte.indices(self._total)
+        ids = self.ids(inicio, fin)
+        productos = self.queryset.in_bulk(ids)
+        return [productos[id_] for id_ in ids if id_ in productos]
+
+
+class IndiceBitmap:
+
+    def __init__(self):
+        self.cerrojo = threading.Lock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        """Descarta el índice; se reconstruye en la siguiente consulta"""
+        self.construido = False
+        self.datos = DatosIndice()
+        self.ultimo_cambio = 0
+        self.revisado = 0.0
+
+    @property
+    def ids(self):
+        return self.datos.ids
+
+    @property
+    def bitsets(self):
+        return self.datos.bitsets
+
+    # Construcción y mantenimiento
+
+    def construir(self):
+        from .models import CambioProducto, Producto
+
+        # Se hace una vez por worker (o tras una carga masiva), no por petición:
+        # no cuenta en el presupuesto de consultas de la vista que la provoca
+        with fuera_de_presupuesto():
+            # El último cambio se lee antes que los productos: lo que cambie en medio se reaplica
+            ultimo_cambio = CambioProducto.objects.order_by('-id').values_list('id', flat=True).first() or 0
+            filas = Producto.objects.order_by('fecha_creacion', 'id').values_list(*CAMPOS)
+            ids, posiciones, por_valor = array('q'), {}, {}
+            for posicion, (id_, *campos) in enumerate(filas.iterator(chunk_size=5000)):
+                ids.append(id_)
+                posiciones[id_] = posicion
+                for clave_bitset in self._claves(*campos):
+                    por_valor.setdefault(clave_bitset, []).append(posicion)
+        bitsets = {clave_bitset: _bits(lista, len(ids)) for clave_bitset, lista in por_valor.items()}
+        self.datos = DatosIndice(ids, posiciones, bitsets)
+        self.ultimo_cambio = ultimo_cambio
+        self.construido = True
+
+    @staticmethod
+    def _claves(categoria_id, marca_id, genero, precio, precio_oferta, esta_disponible):
+        """Bitsets en los que está un producto (ninguno si no está disponible)"""
+        fina = clave(categoria_id, marca_id, genero, precio, precio_oferta, esta_disponible)
+        return [DISPONIBLES, *zip(DIMENSIONES, fina)] if fina else []
+
+    def aplicar_cambios(self, producto_ids):
+        from .models import Producto
+
+        actual = self.datos
+        filas = {fila[0]: fila[1:] for fila in Producto.objects.filter(id__in=producto_ids).values_list(*CAMPOS)}
+        # Se quitan de todos los bitsets y se vuelven a poner con sus valores actuales
+        mascara = _bits([actual.posiciones[id_] for id_ in producto_ids if id_ in actual.posiciones], len(actual.ids))
+        bitsets = {clave_bitset: bits & ~mascara for clave_bitset, bits in actual.bitsets.items()}
+        ids, posiciones = actual.ids, actual.posiciones
+        if any(id_ not in posiciones for id_ in filas):
+            ids, posiciones = array('q', ids), dict(posiciones)
+        for id_ in sorted(producto_ids):
+            if id_ not in filas:
+                continue  # borrado: ya no está en ningún bitset
+            posicion = posiciones.get(id_)
+            if posicion is None:
+                # Producto nuevo: es el más reciente, va en la posición más alta
+                posicion = posiciones[id_] = len(ids)
+                ids.append(id_)
+            for clave_bitset in self._claves(*filas[id_]):
+                bitsets[clave_bitset] = bitsets.get(clave_bitset, 0) | (1 << posicion)
+        self.datos = DatosIndice(ids, posiciones, bitsets)
+
+    def refrescar(self):
+        """Aplica el registro de cambios si ha pasado el intervalo de refresco"""
+        intervalo = getattr(settings, 'CATALOGO_BITMAP_REFRESCO', 1)
+        if self.construido and time.monotonic() - self.revisado < intervalo:
+            return
+        from .models import CambioProducto
+
+        with self.cerrojo:
+            if not self.construido:
+                self.construir()
+            else:
+                # Se lee también el último cambio aplicado: si ya no está, el registro
+                # se ha podado (o se deshizo una transacción) y hay que reconstruir
+                cambios = list(
+                    CambioProducto.objects.filter(id__gte=self.ultimo_cambio).order_by('id').values_list('id', 'producto_id')
+                )
+                if self.ultimo_cambio and (not cambios or cambios[0][0] != self.ultimo_cambio):
+                    self.construir()
+                else:
+                    cambios = [cambio for cambio in cambios if cambio[0] != self.ultimo_cambio]
+                    if any(producto_id is None for _, producto_id in cambios):
+                        self.construir()
+                    elif cambios:
+                        self.aplicar_cambios({producto_id for _, producto_id in cambios})
+                        self.ultimo_cambio = cambios[-1][0]
+            self.revisado = time.monotonic()
+
+    # Consultas
+
+    def filtrar(self, parametros, queryset):
+        """ResultadoBitmap con los productos disponibles que cumplen los filtros de `parametros`"""
+        self.refrescar()
+        datos = self.datos
+        elegida = seleccion(parametros)
+        bits = datos.bitsets.get(DISPONIBLES, 0)
+        for dimension in DIMENSIONES:
+            if elegida[dimension] != TODAS:
+                bits &= datos.bitsets.get((dimension, elegida[dimension]), 0)
+        return ResultadoBitmap(datos, bits, queryset)
+
+
+indice_catalogo = IndiceBitmap()
+
+
+def calentar_indice():
+    """Construye el índice al cargar la aplicación del worker; si falla, se hará en la primera consulta"""
+    if not getattr(settings, 'CATALOGO_BITMAP', False):
+        return
+    try:
+        indice_catalogo.refrescar()
+    except DatabaseError:
+        logger.exception('No se pudo construir el índice del catálogo al arrancar')
+    finally:
+        # Con --preload el worker se bifurca después: que no herede la conexión
+        connections.close_all()
+
+
+def filtrar_con_bitmap(parametros, queryset):
+    """ResultadoBitmap para el catálogo, o None si hay que ir por SQL (búsqueda o desactivado)"""
+    if not getattr(settings, 'CATALOGO_BITMAP', False) or parametros.get('q'):
+        return None
+    return indice_catalogo.filtrar(parametros, queryset)
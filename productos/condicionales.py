@@ -0,0 +1,92 @@
+"""
+Respuestas condicionales (ETag / Last-Modified) para las páginas del catálogo.
+
+Antes de ejecutar la vista se lanza una sola consulta agregada sobre
+Producto.fecha_actualizacion, con la última modificación de categorías y
+marcas (salen en la barra lateral de todas las páginas) como subconsultas; si
+el navegador o la CDN ya tienen esa versión se responde 304 sin renderizar.
+La página también depende de quién la pide (carrito, productos vistos,
+usuario, token CSRF), así que eso entra en el ETag, y con mensajes
+pendientes no se responde 304 para no perderlos.
+"""
+
+import hashlib
+
+from django.contrib.messages import get_messages
+from django.db.models import Count, F, Func, Max, Q, Subquery
+
+from .models import Categoria, Marca, Producto
+from .vistos import CLAVE_SESION as VISTOS
+
+
+def _ultima_de(modelo):
+    """Subconsulta escalar con la última modificación de toda la tabla"""
+    return Subquery(modelo.objects.order_by().values(ultima=Func(F('fecha_actualizacion'), function='MAX')))
+
+
+def _marca(request, filtro):
+    """(última modificación, número de productos) del conjunto, calculado una vez por petición"""
+    if not hasattr(request, '_marca_catalogo'):
+        marca = Producto.objects.filter(filtro).aggregate(
+            ultima=Max('fecha_actualizacion'), total=Count('id'),
+            categorias=Max(_ultima_de(Categoria)), marcas=Max(_ultima_de(Marca)),
+        )
+        if marca['ultima'] is not None:
+            marca['ultima'] = max(fecha for fecha in (marca['ultima'], marca['categorias'], marca['marcas']) if fecha)
+        request._marca_catalogo = marca
+    return request._marca_catalogo
+
+
+def _filtro_detalle(slug):
+    # El producto y sus relacionados (los de su categoría)
+    return Q(slug=slug) | Q(categoria__in=Producto.objects.filter(slug=slug).values('categoria'))
+
+
+def _filtro_categoria(categoria_id):
+    return Q(categoria_id=categoria_id, esta_disponible=True)
+
+
+def estado_visitante(request):
+    """Huella de lo personal que pinta la página, o None si hay mensajes pendientes"""
+    if len(get_messages(request)):  # sin iterar, que los daría por leídos
+        return None
+    partes = [
+        str(request.user.pk or ''),
+        repr(sorted(request.session.get('carrito', {}).items())),
+        repr(request.session.get(VISTOS, [])),
+        request.COOKIES.get('csrftoken', ''),
+    ]
+    return hashlib.sha1('|'.join(partes).encode()).hexdigest()[:16]
+
+
+def _etag(request, filtro):
+    marca = _marca(request, filtro)
+    visitante = estado_visitante(request)
+    if marca['ultima'] is None or visitante is None:
+        return None
+    return f"{marca['ultima'].timestamp():.6f}-{marca['total']}-{visitante}"
+
+
+def _ultima_modificacion(request, filtro):
+    # Sin estado personal en juego (anónimo, sin carrito ni vistos) basta con la fecha
+    if request.user.is_authenticated or request.session.get('carrito') or request.session.get(VISTOS):
+        return None
+    if estado_visitante(request) is None:
+        return None
+    return _marca(request, filtro)['ultima']
+
+
+def etag_detalle(request, slug):
+    return _etag(request, _filtro_detalle(slug))
+
+
+def ultima_modificacion_detalle(request, slug):
+    return _ultima_modificacion(request, _filtro_detalle(slug))
+
+
+def etag_categoria(request, categoria_id):
+    return _etag(request, _filtro_categoria(categoria_id))
+
+
+def ultima_modificacion_categoria(request, categoria_id):
+    return _ultima_modificacion(request, _filtro_categoria(categoria_id))
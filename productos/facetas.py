@@ -0,0 +1,199 @@
+"""
+Recuentos de la barra lateral del catálogo ("Juguetes para Gatos (312)").
+
+ConteoFaceta guarda un cubo de recuentos de productos disponibles por
+categoría, marca, género y banda de precio, donde cada dimensión puede valer
+TODAS. Cada producto suma 1 en las 16 celdas que le corresponden (su valor o
+TODAS en cada dimensión), así que el número de productos para cualquier
+combinación de filtros es una sola fila.
+
+Los recuentos de una faceta se calculan con el resto de filtros aplicados
+(si hay marca elegida, cada categoría cuenta solo esa marca), y las cuatro
+facetas salen de una única consulta por índice. Con búsqueda de texto no hay
+cubo que valga: se agrupa en vivo el resultado de la búsqueda.
+
+Las señales de productos.signals mantienen el cubo al guardar o borrar
+productos; las cargas masivas (generar_datos, importar_catalogo) lo
+recalculan entero con recalcular_facetas(). Todo ello lee y escribe en la
+primaria: la réplica (core.routers) puede ir por detrás de lo que se cuenta.
+"""
+
+from collections import Counter
+from decimal import Decimal
+from itertools import product as combinaciones
+
+from django.apps import apps as global_apps
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Case, Count, F, IntegerField, Q, Value, When
+
+TODAS = '*'
+DIMENSIONES = ('categoria', 'marca', 'genero', 'precio')
+
+# (desde, hasta) en euros sobre el precio final (con oferta); hasta=None es "o más"
+BANDAS_PRECIO = [
+    (Decimal('0'), Decimal('10')),
+    (Decimal('10'), Decimal('20')),
+    (Decimal('20'), Decimal('50')),
+    (Decimal('50'), Decimal('100')),
+    (Decimal('100'), None),
+]
+
+
+def nombre_banda(indice):
+    desde, hasta = BANDAS_PRECIO[indice]
+    return f'Más de {desde:.0f}€' if hasta is None else f'{desde:.0f}€ - {hasta:.0f}€'
+
+
+def precio_final():
+    """Expresión SQL equivalente a Producto.precio_actual()"""
+    return Case(When(precio_oferta__lt=F('precio'), then=F('precio_oferta')), default=F('precio'))
+
+
+def banda_precio():
+    """Expresión SQL con el índice de BANDAS_PRECIO del producto"""
+    return Case(
+        *[When(precio_final__lt=hasta, then=Value(indice)) for indice, (_, hasta) in enumerate(BANDAS_PRECIO) if hasta],
+        default=Value(len(BANDAS_PRECIO) - 1),
+        output_field=IntegerField(),
+    )
+
+
+def filtro_banda(indice):
+    """Q sobre la anotación precio_final para la banda `indice`"""
+    desde, hasta = BANDAS_PRECIO[indice]
+    filtro = Q(precio_final__gte=desde)
+    if hasta is not None:
+        filtro &= Q(precio_final__lt=hasta)
+    return filtro
+
+
+def banda_de(precio):
+    for indice, (_, hasta) in enumerate(BANDAS_PRECIO):
+        if hasta is None or precio < hasta:
+            return indice
+
+
+def clave(categoria_id, marca_id, genero, precio, precio_oferta=None, esta_disponible=True):
+    """Celda más fina del cubo para un producto, o None si no cuenta (no disponible)"""
+    if not esta_disponible:
+        return None
+    if precio_oferta is not None and precio_oferta < precio:
+        precio = precio_oferta
+    return (str(categoria_id or ''), str(marca_id or ''), genero or '', str(banda_de(Decimal(precio))))
+
+
+def clave_producto(producto):
+    return clave(
+        producto.categoria_id, producto.marca_id, producto.genero,
+        producto.precio, producto.precio_oferta, producto.esta_disponible,
+    )
+
+
+def celdas(clave_fina):
+    """Las 16 celdas del cubo a las que suma una celda fina"""
+    return combinaciones(*[(valor, TODAS) for valor in clave_fina])
+
+
+def aplicar(clave_fina, delta, using=DEFAULT_DB_ALIAS):
+    """
+    Suma `delta` productos a todas las celdas de `clave_fina`.
+
+    Es SQL directo, así que no pasa por el router: `using` es la conexión
+    en la que se guardó el producto, para ir en su misma transacción.
+    """
+    if clave_fina is None:
+        return
+    from .models import ConteoFaceta
+
+    conexion = connections[using]
+    tabla = conexion.ops.quote_name(ConteoFaceta._meta.db_table)
+    with conexion.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {tabla} (categoria, marca, genero, precio, total) VALUES (%s, %s, %s, %s, %s) '
+            f'ON CONFLICT (categoria, marca, genero, precio) DO UPDATE SET total = {tabla}.total + excluded.total',
+            [(*celda, delta) for celda in celdas(clave_fina)],
+        )
+
+
+def _agrupar(productos):
+    """Recuento por celda fina de un queryset de productos disponibles"""
+    filas = (
+        productos.order_by()
+        .annotate(precio_final=precio_final()).annotate(banda=banda_precio())
+        .values_list('categoria_id', 'marca_id', 'genero', 'banda')
+        .annotate(total=Count('id'))
+    )
+    return [((str(c or ''), str(m or ''), g or '', str(b)), total) for c, m, g, b, total in filas]
+
+
+def _expandir(finas):
+    """Cubo completo {celda: total} a partir de los recuentos por celda fina"""
+    cubo = Counter()
+    for clave_fina, total in finas:
+        for celda in celdas(clave_fina):
+            cubo[celda] += total
+    return cubo
+
+
+def recalcular_facetas(apps=global_apps):
+    """
+    Reconstruye ConteoFaceta desde cero (tras cargas masivas que no lanzan
+    señales). `apps` permite usarla desde una migración.
+    """
+    Producto = apps.get_model('productos', 'Producto')
+    ConteoFaceta = apps.get_model('productos', 'ConteoFaceta')
+
+    cubo = _expandir(_agrupar(Producto.objects.using(DEFAULT_DB_ALIAS).filter(esta_disponible=True)))
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        ConteoFaceta.objects.using(DEFAULT_DB_ALIAS).all().delete()
+        ConteoFaceta.objects.using(DEFAULT_DB_ALIAS).bulk_create(
+            [ConteoFaceta(categoria=c, marca=m, genero=g, precio=p, total=total) for (c, m, g, p), total in cubo.items()],
+            batch_size=2000,
+        )
+    return len(cubo)
+
+
+def seleccion(parametros):
+    """Valor elegido en cada dimensión según la query string (TODAS si no hay o no es válido)"""
+    elegida = {}
+    for dimension in DIMENSIONES:
+        valor = (parametros.get(dimension) or '').strip()
+        if dimension in ('categoria', 'marca', 'precio') and not valor.isdigit():
+            valor = TODAS
+        if dimension == 'precio' and valor != TODAS and int(valor) >= len(BANDAS_PRECIO):
+            valor = TODAS
+        elegida[dimension] = valor or TODAS
+    return elegida
+
+
+def _consulta_cubo(elegida):
+    """Filas del cubo necesarias para las cuatro facetas: una consulta, un índice por faceta"""
+    from .models import ConteoFaceta
+
+    condiciones = Q()
+    for dimension in DIMENSIONES:
+        condiciones |= Q(**{otra: elegida[otra] for otra in DIMENSIONES if otra != dimension})
+    filas = ConteoFaceta.objects.filter(condiciones, total__gt=0).values_list(*DIMENSIONES, 'total')
+    return {tuple(fila[:4]): fila[4] for fila in filas}
+
+
+def calcular_facetas(parametros, busqueda=None):
+    """
+    Recuentos por faceta con los filtros de `parametros` aplicados.
+
+    Devuelve {'categoria': {valor: n}, 'marca': {...}, 'genero': {...},
+    'precio': {...}, 'total': n}. `busqueda` es el queryset de productos
+    disponibles que casan con la búsqueda de texto, si la hay.
+    """
+    elegida = seleccion(parametros)
+    cubo = _expandir(_agrupar(busqueda)) if busqueda is not None else _consulta_cubo(elegida)
+
+    facetas = {dimension: {} for dimension in DIMENSIONES}
+    for celda, total in cubo.items():
+        valores = dict(zip(DIMENSIONES, celda))
+        for dimension in DIMENSIONES:
+            resto = all(valores[otra] == elegida[otra] for otra in DIMENSIONES if otra != dimension)
+            if resto and valores[dimension] != TODAS and total > 0:
+                facetas[dimension][valores[dimension]] = total
+    facetas['total'] = cubo.get(tuple(elegida[dimension] for dimension in DIMENSIONES), 0)
+    return facetas
@@ -0,0 +1,260 @@
+"""
+Importación y exportación masiva del catálogo en CSV o JSONL.
+
+Las filas se leen en streaming y se guardan por lotes: categorías y marcas
+con bulk_create(ignore_conflicts=True), productos y tallas con
+bulk_create(update_conflicts=True). El slug es la clave de importación: una
+fila con slug actualiza ese producto, así que reimportar un fichero
+exportado (que los lleva todos) no duplica nada; un slug explícito tiene que
+ser válido tal cual (letras, números, guiones), sin normalizarlo, para que
+una reimportación encuentre su producto. Una fila sin slug es un
+producto nuevo y su slug, derivado del nombre, nunca coincide con uno que
+ya exista ni con uno explícito del mismo lote.
+"""
+
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_slug
+from django.db import transaction
+from django.utils.text import slugify
+
+from core.flujos import Eco
+
+from .bitmap import registrar_cambio
+from .facetas import recalcular_facetas
+from .models import Categoria, Marca, Producto, TallaProducto
+
+FORMATOS = ('csv', 'jsonl')
+
+CAMPOS = [
+    'nombre', 'slug', 'descripcion', 'precio', 'precio_oferta', 'categoria', 'marca',
+    'genero', 'color', 'material', 'stock', 'esta_disponible', 'es_destacado', 'tallas',
+]
+
+CAMPOS_ACTUALIZABLES = [
+    'nombre', 'descripcion', 'precio', 'precio_oferta', 'categoria', 'marca', 'genero',
+    'color', 'material', 'stock', 'esta_disponible', 'es_destacado', 'fecha_actualizacion',
+]
+
+VERDADEROS = {'1', 'true', 'si', 'sí', 'yes', 'x'}
+
+MAX_SLUG = Producto._meta.get_field('slug').max_length
+
+
+class ErrorImportacion(ValueError):
+    """Fila del catálogo que no se puede interpretar"""
+
+
+
+def formato_de(ruta):
+    """Deduce el formato a partir de la extensión del fichero"""
+    return 'jsonl' if str(ruta).endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def leer_filas(fichero, formato):
+    """Genera diccionarios de fila sin cargar el fichero completo"""
+    if formato == 'jsonl':
+        for numero, linea in enumerate(fichero, start=1):
+            if linea.strip():
+                try:
+                    fila = json.loads(linea)
+                except json.JSONDecodeError as e:
+                    raise ErrorImportacion(f'Línea {numero}: JSON no válido ({e})')
+                if not isinstance(fila, dict):
+                    raise ErrorImportacion(f'Línea {numero}: se esperaba un objeto')
+                yield fila
+    else:
+        yield from csv.DictReader(fichero)
+
+
+def _texto(fila, campo):
+    valor = fila.get(campo)
+    return '' if valor is None else str(valor).strip()
+
+
+def _decimal(fila, campo, obligatorio=False):
+    valor = _texto(fila, campo)
+    if not valor:
+        if obligatorio:
+            raise ErrorImportacion(f"Falta '{campo}' en la fila {fila!r}")
+        return None
+    try:
+        return Decimal(valor.replace(',', '.'))
+    except InvalidOperation:
+        raise ErrorImportacion(f"Valor no numérico en '{campo}': {valor!r}")
+
+
+def _booleano(fila, campo, defecto):
+    valor = fila.get(campo)
+    if valor is None or valor == '':
+        return defecto
+    if isinstance(valor, bool):
+        return valor
+    return str(valor).strip().lower() in VERDADEROS
+
+
+def _tallas(valor):
+    """Admite 'S:10|M:5' (CSV) o {'S': 10, 'M': 5} (JSONL)"""
+    if isinstance(valor, dict):
+        return {str(talla): int(stock) for talla, stock in valor.items()}
+    tallas = {}
+    for parte in str(valor or '').split('|'):
+        if parte.strip():
+            talla, _, stock = parte.partition(':')
+            tallas[talla.strip()] = int(stock or 0)
+    return tallas
+
+
+def _serializar_tallas(tallas, formato):
+    if formato == 'jsonl':
+        return {talla.talla: talla.stock for talla in tallas}
+    return '|'.join(f'{talla.talla}:{talla.stock}' for talla in tallas)
+
+
+class ImportadorCatalogo:
+    """Aplica filas de catálogo a la BD por lotes"""
+
+    def __init__(self, tamano_lote=1000):
+        self.tamano_lote = tamano_lote
+        self.categorias = dict(Categoria.objects.values_list('nombre', 'id'))
+        self.marcas = dict(Marca.objects.values_list('nombre', 'id'))
+        # Slugs con dueño (los de la BD y los usados en esta importación) y,
+        # de ellos, los derivados para filas sin slug
+        self.ocupados = set(Producto.objects.values_list('slug', flat=True))
+        self.slugs_derivados = set()
+        self.filas = 0
+        self.tallas = 0
+
+    def importar(self, filas):
+        lote = []
+        for fila in filas:
+            lote.append(fila)
+            if len(lote) >= self.tamano_lote:
+                self._guardar_lote(lote)
+                lote = []
+        if lote:
+            self._guardar_lote(lote)
+        # bulk_create no lanza las señales que mantienen las facetas ni el índice del catálogo
+        recalcular_facetas()
+        registrar_cambio(None)
+
+    def _resolver_slugs(self, lote):
+        """Slug de cada fila del lote: el explícito, o uno nuevo derivado del nombre"""
+        explicitos = [_texto(fila, 'slug') for fila in lote]
+        for slug in filter(None, explicitos):
+            try:
+                validate_slug(slug)
+            except ValidationError:
+                raise ErrorImportacion(f"Slug no válido: {slug!r} (solo letras, números, guiones y guiones bajos)")
+            if len(slug) > MAX_SLUG:
+                raise ErrorImportacion(f"Slug de más de {MAX_SLUG} caracteres: {slug!r}")
+            if slug in self.slugs_derivados:
+                raise ErrorImportacion(f"El slug '{slug}' ya se asignó a un producto nuevo de esta importación")
+        self.ocupados.update(filter(None, explicitos))
+        return [slug or self._derivar_slug(fila) for slug, fila in zip(explicitos, lote)]
+
+    def _derivar_slug(self, fila):
+        base = slugify(_texto(fila, 'nombre'))[:MAX_SLUG] or 'producto'
+        slug, sufijo = base, 2
+        while slug in self.ocupados:
+            extra = f'-{sufijo}'
+            slug = f'{base[:MAX_SLUG - len(extra)]}{extra}'
+            sufijo += 1
+        self.ocupados.add(slug)
+        self.slugs_derivados.add(slug)
+        return slug
+
+    def _asegurar(self, modelo, cache, nombres):
+        """Crea las categorías o marcas que falten y actualiza la caché nombre -> id"""
+        nuevos = {nombre for nombre in nombres if nombre and nombre not in cache}
+        if nuevos:
+            modelo.objects.bulk_create([modelo(nombre=nombre) for nombre in nuevos], ignore_conflicts=True)
+            cache.update(modelo.objects.filter(nombre__in=nuevos).values_list('nombre', 'id'))
+
+    def _guardar_lote(self, lote):
+        with transaction.atomic():
+            self._asegurar(Categoria, self.categorias, {_texto(fila, 'categoria') for fila in lote})
+            self._asegurar(Marca, self.marcas, {_texto(fila, 'marca') for fila in lote})
+
+            # Un mismo slug repetido en el lote se queda con la última fila
+            productos, tallas = {}, {}
+            for fila, slug in zip(lote, self._resolver_slugs(lote)):
+                productos[slug] = Producto(
+                    slug=slug,
+                    nombre=_texto(fila, 'nombre'),
+                    descripcion=_texto(fila, 'descripcion'),
+                    precio=_decimal(fila, 'precio', obligatorio=True),
+                    precio_oferta=_decimal(fila, 'precio_oferta'),
+                    categoria_id=self.categorias.get(_texto(fila, 'categoria')),
+                    marca_id=self.marcas.get(_texto(fila, 'marca')),
+                    genero=_texto(fila, 'genero'),
+                    color=_texto(fila, 'color'),
+                    material=_texto(fila, 'material'),
+                    stock=int(_texto(fila, 'stock') or 0),
+                    esta_disponible=_booleano(fila, 'esta_disponible', True),
+                    es_destacado=_booleano(fila, 'es_destacado', False),
+                )
+                tallas[slug] = _tallas(fila.get('tallas'))
+
+            Producto.objects.bulk_create(
+                productos.values(),
+                update_conflicts=True,
+                unique_fields=['slug'],
+                update_fields=CAMPOS_ACTUALIZABLES,
+            )
+
+            ids = dict(Producto.objects.filter(slug__in=tallas).values_list('slug', 'id'))
+            filas_tallas = [
+                TallaProducto(producto_id=ids[slug], talla=talla, stock=stock)
+                for slug, por_talla in tallas.items()
+                for talla, stock in por_talla.items()
+            ]
+            TallaProducto.objects.bulk_create(
+                filas_tallas,
+                update_conflicts=True,
+                unique_fields=['producto', 'talla'],
+                update_fields=['stock'],
+            )
+
+        self.filas += len(lote)
+        self.tallas += len(filas_tallas)
+
+
+def exportar_catalogo(formato='csv', chunk_size=2000):
+    """Genera el catálogo completo como líneas de texto en el formato de importación"""
+    productos = (
+        Producto.objects.select_related('categoria', 'marca')
+        .prefetch_related('tallas')
+        .order_by('id')
+        .iterator(chunk_size=chunk_size)
+    )
+    if formato == 'csv':
+        escritor = csv.writer(Eco())
+        yield escritor.writerow(CAMPOS)
+
+    for producto in productos:
+        fila = {
+            'nombre': producto.nombre,
+            'slug': producto.slug,
+            'descripcion': producto.descripcion,
+            'precio': str(producto.precio),
+            'precio_oferta': str(producto.precio_oferta) if producto.precio_oferta is not None else '',
+            'categoria': producto.categoria.nombre if producto.categoria else '',
+            'marca': producto.marca.nombre if producto.marca else '',
+            'genero': producto.genero,
+            'color': producto.color,
+            'material': producto.material,
+            'stock': producto.stock,
+            'esta_disponible': producto.esta_disponible,
+            'es_destacado': producto.es_destacado,
+            'tallas': _serializar_tallas(producto.tallas.all(), formato),
+        }
+        if formato == 'jsonl':
+            yield json.dumps(fila, ensure_ascii=False) + '\n'
+        else:
+            fila['esta_disponible'] = int(fila['esta_disponible'])
+            fila['es_destacado'] = int(fila['es_destacado'])
+            yield escritor.writerow([fila[campo] for campo in CAMPOS])
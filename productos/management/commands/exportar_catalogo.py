@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from productos.importacion import FORMATOS, exportar_catalogo, formato_de
+
+
+class Command(BaseCommand):
+    help = 'Exporta el catálogo en el mismo formato que acepta importar_catalogo'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--salida', help='Fichero de salida (por defecto, la salida estándar)')
+        parser.add_argument('--formato', choices=FORMATOS, help='Por defecto se deduce de la extensión de --salida')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Productos leídos de la BD por bloque')
+
+    def handle(self, *args, **options):
+        formato = options['formato'] or formato_de(options['salida'] or '')
+        lineas = exportar_catalogo(formato, chunk_size=options['chunk_size'])
+
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8', newline='') as fichero:
+                fichero.writelines(lineas)
+            self.stderr.write(self.style.SUCCESS(f"✅ Catálogo exportado a {options['salida']}"))
+        else:
+            for linea in lineas:
+                self.stdout.write(linea, ending='')
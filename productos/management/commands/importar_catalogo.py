@@ -0,0 +1,37 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from productos.importacion import FORMATOS, ImportadorCatalogo, formato_de, leer_filas
+
+
+class Command(BaseCommand):
+    help = 'Importa (crea o actualiza) categorías, marcas, productos y tallas desde CSV o JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('fichero', help="Ruta del fichero, o '-' para leer de la entrada estándar")
+        parser.add_argument('--formato', choices=FORMATOS, help='Por defecto se deduce de la extensión')
+        parser.add_argument('--lote', type=int, default=1000, help='Filas guardadas por transacción')
+
+    def handle(self, *args, **options):
+        ruta = options['fichero']
+        formato = options['formato'] or formato_de(ruta)
+        importador = ImportadorCatalogo(tamano_lote=options['lote'])
+        inicio = time.perf_counter()
+
+        try:
+            if ruta == '-':
+                importador.importar(leer_filas(sys.stdin, formato))
+            else:
+                with open(ruta, encoding='utf-8', newline='') as fichero:
+                    importador.importar(leer_filas(fichero, formato))
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Importación detenida tras {importador.filas} filas: {e}')
+
+        segundos = time.perf_counter() - inicio
+        velocidad = importador.filas / segundos if segundos else importador.filas
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {importador.filas} productos y {importador.tallas} tallas importados '
+            f'en {segundos:.1f}s ({velocidad:.0f} filas/s)'
+        ))
@@ -0,0 +1,28 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from productos.publicacion import publicar
+
+
+class Command(BaseCommand):
+    help = (
+        'Regenera el sitemap y el feed de productos en PUBLICACION_ROOT, solo los trozos '
+        'que han cambiado desde la última vez (pensado para ejecutarse desde cron)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--todo', action='store_true', help='Regenera todos los trozos')
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        cambiados, borrados = publicar(todo=options['todo'])
+        segundos = time.perf_counter() - inicio
+        if not cambiados and not borrados:
+            self.stdout.write(self.style.SUCCESS(f'✅ Sin cambios en {settings.PUBLICACION_ROOT}'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {len(cambiados)} trozos regenerados y {len(borrados)} borrados en '
+            f'{settings.PUBLICACION_ROOT} ({segundos:.1f} s)'
+        ))
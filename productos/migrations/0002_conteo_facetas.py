@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-19 16:05
+
+from django.db import migrations, models
+
+
+def poblar_facetas(apps, schema_editor):
+    from productos.facetas import recalcular_facetas
+    recalcular_facetas(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConteoFaceta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('categoria', models.CharField(max_length=20)),
+                ('marca', models.CharField(max_length=20)),
+                ('genero', models.CharField(max_length=20)),
+                ('precio', models.CharField(max_length=20)),
+                ('total', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Conteo de Faceta',
+                'verbose_name_plural': 'Conteos de Facetas',
+                'indexes': [models.Index(fields=['marca', 'genero', 'precio'], name='faceta_categoria_idx'), models.Index(fields=['categoria', 'genero', 'precio'], name='faceta_marca_idx'), models.Index(fields=['categoria', 'marca', 'precio'], name='faceta_genero_idx')],
+                'constraints': [models.UniqueConstraint(fields=('categoria', 'marca', 'genero', 'precio'), name='conteo_faceta_unico')],
+            },
+        ),
+        migrations.RunPython(poblar_facetas, migrations.RunPython.noop),
+    ]
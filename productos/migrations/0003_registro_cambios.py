@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-19 16:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0002_conteo_facetas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CambioProducto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('producto_id', models.IntegerField(blank=True, null=True)),
+                ('fecha', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Cambio de Producto',
+                'verbose_name_plural': 'Cambios de Productos',
+            },
+        ),
+    ]
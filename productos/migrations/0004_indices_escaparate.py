@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-19 16:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0003_registro_cambios'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(condition=models.Q(('esta_disponible', True)), fields=['-fecha_creacion'], name='producto_disponibles_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(condition=models.Q(('es_destacado', True), ('esta_disponible', True)), fields=['-fecha_creacion'], name='producto_destacados_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(condition=models.Q(('esta_disponible', True)), fields=['categoria', '-fecha_creacion'], name='producto_categoria_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(condition=models.Q(('esta_disponible', True)), fields=['marca', '-fecha_creacion'], name='producto_marca_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(condition=models.Q(('esta_disponible', True)), fields=['genero', '-fecha_creacion'], name='producto_genero_idx'),
+        ),
+    ]
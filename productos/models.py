@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils.functional import cached_property
 from django.utils.text import slugify
 
 
@@ -7,6 +8,7 @@ class Categoria(models.Model):
     nombre = models.CharField(max_length=200, unique=True)
     descripcion = models.TextField(blank=True)
     imagen = models.ImageField(upload_to='categorias/', blank=True, null=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
     
     class Meta:
         verbose_name = 'Categoría'
@@ -21,6 +23,7 @@ class Marca(models.Model):
     """Marca de productos"""
     nombre = models.CharField(max_length=200, unique=True)
     imagen = models.ImageField(upload_to='marcas/', blank=True, null=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
     
     class Meta:
         verbose_name = 'Marca'
@@ -31,6 +34,12 @@ class Marca(models.Model):
         return self.nombre
 
 
+class ProductoQuerySet(models.QuerySet):
+    def para_tarjeta(self):
+        """Carga todo lo que pinta una tarjeta de producto sin consultas por fila"""
+        return self.select_related('categoria', 'marca').prefetch_related('imagenes')
+
+
 class Producto(models.Model):
     """Producto principal"""
     GENERO_CHOICES = [
@@ -56,10 +65,36 @@ class Producto(models.Model):
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     fecha_actualizacion = models.DateTimeField(auto_now=True)
     
+    objects = ProductoQuerySet.as_manager()
+    
     class Meta:
         verbose_name = 'Producto'
         verbose_name_plural = 'Productos'
         ordering = ['-fecha_creacion']
+        # Índices parciales (solo disponibles) en el orden del escaparate: la página
+        # sale recorriendo el índice, sin ordenar ni leer productos retirados
+        indexes = [
+            models.Index(
+                fields=['-fecha_creacion'], name='producto_disponibles_idx',
+                condition=models.Q(esta_disponible=True),
+            ),
+            models.Index(
+                fields=['-fecha_creacion'], name='producto_destacados_idx',
+                condition=models.Q(esta_disponible=True, es_destacado=True),
+            ),
+            models.Index(
+                fields=['categoria', '-fecha_creacion'], name='producto_categoria_idx',
+                condition=models.Q(esta_disponible=True),
+            ),
+            models.Index(
+                fields=['marca', '-fecha_creacion'], name='producto_marca_idx',
+                condition=models.Q(esta_disponible=True),
+            ),
+            models.Index(
+                fields=['genero', '-fecha_creacion'], name='producto_genero_idx',
+                condition=models.Q(esta_disponible=True),
+            ),
+        ]
     
     def __str__(self):
         return self.nombre
@@ -69,6 +104,15 @@ class Producto(models.Model):
             self.slug = slugify(self.nombre)
         super().save(*args, **kwargs)
     
+    @cached_property
+    def imagen_principal(self):
+        """Imagen principal (o la primera). Usa las imágenes precargadas si las hay."""
+        imagenes = list(self.imagenes.all())
+        for imagen in imagenes:
+            if imagen.es_principal:
+                return imagen
+        return imagenes[0] if imagenes else None
+    
     def precio_actual(self):
         """Retorna el precio actual considerando ofertas"""
         if self.precio_oferta and self.precio_oferta < self.precio:
@@ -123,3 +167,48 @@ class TallaProducto(models.Model):
     
     def __str__(self):
         return f"{self.producto.nombre} - Talla {self.talla}"
+
+
+class ConteoFaceta(models.Model):
+    """
+    Cubo de recuentos de productos disponibles para la barra lateral del
+    catálogo (ver productos.facetas). '*' en una dimensión significa todas.
+    """
+    categoria = models.CharField(max_length=20)
+    marca = models.CharField(max_length=20)
+    genero = models.CharField(max_length=20)
+    precio = models.CharField(max_length=20)
+    total = models.IntegerField(default=0)
+    
+    class Meta:
+        verbose_name = 'Conteo de Faceta'
+        verbose_name_plural = 'Conteos de Facetas'
+        constraints = [
+            # Sirve también de índice para la faceta de precio
+            models.UniqueConstraint(fields=['categoria', 'marca', 'genero', 'precio'], name='conteo_faceta_unico'),
+        ]
+        # Un índice por faceta con las otras tres dimensiones
+        indexes = [
+            models.Index(fields=['marca', 'genero', 'precio'], name='faceta_categoria_idx'),
+            models.Index(fields=['categoria', 'genero', 'precio'], name='faceta_marca_idx'),
+            models.Index(fields=['categoria', 'marca', 'precio'], name='faceta_genero_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.categoria}/{self.marca}/{self.genero}/{self.precio}: {self.total}"
+
+
+class CambioProducto(models.Model):
+    """
+    Registro de productos modificados del que se alimenta el índice en
+    memoria del catálogo (productos.bitmap). Sin producto: cambió todo.
+    """
+    producto_id = models.IntegerField(null=True, blank=True)
+    fecha = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        verbose_name = 'Cambio de Producto'
+        verbose_name_plural = 'Cambios de Productos'
+    
+    def __str__(self):
+        return f"{self.producto_id or 'catálogo completo'} ({self.fecha:%Y-%m-%d %H:%M:%S})"
@@ -0,0 +1,281 @@
+"""
+Sitemap y feed de productos (formato Google Merchant) publicados como ficheros.
+
+Se generan en PUBLICACION_ROOT recorriendo los productos con iterator(), sin
+cargarlos todos en memoria, y escribiendo cada fichero línea a línea:
+
+- sitemap.xml: índice que apunta a sitemaps/paginas.xml (portada, catálogo y
+  categorías) y a un sitemaps/productos-N.xml por trozo.
+- feeds/productos.xml y feeds/productos.csv: el feed completo, que se monta
+  juntando las piezas de cada trozo (piezas/feed-N.*).
+
+Un trozo son los productos con id entre N * PUBLICACION_POR_TROZO y el
+siguiente múltiplo, así que un producto nuevo no mueve a los demás de trozo.
+manifiesto.json guarda la huella de cada trozo (última fecha_actualizacion y
+recuentos). Al volver a publicar solo se reescriben los trozos cuya huella
+cambió. Las señales tocan fecha_actualizacion cuando cambia algo que sale en
+el feed (tallas, imágenes, categoría o marca); un update() masivo que no la
+toque necesita publicar(todo=True).
+
+Cada fichero se escribe junto con su variante .gz, y se sustituye de forma
+atómica. Los sirve la vista productos.views.fichero_publicado.
+"""
+
+import csv
+import gzip
+import json
+import os
+import shutil
+from pathlib import Path
+from urllib.parse import urljoin
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.db.models import Count, F, Max, Q
+from django.urls import reverse
+
+from core.flujos import Eco
+
+from .models import Categoria, Producto
+
+VERSION = 1  # cambiarla obliga a regenerarlo todo (formato de los ficheros)
+MANIFIESTO = 'manifiesto.json'
+
+CAMPOS_FEED = [
+    'id', 'title', 'description', 'link', 'image_link', 'availability', 'price', 'sale_price',
+    'brand', 'product_type', 'condition', 'identifier_exists',
+]
+
+CABECERA_FEED_XML = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<rss version="2.0" xmlns:g="http://base.google.com/ns/1.0">\n<channel>\n'
+    '<title>{titulo}</title>\n<link>{enlace}</link>\n<description>Catálogo de productos</description>\n'
+)
+
+
+def _raiz():
+    return Path(settings.PUBLICACION_ROOT)
+
+
+def _absoluta(ruta):
+    return urljoin(settings.SITIO_URL, ruta)
+
+
+def _lastmod(fecha):
+    return fecha.replace(microsecond=0).isoformat()
+
+
+def _escribir(ruta, lineas):
+    """Escribe `ruta` y `ruta.gz` línea a línea y los sustituye a la vez al terminar"""
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    temporal = ruta.with_name(f'.{ruta.name}.tmp')
+    with open(temporal, 'w', encoding='utf-8', newline='') as fichero:
+        fichero.writelines(lineas)
+    temporal_gz = ruta.with_name(f'.{ruta.name}.gz.tmp')
+    # mtime=0: mismo contenido, mismo .gz
+    with open(temporal, 'rb') as origen, gzip.GzipFile(temporal_gz, 'wb', compresslevel=6, mtime=0) as destino:
+        shutil.copyfileobj(origen, destino)
+    os.replace(temporal_gz, ruta.with_name(ruta.name + '.gz'))
+    os.replace(temporal, ruta)
+
+
+def _borrar(ruta):
+    for variante in (ruta, ruta.with_name(ruta.name + '.gz')):
+        variante.unlink(missing_ok=True)
+
+
+# Huellas
+
+def huellas():
+    """{trozo: huella} de los trozos con algún producto, en una sola consulta agregada"""
+    por_trozo = settings.PUBLICACION_POR_TROZO
+    filas = (
+        Producto.objects.order_by()
+        .annotate(trozo=F('id') / por_trozo)
+        .values('trozo')
+        .annotate(ultima=Max('fecha_actualizacion'), total=Count('id'),
+                  disponibles=Count('id', filter=Q(esta_disponible=True)))
+    )
+    return {
+        str(fila['trozo']): {
+            'huella': f"{fila['ultima'].isoformat()}|{fila['total']}|{fila['disponibles']}",
+            'lastmod': _lastmod(fila['ultima']),
+            'disponibles': fila['disponibles'],
+        }
+        for fila in filas
+    }
+
+
+def _leer_manifiesto():
+    try:
+        manifiesto = json.loads((_raiz() / MANIFIESTO).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+    # Otra versión del formato u otro dominio: no se aprovecha nada
+    if manifiesto.get('version') != VERSION or manifiesto.get('sitio') != settings.SITIO_URL:
+        return None
+    return manifiesto
+
+
+# Contenido de cada fichero
+
+def _productos_trozo(trozo):
+    por_trozo = settings.PUBLICACION_POR_TROZO
+    return (
+        Producto.objects.filter(esta_disponible=True, id__gte=trozo * por_trozo, id__lt=(trozo + 1) * por_trozo)
+        .select_related('categoria', 'marca')
+        .prefetch_related('imagenes')
+        .order_by('id')
+        .iterator(chunk_size=2000)
+    )
+
+
+def _url_detalle():
+    """Función slug -> URL absoluta del detalle, sin resolver la ruta por cada producto"""
+    plantilla = _absoluta(reverse('productos:detalle', args=['slug-producto']))
+    return lambda slug: plantilla.replace('slug-producto', slug)
+
+
+def _lineas_sitemap(productos):
+    url = _url_detalle()
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+    for producto in productos:
+        yield (
+            f'<url><loc>{escape(url(producto.slug))}</loc>'
+            f'<lastmod>{_lastmod(producto.fecha_actualizacion)}</lastmod></url>\n'
+        )
+    yield '</urlset>\n'
+
+
+def _lineas_paginas():
+    """Portada, catálogo y una URL por categoría, con la fecha de su último producto"""
+    ultimas = dict(
+        Producto.objects.filter(esta_disponible=True).order_by()
+        .values_list('categoria').annotate(ultima=Max('fecha_actualizacion'))
+    )
+    ultima = max((fecha for fecha in ultimas.values() if fecha), default=None)
+    paginas = [(reverse('core:inicio'), ultima), (reverse('productos:catalogo'), ultima)]
+    paginas += [
+        (reverse('productos:por_categoria', args=[categoria_id]), ultimas[categoria_id])
+        for categoria_id in Categoria.objects.order_by('id').values_list('id', flat=True)
+        if categoria_id in ultimas
+    ]
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+    for ruta, fecha in paginas:
+        lastmod = f'<lastmod>{_lastmod(fecha)}</lastmod>' if fecha else ''
+        yield f'<url><loc>{escape(_absoluta(ruta))}</loc>{lastmod}</url>\n'
+    yield '</urlset>\n'
+
+
+def _lineas_indice(trozos):
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+    yield f"<sitemap><loc>{escape(_absoluta('/sitemaps/paginas.xml'))}</loc></sitemap>\n"
+    for trozo, datos in trozos:
+        yield (
+            f"<sitemap><loc>{escape(_absoluta(f'/sitemaps/productos-{trozo}.xml'))}</loc>"
+            f"<lastmod>{datos['lastmod']}</lastmod></sitemap>\n"
+        )
+    yield '</sitemapindex>\n'
+
+
+def fila_feed(producto, url):
+    """Campos del feed (CAMPOS_FEED) de un producto"""
+    imagen = producto.imagen_principal
+    return {
+        'id': str(producto.id),
+        'title': producto.nombre[:150],
+        'description': producto.descripcion[:5000],
+        'link': url(producto.slug),
+        'image_link': _absoluta(imagen.imagen.url) if imagen else '',
+        'availability': 'in_stock' if producto.stock > 0 else 'out_of_stock',
+        'price': f'{producto.precio:.2f} EUR',
+        'sale_price': f'{producto.precio_oferta:.2f} EUR' if producto.tiene_oferta() else '',
+        'brand': producto.marca.nombre if producto.marca else '',
+        'product_type': producto.categoria.nombre if producto.categoria else '',
+        'condition': 'new',
+        'identifier_exists': 'no',  # la tienda no tiene GTIN ni MPN
+    }
+
+
+def _escribir_piezas_feed(trozo, raiz):
+    """Escribe a la vez (una sola pasada por los productos) la pieza XML y la CSV del trozo"""
+    url = _url_detalle()
+    escritor = csv.writer(Eco())
+    piezas = raiz / 'piezas'
+    piezas.mkdir(parents=True, exist_ok=True)
+    temporal_xml, temporal_csv = piezas / f'.feed-{trozo}.xml.tmp', piezas / f'.feed-{trozo}.csv.tmp'
+    with open(temporal_xml, 'w', encoding='utf-8') as xml, open(temporal_csv, 'w', encoding='utf-8', newline='') as tabla:
+        for producto in _productos_trozo(trozo):
+            fila = fila_feed(producto, url)
+            xml.write('<item>' + ''.join(
+                f'<g:{campo}>{escape(valor)}</g:{campo}>' for campo, valor in fila.items() if valor
+            ) + '</item>\n')
+            tabla.write(escritor.writerow([fila[campo] for campo in CAMPOS_FEED]))
+    os.replace(temporal_xml, piezas / f'feed-{trozo}.xml')
+    os.replace(temporal_csv, piezas / f'feed-{trozo}.csv')
+
+
+def _lineas_piezas(rutas):
+    for ruta in rutas:
+        with open(ruta, encoding='utf-8', newline='') as pieza:
+            yield from pieza
+
+
+def _montar_feeds(trozos, raiz):
+    """Feeds completos a partir de las piezas de cada trozo (sin tocar la BD)"""
+    from core.models import DatosEmpresa
+
+    titulo = escape(DatosEmpresa.get_datos().nombre or 'PetJoy')
+    piezas = raiz / 'piezas'
+    _escribir(raiz / 'feeds' / 'productos.xml', [
+        CABECERA_FEED_XML.format(titulo=titulo, enlace=escape(_absoluta('/'))),
+        *_lineas_piezas(piezas / f'feed-{trozo}.xml' for trozo in trozos),
+        '</channel>\n</rss>\n',
+    ])
+    _escribir(raiz / 'feeds' / 'productos.csv', [
+        csv.writer(Eco()).writerow(CAMPOS_FEED),
+        *_lineas_piezas(piezas / f'feed-{trozo}.csv' for trozo in trozos),
+    ])
+
+
+def publicar(todo=False):
+    """
+    Regenera los ficheros de los trozos que han cambiado desde la última
+    publicación (o todos con `todo`). Devuelve (trozos regenerados, trozos borrados).
+    """
+    raiz = _raiz()
+    anterior = None if todo else _leer_manifiesto()
+    anteriores = anterior['trozos'] if anterior else {}
+    actuales = huellas()
+    cambiados = [
+        trozo for trozo, datos in actuales.items()
+        if anteriores.get(trozo, {}).get('huella') != datos['huella']
+    ]
+    borrados = [trozo for trozo in anteriores if trozo not in actuales]
+
+    for trozo in cambiados:
+        if actuales[trozo]['disponibles']:
+            _escribir(raiz / 'sitemaps' / f'productos-{trozo}.xml', _lineas_sitemap(_productos_trozo(int(trozo))))
+        else:
+            _borrar(raiz / 'sitemaps' / f'productos-{trozo}.xml')
+        _escribir_piezas_feed(int(trozo), raiz)
+    for trozo in borrados:
+        _borrar(raiz / 'sitemaps' / f'productos-{trozo}.xml')
+        for extension in ('xml', 'csv'):
+            (raiz / 'piezas' / f'feed-{trozo}.{extension}').unlink(missing_ok=True)
+
+    ordenados = sorted(actuales, key=int)
+    if cambiados or borrados or anterior is None:
+        _escribir(raiz / 'sitemaps' / 'paginas.xml', _lineas_paginas())
+        _escribir(raiz / 'sitemap.xml', _lineas_indice(
+            (trozo, actuales[trozo]) for trozo in ordenados if actuales[trozo]['disponibles']
+        ))
+        _montar_feeds(ordenados, raiz)
+    manifiesto = {'version': VERSION, 'sitio': settings.SITIO_URL, 'trozos': actuales}
+    temporal = raiz / f'.{MANIFIESTO}.tmp'
+    temporal.write_text(json.dumps(manifiesto, indent=1), encoding='utf-8')
+    os.replace(temporal, raiz / MANIFIESTO)
+    return cambiados, borrados
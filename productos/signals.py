@@ -0,0 +1,97 @@
+"""
+Mantiene Producto.fecha_actualizacion al día cuando cambia algo que se pinta
+en sus páginas pero vive en otra tabla (imágenes, tallas). Es la marca que
+usan las respuestas condicionales de productos.condicionales, junto con la
+fecha_actualizacion de categorías y marcas.
+
+También mantiene el cubo de recuentos de la barra lateral (productos.facetas)
+y el registro de cambios del que se alimenta su índice en memoria
+(productos.bitmap): ambos dependen de los mismos campos del producto. Los
+cambios en categorías y destacados dan por obsoleta la instantánea de la
+portada (core.escaparate).
+"""
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core import escaparate
+
+from . import facetas
+from .bitmap import registrar_cambio
+from .models import Categoria, ImagenProducto, Marca, Producto, TallaProducto
+
+CAMPOS_FACETAS = ('categoria_id', 'marca_id', 'genero', 'precio', 'precio_oferta', 'esta_disponible')
+
+
+@receiver([post_save, post_delete], sender=ImagenProducto)
+@receiver([post_save, post_delete], sender=TallaProducto)
+def tocar_producto(sender, instance, **kwargs):
+    Producto.objects.filter(pk=instance.producto_id).update(fecha_actualizacion=timezone.now())
+
+
+@receiver(post_delete, sender=Categoria)
+@receiver(post_delete, sender=Marca)
+def tocar_tabla(sender, instance, **kwargs):
+    # Un borrado no deja fecha que tomar: se marcan las que quedan, que son
+    # pocas filas, para que las páginas que pintan la barra lateral cambien
+    sender.objects.update(fecha_actualizacion=timezone.now())
+
+
+@receiver(post_delete, sender=Categoria)
+@receiver(post_delete, sender=Marca)
+def recalcular_facetas(sender, instance, **kwargs):
+    # SET_NULL deja los productos sin categoría o marca con un UPDATE, sin señales
+    facetas.recalcular_facetas()
+    registrar_cambio(None)
+
+
+@receiver(pre_save, sender=Producto)
+def recordar_faceta(sender, instance, update_fields=None, using=None, **kwargs):
+    """Celda del cubo en la que estaba el producto antes de guardarlo, y si era destacado"""
+    instance._faceta_anterior = None
+    instance._destacado_anterior = instance.es_destacado
+    if update_fields is not None and not {campo.removesuffix('_id') for campo in update_fields} & {
+        campo.removesuffix('_id') for campo in CAMPOS_FACETAS + ('es_destacado',)
+    }:
+        instance._faceta_anterior = facetas.clave_producto(instance)
+        return
+    if instance.pk:
+        # De la base de datos en la que se va a guardar (la primaria), no de la réplica
+        anterior = (
+            Producto.objects.using(using).filter(pk=instance.pk).values(*CAMPOS_FACETAS, 'es_destacado').first()
+        )
+        if anterior:
+            instance._destacado_anterior = anterior.pop('es_destacado')
+            instance._faceta_anterior = facetas.clave(**anterior)
+
+
+@receiver(post_save, sender=Producto)
+def actualizar_faceta(sender, instance, created=False, using=None, **kwargs):
+    anterior, nueva = getattr(instance, '_faceta_anterior', None), facetas.clave_producto(instance)
+    if anterior != nueva:
+        facetas.aplicar(anterior, -1, using=using)
+        facetas.aplicar(nueva, 1, using=using)
+    # Los nuevos se registran siempre para que tengan su sitio en el orden del índice
+    if created or anterior != nueva:
+        registrar_cambio(instance.pk)
+
+
+@receiver(post_delete, sender=Producto)
+def descontar_faceta(sender, instance, using=None, **kwargs):
+    facetas.aplicar(facetas.clave_producto(instance), -1, using=using)
+    registrar_cambio(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Producto)
+def caducar_escaparate(sender, instance, using=None, **kwargs):
+    # También cuando deja de ser destacado, y con el stock (la tarjeta pinta "Agotado").
+    # Al confirmar: antes, el hilo que la regenera aún leería los datos anteriores
+    if instance.es_destacado or getattr(instance, '_destacado_anterior', False):
+        transaction.on_commit(escaparate.caducar, using=using)
+
+
+@receiver([post_save, post_delete], sender=Categoria)
+def caducar_escaparate_categorias(sender, instance, using=None, **kwargs):
+    transaction.on_commit(escaparate.caducar, using=using)
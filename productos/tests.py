@@ -1,3 +1,483 @@
-from django.test import TestCase
+import csv
+import io
+import shutil
+import tempfile
+from decimal import Decimal
+from pathlib import Path
 
-# Create your tests here.
+from django.contrib import messages
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from core.testing import ConsultasTestCase, crear_catalogo, vistas_async
+from productos.bitmap import calentar_indice, indice_catalogo
+from productos.condicionales import estado_visitante
+from productos.facetas import DIMENSIONES, calcular_facetas, clave_producto, recalcular_facetas, seleccion
+from productos.models import Categoria, ConteoFaceta, ImagenProducto, Marca, Producto, TallaProducto
+from productos.publicacion import publicar
+from productos.vistos import anotar_visto, productos_vistos
+
+
+class PresupuestoConsultasProductosTests(ConsultasTestCase):
+    """Las vistas del catálogo no deben hacer consultas por producto"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.productos = crear_catalogo()
+
+    def test_catalogo(self):
+        producto = self.productos[0]
+        for filtros in [{}, {'categoria': producto.categoria_id}, {'marca': producto.marca_id},
+                        {'genero': 'unisex'}, {'precio': 1}, {'q': 'pelota'}, {'page': 2}]:
+            with self.subTest(filtros=filtros):
+                response = self.client.get(reverse('productos:catalogo'), filtros)
+                self.assertEqual(response.status_code, 200)
+                self.assertPresupuestoConsultas(response)
+                self.assertSinNMas1(response)
+
+    def test_detalle_producto(self):
+        response = self.client.get(reverse('productos:detalle', args=[self.productos[0].slug]))
+        self.assertEqual(response.status_code, 200)
+        self.assertPresupuestoConsultas(response)
+        self.assertSinNMas1(response)
+
+    def test_detalle_con_vistos(self):
+        for producto in self.productos[1:9]:
+            self.client.get(reverse('productos:detalle', args=[producto.slug]))
+        response = self.client.get(reverse('productos:detalle', args=[self.productos[0].slug]))
+        self.assertEqual(len(response.context['productos_vistos']), 8)
+        self.assertPresupuestoConsultas(response)
+        self.assertSinNMas1(response)
+
+    def test_por_categoria(self):
+        response = self.client.get(reverse('productos:por_categoria', args=[self.productos[0].categoria_id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertPresupuestoConsultas(response)
+        self.assertSinNMas1(response)
+
+
+class VistasAsyncProductosTests(ConsultasTestCase):
+    """Las vistas de productos.vistas_async, que solo se enrutan con ASGI"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.enterClassContext(vistas_async())
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.productos = crear_catalogo()
+
+    async def test_catalogo(self):
+        filtro = {'categoria': self.productos[0].categoria_id}
+        response = await self.async_client.get(reverse('productos:catalogo'), filtro)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.resolver_match.func.__module__, 'productos.vistas_async')
+        self.assertTrue(response.context['productos'])
+        self.assertPresupuestoConsultas(response)
+        self.assertSinNMas1(response)
+
+    async def test_detalle_revalida_con_304(self):
+        url = reverse('productos:detalle', args=[self.productos[0].slug])
+        await self.async_client.get(url)  # recibe la cookie CSRF, que forma parte del ETag
+        response = await self.async_client.get(url)
+        self.assertEqual(response.resolver_match.func.__module__, 'productos.vistas_async')
+        self.assertPresupuestoConsultas(response)
+        response = await self.async_client.get(url, headers={'if-none-match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+
+class RespuestasCondicionalesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.productos = crear_catalogo(productos=3)
+
+    def test_detalle_revalida_con_304(self):
+        url = reverse('productos:detalle', args=[self.productos[0].slug])
+        self.client.get(url)  # primera visita: recibe la cookie CSRF, que forma parte del ETag
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_cambiar_tallas_o_imagenes_invalida_el_etag(self):
+        producto = self.productos[0]
+        url = reverse('productos:detalle', args=[producto.slug])
+        etag = self.client.get(url)['ETag']
+        TallaProducto.objects.create(producto=producto, talla='XL', stock=1)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        etag = self.client.get(url)['ETag']
+        ImagenProducto.objects.filter(producto=producto).first().delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_el_carrito_forma_parte_del_etag(self):
+        producto = self.productos[0]
+        url = reverse('productos:por_categoria', args=[producto.categoria_id])
+        etag = self.client.get(url)['ETag']
+        self.client.post(reverse('pedidos:agregar_carrito', args=[producto.id]), {'cantidad': 1})
+        self.client.get(url)  # consume el mensaje de "añadido al carrito"
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_categorias_y_marcas_invalidan_el_etag_sin_tocar_productos(self):
+        producto = self.productos[0]
+        url = reverse('productos:por_categoria', args=[producto.categoria_id])
+        fechas = dict(Producto.objects.values_list('id', 'fecha_actualizacion'))
+        etag = self.client.get(url)['ETag']
+        categoria = Categoria.objects.exclude(pk=producto.categoria_id).first() or producto.categoria
+        categoria.descripcion = 'Otra descripción'
+        categoria.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        etag = self.client.get(url)['ETag']
+        Marca.objects.create(nombre='Nueva').delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(dict(Producto.objects.values_list('id', 'fecha_actualizacion')), fechas)
+
+    def test_con_mensajes_pendientes_no_hay_etag(self):
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        request.session = SessionStore()
+        request._messages = FallbackStorage(request)
+        self.assertIsNotNone(estado_visitante(request))
+        messages.info(request, 'Añadido al carrito')
+        self.assertIsNone(estado_visitante(request))
+        self.assertEqual([str(mensaje) for mensaje in request._messages], ['Añadido al carrito'])
+
+
+class FacetasTests(TestCase):
+    """Los recuentos del cubo coinciden con contar los productos en vivo"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.productos = crear_catalogo(imagenes=0, tallas=())
+        gatos = Categoria.objects.create(nombre='Juguetes para Gatos')
+        catit = Marca.objects.create(nombre='Catit')
+        for n, (precio, oferta) in enumerate([(8, None), (25, 9), (60, None), (150, 120)]):
+            Producto.objects.create(
+                nombre=f'Ratón {n}', descripcion='Ratón de prueba', precio=precio, precio_oferta=oferta,
+                categoria=gatos, marca=catit if n % 2 else None, genero='mujer' if n < 2 else '', stock=3,
+            )
+
+    def recuentos_en_vivo(self, parametros):
+        elegida = seleccion(parametros)
+        disponibles = [p for p in Producto.objects.filter(esta_disponible=True) if
+                       not parametros.get('q') or parametros['q'].lower() in p.nombre.lower()]
+        facetas = {dimension: {} for dimension in DIMENSIONES}
+        for producto in disponibles:
+            valores = dict(zip(DIMENSIONES, clave_producto(producto)))
+            for dimension in DIMENSIONES:
+                if all(elegida[otra] in ('*', valores[otra]) for otra in DIMENSIONES if otra != dimension):
+                    facetas[dimension][valores[dimension]] = facetas[dimension].get(valores[dimension], 0) + 1
+        facetas['total'] = sum(
+            1 for producto in disponibles
+            if all(elegida[d] in ('*', v) for d, v in zip(DIMENSIONES, clave_producto(producto)))
+        )
+        return facetas
+
+    def assertRecuentos(self, *combinaciones):
+        for parametros in combinaciones:
+            with self.subTest(parametros=parametros):
+                self.assertEqual(calcular_facetas(parametros), self.recuentos_en_vivo(parametros))
+
+    def test_recuentos_con_filtros(self):
+        categoria = str(self.productos[0].categoria_id)
+        self.assertRecuentos(
+            {}, {'categoria': categoria}, {'genero': 'mujer'}, {'precio': '0'},
+            {'categoria': categoria, 'precio': '1'}, {'marca': 'x', 'genero': 'unisex'},
+        )
+
+    def test_recuentos_con_busqueda(self):
+        busqueda = Producto.objects.filter(esta_disponible=True, nombre__icontains='ratón')
+        parametros = {'q': 'ratón', 'precio': '0'}
+        self.assertEqual(calcular_facetas(parametros, busqueda), self.recuentos_en_vivo(parametros))
+
+    def test_el_cubo_sigue_a_los_cambios(self):
+        producto = self.productos[0]
+        producto.precio_oferta = Decimal('5')
+        producto.save()
+        Producto.objects.get(pk=self.productos[1].pk).delete()
+        otro = Producto.objects.get(pk=self.productos[2].pk)
+        otro.esta_disponible = False
+        otro.save()
+        otro = Producto.objects.get(pk=self.productos[3].pk)
+        otro.categoria = Categoria.objects.get(nombre='Juguetes para Gatos')
+        otro.save()
+        Marca.objects.get(nombre='Catit').delete()
+
+        incremental = {tuple(fila[:4]): fila[4] for fila in ConteoFaceta.objects.filter(total__gt=0).values_list(
+            *DIMENSIONES, 'total')}
+        recalcular_facetas()
+        completo = dict(((c.categoria, c.marca, c.genero, c.precio), c.total) for c in ConteoFaceta.objects.all())
+        self.assertEqual(incremental, completo)
+        self.assertRecuentos({}, {'precio': '0'})
+
+    def test_una_consulta_por_indice(self):
+        parametros = {'categoria': str(self.productos[0].categoria_id), 'genero': 'unisex'}
+        with self.assertNumQueries(1) as contexto:
+            calcular_facetas(parametros)
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + contexto.captured_queries[0]['sql'])
+            plan = ' | '.join(fila[-1] for fila in cursor.fetchall())
+        self.assertNotIn('SCAN', plan)
+
+
+@override_settings(CATALOGO_BITMAP=True, CATALOGO_BITMAP_REFRESCO=0)
+class IndiceBitmapTests(TestCase):
+    """El índice en memoria devuelve las mismas páginas que el filtro SQL"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.productos = crear_catalogo(productos=30, imagenes=0, tallas=())
+        gatos = Categoria.objects.create(nombre='Juguetes para Gatos')
+        for n in range(15):
+            Producto.objects.create(
+                nombre=f'Ratón {n}', descripcion='Ratón de prueba', precio=5 + n * 10,
+                precio_oferta=4 if n % 3 == 0 else None, categoria=gatos, genero='mujer' if n % 2 else 'hombre',
+                stock=3, esta_disponible=n != 7,
+            )
+
+    def setUp(self):
+        indice_catalogo.reiniciar()
+
+    def assertMismasPaginas(self, *combinaciones):
+        for parametros in combinaciones:
+            with self.subTest(parametros=parametros):
+                from productos.views import filtrar_catalogo
+
+                productos, _ = filtrar_catalogo(parametros)
+                esperados = list(productos.order_by('-fecha_creacion', '-id').values_list('id', flat=True))
+                resultado = indice_catalogo.filtrar(parametros, Producto.objects.para_tarjeta())
+                self.assertEqual(resultado.count(), len(esperados))
+                for inicio in range(0, len(esperados) + 12, 12):
+                    self.assertEqual(resultado.ids(inicio, inicio + 12), esperados[inicio:inicio + 12])
+
+    def combinaciones(self):
+        categoria = str(self.productos[0].categoria_id)
+        return (
+            {}, {'categoria': categoria}, {'marca': str(self.productos[0].marca_id)}, {'genero': 'mujer'},
+            {'precio': '0'}, {'precio': '4', 'genero': 'hombre'}, {'categoria': categoria, 'precio': '2'},
+            {'marca': '999'},
+        )
+
+    def test_mismas_paginas_que_sql(self):
+        self.assertMismasPaginas(*self.combinaciones())
+
+    def test_sigue_el_registro_de_cambios(self):
+        self.assertMismasPaginas({})
+        producto = self.productos[0]
+        producto.precio_oferta = Decimal('1')
+        producto.save()
+        Producto.objects.get(pk=self.productos[1].pk).delete()
+        otro = Producto.objects.get(pk=self.productos[2].pk)
+        otro.esta_disponible = False
+        otro.save()
+        Producto.objects.create(
+            nombre='Hueso nuevo', descripcion='Recién llegado', precio=12, categoria=producto.categoria, stock=1,
+        )
+        self.assertMismasPaginas(*self.combinaciones())
+
+        # Las cargas masivas (y los borrados de marcas) reconstruyen el índice entero
+        Marca.objects.get(pk=producto.marca_id).delete()
+        self.assertMismasPaginas(*self.combinaciones())
+
+    def test_los_cambios_publican_un_indice_nuevo(self):
+        resultado = indice_catalogo.filtrar({}, Producto.objects.para_tarjeta())
+        datos = indice_catalogo.datos
+        ids, bitsets, pagina = list(datos.ids), dict(datos.bitsets), resultado.ids(0, 12)
+
+        producto = self.productos[0]
+        producto.precio_oferta = Decimal('1')
+        producto.save()
+        Producto.objects.create(nombre='Hueso nuevo', descripcion='Recién llegado', precio=12, stock=1)
+        indice_catalogo.revisado = 0
+        indice_catalogo.refrescar()
+        self.assertIsNot(indice_catalogo.datos, datos)
+        indice_catalogo.construir()
+
+        # Quien ya tenía el índice anterior lo sigue viendo entero y coherente
+        self.assertEqual((list(datos.ids), datos.bitsets, resultado.ids(0, 12)), (ids, bitsets, pagina))
+        self.assertEqual(len(indice_catalogo.ids), len(ids) + 1)
+
+    def test_calentar_indice(self):
+        calentar_indice()
+        self.assertTrue(indice_catalogo.construido)
+        self.assertMismasPaginas({})
+
+    def test_la_pagina_es_una_consulta_por_id(self):
+        resultado = indice_catalogo.filtrar({'genero': 'mujer'}, Producto.objects.para_tarjeta())
+        with self.assertNumQueries(2) as contexto:  # productos de la página + sus imágenes
+            pagina = resultado[0:5]
+        self.assertEqual([p.id for p in pagina], resultado.ids(0, 5))
+        self.assertIn('IN (', contexto.captured_queries[0]['sql'])
+
+    def test_catalogo_con_indice(self):
+        response = self.client.get(reverse('productos:catalogo'), {'genero': 'mujer', 'page': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['productos'].paginator.count, 6)
+
+
+@override_settings(VISTOS_MAXIMO=3)
+class VistosTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.productos = crear_catalogo(productos=5, imagenes=1, tallas=())
+
+    def test_los_mas_recientes_primero_y_acotados(self):
+        session = SessionStore()
+        for producto in self.productos:
+            anotar_visto(session, producto.id)
+        anotar_visto(session, self.productos[3].id)
+        ids = [p.id for p in self.productos]
+        self.assertEqual(session['vistos'], [ids[3], ids[4], ids[2]])
+
+        Producto.objects.filter(pk=ids[4]).update(esta_disponible=False)
+        with self.assertNumQueries(2):  # productos + imágenes, sean cuantos sean
+            vistos = productos_vistos(session, excluir=[ids[2]])
+        self.assertEqual([p.id for p in vistos], [ids[3]])
+
+    def test_repetir_el_ultimo_no_escribe_la_sesion(self):
+        session = SessionStore()
+        anotar_visto(session, self.productos[0].id)
+        session.save()
+        session = SessionStore(session.session_key)
+        anotar_visto(session, self.productos[0].id)
+        self.assertFalse(session.modified)
+
+    def test_sin_vistos_no_consulta(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(productos_vistos({}), [])
+
+    def test_la_tira_cambia_el_etag(self):
+        primero, segundo = self.productos[:2]
+        url = reverse('productos:detalle', args=[primero.slug])
+        self.client.get(url)
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.client.get(reverse('productos:detalle', args=[segundo.slug]))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['productos_vistos'], [segundo])
+
+
+class PublicacionTests(TestCase):
+    """Sitemap y feed por trozos: solo se reescribe lo que cambia"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.productos = crear_catalogo(productos=12, imagenes=1, tallas=())
+
+    def setUp(self):
+        self.raiz = Path(tempfile.mkdtemp(prefix='petjoy-publicado-'))
+        self.addCleanup(shutil.rmtree, self.raiz, ignore_errors=True)
+        ajustes = self.settings(PUBLICACION_ROOT=self.raiz, PUBLICACION_POR_TROZO=5, SITIO_URL='https://petjoy.es')
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.trozos = sorted({str(p.id // 5) for p in self.productos}, key=int)
+
+    def test_sitemap_y_feed(self):
+        retirado = self.productos[0]
+        Producto.objects.filter(pk=retirado.pk).update(esta_disponible=False)
+        self.assertEqual(publicar(), (self.trozos, []))
+
+        indice = (self.raiz / 'sitemap.xml').read_text()
+        for trozo in self.trozos:
+            self.assertIn(f'https://petjoy.es/sitemaps/productos-{trozo}.xml', indice)
+        sitemaps = ''.join(p.read_text() for p in (self.raiz / 'sitemaps').glob('productos-*.xml'))
+        self.assertEqual(sitemaps.count('<url>'), 11)
+        self.assertNotIn(retirado.slug, sitemaps)
+        self.assertIn(f'https://petjoy.es/productos/producto/{self.productos[1].slug}/', sitemaps)
+
+        with open(self.raiz / 'feeds' / 'productos.csv', encoding='utf-8', newline='') as fichero:
+            filas = list(csv.DictReader(fichero))
+        self.assertEqual([fila['id'] for fila in filas], [str(p.id) for p in self.productos[1:]])
+        self.assertEqual(filas[0]['price'], f'{self.productos[1].precio:.2f} EUR')
+        self.assertEqual((self.raiz / 'feeds' / 'productos.xml').read_text().count('<item>'), 11)
+
+    def test_solo_los_trozos_que_cambian(self):
+        publicar()
+        self.assertEqual(publicar(), ([], []))
+
+        producto = self.productos[-1]
+        producto.precio = Decimal('99.99')
+        producto.save()
+        self.assertEqual(publicar(), ([str(producto.id // 5)], []))
+        self.assertIn('99.99 EUR', (self.raiz / 'feeds' / 'productos.csv').read_text())
+
+        primero = self.trozos[0]
+        Producto.objects.filter(id__lt=(int(primero) + 1) * 5).delete()
+        self.assertEqual(publicar(), ([], [primero]))
+        self.assertFalse((self.raiz / 'sitemaps' / f'productos-{primero}.xml').exists())
+        self.assertEqual(publicar(todo=True), (self.trozos[1:], []))
+
+    @override_settings(VISTAS_ASYNC=False)  # el cliente síncrono no lee contenido async
+    def test_se_sirven_comprimidos(self):
+        publicar()
+        response = self.client.get('/sitemap.xml', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        response = self.client.get('/feeds/productos.csv')
+        self.assertTrue(response.getvalue().startswith(b'id,title,'))
+        self.assertEqual(self.client.get('/feeds/manifiesto.json').status_code, 404)
+        self.assertEqual(self.client.get('/sitemaps/productos-999.xml').status_code, 404)
+
+
+class ImportacionCatalogoTests(TestCase):
+
+    def setUp(self):
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        self.directorio = Path(directorio)
+
+    def importar(self, nombre, texto):
+        ruta = self.directorio / nombre
+        ruta.write_text(texto, encoding='utf-8')
+        call_command('importar_catalogo', str(ruta), lote=2, stdout=io.StringIO())
+
+    def test_importar_exportar_reimportar(self):
+        Producto.objects.create(nombre='Pelota', slug='pelota', precio=5)
+        self.importar('nuevos.csv', (
+            'nombre,precio,categoria,marca,tallas\n'
+            'Pelota,10,Juguetes,Kong,S:3|M:4\n'
+            'Pelota,12,Juguetes,Kong,\n'
+            'Hueso,7,Snacks,,\n'
+        ))
+        # Dos productos nuevos con el nombre de uno que ya existía: ninguno lo pisa
+        self.assertEqual(
+            dict(Producto.objects.values_list('slug', 'precio')),
+            {'pelota': Decimal('5'), 'pelota-2': Decimal('10'), 'pelota-3': Decimal('12'), 'hueso': Decimal('7')},
+        )
+
+        exportado = self.directorio / 'catalogo.csv'
+        call_command('exportar_catalogo', salida=str(exportado), stderr=io.StringIO())
+        texto = exportado.read_text(encoding='utf-8').replace('Snacks', 'Premios')
+        self.importar('catalogo.csv', texto)
+        self.assertEqual(Producto.objects.count(), 4)
+        self.assertEqual(Producto.objects.get(slug='hueso').categoria.nombre, 'Premios')
+        self.assertEqual(
+            dict(TallaProducto.objects.filter(producto__slug='pelota-2').values_list('talla', 'stock')),
+            {'S': 3, 'M': 4},
+        )
+
+    def test_slug_explicito_igual_a_uno_derivado(self):
+        self.importar('uno.jsonl', '{"nombre": "Hueso", "precio": 3}\n{"nombre": "Otro", "slug": "hueso", "precio": 4}\n')
+        self.assertEqual(dict(Producto.objects.values_list('slug', 'nombre')), {'hueso-2': 'Hueso', 'hueso': 'Otro'})
+        with self.assertRaisesMessage(CommandError, "El slug 'hueso-3' ya se asignó"):
+            self.importar('dos.jsonl', '{"nombre": "Hueso", "precio": 3}\n{"nombre": "X", "precio": 1}\n'
+                                       '{"nombre": "Y", "slug": "hueso-3", "precio": 4}\n')
+
+    def test_filas_no_validas(self):
+        for texto, error in (
+            ('{"nombre": "Hueso", "precio": 3}\n[1, 2]\n', 'Línea 2: se esperaba un objeto'),
+            ('"x"\n', 'Línea 1: se esperaba un objeto'),
+            ('{"nombre": "Hueso", "slug": "Hueso Grande/2", "precio": 3}\n', "Slug no válido: 'Hueso Grande/2'"),
+        ):
+            with self.subTest(texto=texto), self.assertRaisesMessage(CommandError, error):
+                self.importar('malo.jsonl', texto)
+        self.assertFalse(Producto.objects.filter(nombre='Hueso').exists())
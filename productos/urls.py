@@ -1,10 +1,18 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+# Con VISTAS_ASYNC (despliegue ASGI) el catálogo y el detalle usan las vistas asíncronas;
+# con WSGI ni siquiera se importan
+if settings.VISTAS_ASYNC:
+    from . import vistas_async as vistas
+else:
+    vistas = views
+
 app_name = 'productos'
 
 urlpatterns = [
-    path('', views.catalogo_productos, name='catalogo'),
-    path('producto/<slug:slug>/', views.detalle_producto, name='detalle'),
+    path('', vistas.catalogo_productos, name='catalogo'),
+    path('producto/<slug:slug>/', vistas.detalle_producto, name='detalle'),
     path('categoria/<int:categoria_id>/', views.productos_por_categoria, name='por_categoria'),
 ]
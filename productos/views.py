@@ -1,73 +1,132 @@
+from django.conf import settings
+from django.http import Http404
 from django.shortcuts import render, get_object_or_404
 from django.core.paginator import Paginator
 from django.db.models import Q
+from django.views.decorators.http import condition, require_safe
+from core.estaticos import ServidorEstaticos
+from core.consultas import presupuesto_consultas
+from .bitmap import filtrar_con_bitmap
+from .condicionales import (
+    etag_categoria, etag_detalle, ultima_modificacion_categoria, ultima_modificacion_detalle,
+)
+from .facetas import (
+    BANDAS_PRECIO, TODAS, calcular_facetas, filtro_banda, nombre_banda, precio_final, seleccion,
+)
 from .models import Producto, Categoria, Marca
+from .vistos import anotar_visto, productos_vistos
 
 
-def catalogo_productos(request):
-    """Vista del catálogo de productos con filtros"""
-    
-    productos = Producto.objects.filter(esta_disponible=True)
+def buscar_productos(productos, query):
+    """Búsqueda de texto en nombre, descripción, categoría y marca"""
+    return productos.filter(
+        Q(nombre__icontains=query) |
+        Q(descripcion__icontains=query) |
+        Q(categoria__nombre__icontains=query) |
+        Q(marca__nombre__icontains=query)
+    )
+
+
+def filtrar_catalogo(parametros):
+    """Productos disponibles filtrados por categoría, marca, género, precio y búsqueda, y los filtros aplicados"""
+    productos = Producto.objects.para_tarjeta().filter(esta_disponible=True)
+    elegida = seleccion(parametros)
         
     # 1. Filtro por categoría
-    categoria_id_str = request.GET.get('categoria') # Capturamos como string
-    if categoria_id_str:
-        productos = productos.filter(categoria_id=categoria_id_str)
+    if elegida['categoria'] != TODAS:
+        productos = productos.filter(categoria_id=elegida['categoria'])
     
     # 2. Filtro por marca
-    marca_id_str = request.GET.get('marca') # Capturamos como string
-    if marca_id_str:
-        productos = productos.filter(marca_id=marca_id_str)
+    if elegida['marca'] != TODAS:
+        productos = productos.filter(marca_id=elegida['marca'])
     
     # 3. Filtro por género
-    genero = request.GET.get('genero')
-    if genero:
-        productos = productos.filter(genero=genero)
+    if elegida['genero'] != TODAS:
+        productos = productos.filter(genero=elegida['genero'])
+    
+    # 4. Banda de precio (sobre el precio con oferta)
+    if elegida['precio'] != TODAS:
+        productos = productos.annotate(precio_final=precio_final()).filter(filtro_banda(int(elegida['precio'])))
     
-    # 4. Búsqueda
-    query = request.GET.get('q')
+    # 5. Búsqueda
+    query = parametros.get('q')
     if query:
-        productos = productos.filter(
-            Q(nombre__icontains=query) |
-            Q(descripcion__icontains=query) |
-            Q(categoria__nombre__icontains=query) |
-            Q(marca__nombre__icontains=query)
-        )
+        productos = buscar_productos(productos, query)
+    
+    filtros = {
+        'query': query,
+        # Variables clave para el resaltado del sidebar
+        'categoria_seleccionada_id': None if elegida['categoria'] == TODAS else int(elegida['categoria']),
+        'marca_seleccionada_id': None if elegida['marca'] == TODAS else int(elegida['marca']),
+        'genero_seleccionado': None if elegida['genero'] == TODAS else elegida['genero'],
+        'precio_seleccionado': None if elegida['precio'] == TODAS else elegida['precio'],
+    }
+    return productos, filtros
+
+
+def barra_lateral(parametros):
+    """Categorías, marcas, géneros y bandas de precio de la barra lateral con sus recuentos"""
+    query = parametros.get('q')
+    busqueda = buscar_productos(Producto.objects.filter(esta_disponible=True), query) if query else None
+    conteos = calcular_facetas(parametros, busqueda)
+    elegida = seleccion(parametros)
+
+    def con_recuento(objetos, dimension):
+        visibles = []
+        for objeto in objetos:
+            objeto.total = conteos[dimension].get(str(objeto.id), 0)
+            if objeto.total or str(objeto.id) == elegida[dimension]:
+                visibles.append(objeto)
+        return visibles
+
+    return {
+        'categorias': con_recuento(Categoria.objects.all(), 'categoria'),
+        'marcas': con_recuento(Marca.objects.all(), 'marca'),
+        'generos': [
+            {'valor': valor, 'nombre': nombre, 'total': conteos['genero'][valor]}
+            for valor, nombre in Producto.GENERO_CHOICES if valor in conteos['genero']
+        ],
+        'bandas_precio': [
+            {'valor': str(indice), 'nombre': nombre_banda(indice), 'total': conteos['precio'][str(indice)]}
+            for indice in range(len(BANDAS_PRECIO)) if str(indice) in conteos['precio']
+        ],
+        'total_productos': conteos['total'],
+    }
+
+
+def detalle_queryset():
+    """Producto con todo lo que pinta su página de detalle"""
+    return Producto.objects.select_related('categoria', 'marca').prefetch_related('imagenes', 'tallas')
+
+
+@presupuesto_consultas(10)
+def catalogo_productos(request):
+    """Vista del catálogo de productos con filtros"""
+    productos, filtros = filtrar_catalogo(request.GET)
+    # Sin búsqueda de texto los filtros los resuelve el índice en memoria y solo se pide la página
+    indexados = filtrar_con_bitmap(request.GET, Producto.objects.para_tarjeta())
     
     # Paginación
-    paginator = Paginator(productos, 12)
+    paginator = Paginator(productos if indexados is None else indexados, 12)
     page = request.GET.get('page')
     productos_paginados = paginator.get_page(page)
-        
-    # Convertimos los strings de ID a enteros para que coincidan con la lógica del HTML
-    try:
-        categoria_seleccionada_id = int(categoria_id_str)
-    except (ValueError, TypeError):
-        categoria_seleccionada_id = None
-        
-    try:
-        marca_seleccionada_id = int(marca_id_str)
-    except (ValueError, TypeError):
-        marca_seleccionada_id = None
     
     context = {
         'productos': productos_paginados,
-        'categorias': Categoria.objects.all(),
-        'marcas': Marca.objects.all(),
-        'query': query,
-        # Variables clave para el resaltado del sidebar
-        'categoria_seleccionada_id': categoria_seleccionada_id,
-        'marca_seleccionada_id': marca_seleccionada_id,
+        **barra_lateral(request.GET),
+        **filtros,
     }
     return render(request, 'productos/catalogo.html', context)
 
 
+@presupuesto_consultas(13)  # dos de ellas, la tira de vistos recientemente
+@condition(etag_func=etag_detalle, last_modified_func=ultima_modificacion_detalle)
 def detalle_producto(request, slug):
     """Vista de detalle de un producto"""
-    producto = get_object_or_404(Producto, slug=slug, esta_disponible=True)
+    producto = get_object_or_404(detalle_queryset(), slug=slug, esta_disponible=True)
     
     # Productos relacionados
-    productos_relacionados = Producto.objects.filter(
+    productos_relacionados = Producto.objects.para_tarjeta().filter(
         categoria=producto.categoria,
         esta_disponible=True
     ).exclude(id=producto.id)[:4]
@@ -75,16 +134,23 @@ def detalle_producto(request, slug):
     context = {
         'producto': producto,
         'productos_relacionados': productos_relacionados,
+        'productos_vistos': productos_vistos(request.session, excluir=[producto.id]),
     }
+    anotar_visto(request.session, producto.id)
     return render(request, 'productos/detalle.html', context)
 
 
+@presupuesto_consultas(12)
+@condition(etag_func=etag_categoria, last_modified_func=ultima_modificacion_categoria)
 def productos_por_categoria(request, categoria_id):
     """Vista de productos por categoría"""
     # Nota: Esta vista es redundante si se usa catalogo_productos con filtros,
     # pero la mantenemos si tu urls.py la requiere.
     categoria = get_object_or_404(Categoria, id=categoria_id)
-    productos = Producto.objects.filter(categoria=categoria, esta_disponible=True)
+    productos = Producto.objects.para_tarjeta().filter(categoria=categoria, esta_disponible=True)
+    indexados = filtrar_con_bitmap({'categoria': str(categoria.id)}, Producto.objects.para_tarjeta())
+    if indexados is not None:
+        productos = indexados
     
     # Paginación
     paginator = Paginator(productos, 12)
@@ -94,7 +160,23 @@ def productos_por_categoria(request, categoria_id):
     context = {
         'categoria': categoria,
         'productos': productos_paginados,
-        'categorias': Categoria.objects.all(),
+        **barra_lateral({'categoria': str(categoria.id)}),
         'categoria_seleccionada_id': categoria.id, # Añadido para consistencia si se usa esta vista
     }
-    return render(request, 'productos/por_categoria.html', context)
\ No newline at end of file
+    # Misma página que el catálogo filtrado (no existe una plantilla propia)
+    return render(request, 'productos/catalogo.html', context)
+
+
+_servidores = {}
+
+
+@require_safe
+def fichero_publicado(request, nombre, carpeta=''):
+    """Sirve el sitemap y los feeds que escribe publicar_catalogo (productos.publicacion)"""
+    raiz = str(settings.PUBLICACION_ROOT)
+    servidor = _servidores.get(raiz) or _servidores.setdefault(raiz, ServidorEstaticos(raiz))
+    nombre = f'{carpeta}/{nombre}' if carpeta else nombre
+    encontrado = servidor.buscar(nombre, request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    if encontrado is None or not nombre.endswith(('.xml', '.csv')):
+        raise Http404
+    return servidor.responder(request, nombre, encontrado, 'public, max-age=3600', asincrono=settings.VISTAS_ASYNC)
@@ -0,0 +1,60 @@
+"""
+Versiones asíncronas de las vistas del catálogo (se usan con VISTAS_ASYNC,
+que activa tienda_online/asgi.py). Comparten filtros y querysets con
+views.py y solo cambian la forma de leer: ORM asíncrono y listas ya
+materializadas antes de pintar la plantilla.
+"""
+
+from asgiref.sync import sync_to_async
+from django.core.paginator import Paginator
+from django.shortcuts import aget_object_or_404, render
+
+from core.asincrono import alista, apaginar, condicion_async, preparar_peticion
+from core.consultas import presupuesto_consultas
+
+from .bitmap import filtrar_con_bitmap
+from .condicionales import etag_detalle, ultima_modificacion_detalle
+from .models import Producto
+from .views import barra_lateral, detalle_queryset, filtrar_catalogo
+from .vistos import anotar_visto, productos_vistos
+
+
+@presupuesto_consultas(10)
+async def catalogo_productos(request):
+    """Vista del catálogo de productos con filtros"""
+    await preparar_peticion(request)
+    productos, filtros = filtrar_catalogo(request.GET)
+    indexados = await sync_to_async(filtrar_con_bitmap)(request.GET, Producto.objects.para_tarjeta())
+    if indexados is None:
+        pagina = await apaginar(productos, 12, request.GET.get('page'))
+    else:
+        pagina = await sync_to_async(Paginator(indexados, 12).get_page)(request.GET.get('page'))
+
+    context = {
+        'productos': pagina,
+        **await sync_to_async(barra_lateral)(request.GET),
+        **filtros,
+    }
+    return render(request, 'productos/catalogo.html', context)
+
+
+@presupuesto_consultas(13)  # dos de ellas, la tira de vistos recientemente
+@condicion_async(etag_func=etag_detalle, last_modified_func=ultima_modificacion_detalle)
+async def detalle_producto(request, slug):
+    """Vista de detalle de un producto"""
+    await preparar_peticion(request)
+    producto = await aget_object_or_404(detalle_queryset(), slug=slug, esta_disponible=True)
+
+    productos_relacionados = await alista(
+        Producto.objects.para_tarjeta().filter(
+            categoria=producto.categoria_id, esta_disponible=True,
+        ).exclude(id=producto.id)[:4]
+    )
+
+    context = {
+        'producto': producto,
+        'productos_relacionados': productos_relacionados,
+        'productos_vistos': await sync_to_async(productos_vistos)(request.session, excluir=[producto.id]),
+    }
+    anotar_visto(request.session, producto.id)
+    return render(request, 'productos/detalle.html', context)
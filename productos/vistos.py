@@ -0,0 +1,34 @@
+"""
+Productos vistos recientemente por cada visitante.
+
+La sesión guarda solo los ids, del más reciente al más antiguo y como mucho
+VISTOS_MAXIMO: al ver uno nuevo entra delante y sale el más antiguo. Volver
+a ver el primero no cambia nada, así que no marca la sesión como modificada
+ni obliga a guardarla. Las tarjetas se cargan todas de una vez con
+para_tarjeta(), sin consultas por producto.
+"""
+
+from django.conf import settings
+
+from .models import Producto
+
+CLAVE_SESION = 'vistos'
+
+
+def anotar_visto(session, producto_id):
+    """Pone el producto el primero de la lista de vistos"""
+    vistos = session.get(CLAVE_SESION, [])
+    if vistos[:1] == [producto_id]:
+        return
+    otros = [visto for visto in vistos if visto != producto_id]
+    session[CLAVE_SESION] = [producto_id, *otros[:settings.VISTOS_MAXIMO - 1]]
+
+
+def productos_vistos(session, excluir=()):
+    """Productos vistos (disponibles y sin los de `excluir`) en el orden en que se vieron"""
+    excluir = {int(producto_id) for producto_id in excluir}
+    ids = [visto for visto in session.get(CLAVE_SESION, []) if visto not in excluir]
+    if not ids:
+        return []
+    productos = Producto.objects.para_tarjeta().filter(esta_disponible=True).in_bulk(ids)
+    return [productos[producto_id] for producto_id in ids if producto_id in productos]
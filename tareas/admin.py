@@ -0,0 +1,11 @@
+from django.contrib import admin
+
+from .models import Tarea
+
+
+@admin.register(Tarea)
+class TareaAdmin(admin.ModelAdmin):
+    list_display = ['nombre', 'estado', 'prioridad', 'intentos', 'ejecutar_desde', 'fecha_fin']
+    list_filter = ['estado', 'nombre']
+    search_fields = ['nombre', 'error']
+    readonly_fields = ['fecha_creacion', 'fecha_inicio', 'fecha_fin', 'trabajador', 'bloqueada_hasta']
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class TareasConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'tareas'
+
+    def ready(self):
+        from . import cola  # noqa: F401  (registra las métricas de la cola)
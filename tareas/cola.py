@@ -0,0 +1,236 @@
+"""
+Cola de tareas en segundo plano guardada en la base de datos del proyecto.
+
+Una tarea es una función decorada con @tarea; se encola con
+`funcion.encolar(*args, **kwargs)` (argumentos serializables a JSON: ids,
+no objetos). Como encolar es un INSERT más, si se hace dentro de una
+transacción la tarea solo existe si la transacción se confirma.
+
+`python manage.py runworkers` ejecuta las tareas: cada hilo reclama la
+pendiente de más prioridad cuya hora ya llegó con un UPDATE condicionado
+(solo uno lo gana) y la marca como suya durante TAREAS_BLOQUEO segundos,
+plazo que un latido renueva mientras la tarea corre; si el worker muere,
+pasado ese plazo vuelve a la cola. Las que fallan se
+reintentan a los TAREAS_REINTENTO_BASE segundos, el doble en cada intento,
+hasta max_intentos.
+
+Con TAREAS_SINCRONAS (por defecto en desarrollo, donde solo corre runserver)
+no hace falta worker: la tarea se guarda igual y se ejecuta en el propio
+proceso al confirmarse la transacción, sin esperar a su `retraso`; si falla,
+queda pendiente para un worker o para el siguiente runworkers --una-vez.
+"""
+
+import logging
+import random
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.db.models import Count, F, Min
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from core.metricas import Contador, Histograma, Indicador
+
+from .models import Tarea
+
+logger = logging.getLogger('petjoy.tareas')
+
+_registro = {}
+
+
+def _pendientes():
+    por_estado = dict(
+        Tarea.objects.filter(estado__in=[Tarea.PENDIENTE, Tarea.EN_CURSO])
+        .values_list('estado').annotate(total=Count('id')).order_by()
+    )
+    return {(estado,): por_estado.get(estado, 0) for estado in (Tarea.PENDIENTE, Tarea.EN_CURSO)}
+
+
+def _antiguedad():
+    """Segundos que lleva esperando la tarea lista más antigua"""
+    mas_antigua = Tarea.objects.filter(
+        estado=Tarea.PENDIENTE, ejecutar_desde__lte=timezone.now(),
+    ).aggregate(desde=Min('ejecutar_desde'))['desde']
+    return {(): (timezone.now() - mas_antigua).total_seconds() if mas_antigua else 0}
+
+
+CUBOS_TAREAS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)
+
+TAREAS_EN_COLA = Indicador('petjoy_tareas_en_cola', 'Tareas pendientes y en curso', ('estado',), _pendientes)
+ANTIGUEDAD_COLA = Indicador(
+    'petjoy_tareas_espera_maxima_segundos', 'Espera de la tarea lista más antigua', (), _antiguedad,
+)
+ESPERA_TAREAS = Histograma(
+    'petjoy_tarea_espera_segundos', 'Desde que la tarea puede ejecutarse hasta que empieza', ('tarea',), CUBOS_TAREAS,
+)
+DURACION_TAREAS = Histograma('petjoy_tarea_segundos', 'Duración de cada ejecución', ('tarea',), CUBOS_TAREAS)
+TAREAS = Contador('petjoy_tareas_total', 'Ejecuciones por resultado: hecha, reintento, fallida', ('tarea', 'resultado'))
+
+
+def tarea(funcion=None, *, prioridad=0, max_intentos=3):
+    """Registra una función como tarea y le añade .encolar()"""
+    def decorador(funcion):
+        nombre = f'{funcion.__module__}.{funcion.__qualname__}'
+        _registro[nombre] = funcion
+        funcion.nombre_tarea = nombre
+
+        def encolar_funcion(*args, **kwargs):
+            kwargs.setdefault('prioridad', prioridad)
+            kwargs.setdefault('max_intentos', max_intentos)
+            return encolar(nombre, *args, **kwargs)
+        funcion.encolar = encolar_funcion
+        return funcion
+    return decorador(funcion) if funcion else decorador
+
+
+def encolar(nombre, *args, prioridad=0, retraso=None, max_intentos=3, **kwargs):
+    """
+    Encola la tarea `nombre` (o una función decorada) con sus argumentos.
+    `retraso` (segundos o timedelta) la aplaza.
+    """
+    nombre = getattr(nombre, 'nombre_tarea', nombre)
+    if isinstance(retraso, (int, float)):
+        retraso = timedelta(seconds=retraso)
+    trabajo = Tarea.objects.create(
+        nombre=nombre, args=list(args), kwargs=kwargs, prioridad=prioridad, max_intentos=max_intentos,
+        ejecutar_desde=timezone.now() + (retraso or timedelta()),
+    )
+    if settings.TAREAS_SINCRONAS:
+        transaction.on_commit(lambda: ejecutar_ahora(trabajo.pk))
+    return trabajo
+
+
+def _funcion(nombre):
+    if nombre not in _registro:
+        import_string(nombre)  # importar el módulo registra la tarea
+    return _registro[nombre]
+
+
+def reclamar(trabajador):
+    """La siguiente tarea lista, ya marcada como en curso por `trabajador`, o None"""
+    for _ in range(5):
+        ahora = timezone.now()
+        listas = Tarea.objects.filter(estado=Tarea.PENDIENTE, ejecutar_desde__lte=ahora)
+        candidata = listas.order_by('-prioridad', 'ejecutar_desde', 'id').values_list('id', flat=True).first()
+        if candidata is None:
+            return None
+        # Otro hilo o worker puede haberla reclamado entre la lectura y el UPDATE
+        ganada = _tomar(listas, candidata, trabajador, ahora)
+        if ganada:
+            return ganada
+    return None
+
+
+def _tomar(consulta, pk, trabajador, ahora):
+    """Marca como en curso la tarea `pk` si aún está en `consulta`; la devuelve, o None si otro se adelantó"""
+    ganada = consulta.filter(pk=pk).update(
+        estado=Tarea.EN_CURSO, trabajador=trabajador, fecha_inicio=ahora, intentos=F('intentos') + 1,
+        bloqueada_hasta=ahora + timedelta(seconds=settings.TAREAS_BLOQUEO),
+    )
+    return Tarea.objects.get(pk=pk) if ganada else None
+
+
+def ejecutar_ahora(pk):
+    """Ejecuta ya, en este proceso, la tarea `pk` si sigue pendiente (TAREAS_SINCRONAS)"""
+    ahora = timezone.now()
+    trabajo = _tomar(Tarea.objects.filter(estado=Tarea.PENDIENTE), pk, 'sincrona', ahora)
+    if trabajo is not None:
+        # Sin esperar a su retraso: para las métricas, la espera es cero
+        trabajo.ejecutar_desde = min(trabajo.ejecutar_desde, ahora)
+        ejecutar(trabajo)
+
+
+@contextmanager
+def latido(trabajo):
+    """
+    Mientras dura el bloque, alarga el bloqueo de la tarea cada tercio de
+    TAREAS_BLOQUEO para que mantenimiento() no la dé por caída
+    """
+    parar = threading.Event()
+
+    def latir():
+        try:
+            while not parar.wait(settings.TAREAS_BLOQUEO / 3):
+                try:
+                    Tarea.objects.filter(
+                        pk=trabajo.pk, estado=Tarea.EN_CURSO, trabajador=trabajo.trabajador,
+                    ).update(bloqueada_hasta=timezone.now() + timedelta(seconds=settings.TAREAS_BLOQUEO))
+                except DatabaseError:
+                    # Queda margen hasta que venza el bloqueo: se reintenta en el siguiente latido
+                    logger.warning('No se pudo renovar el bloqueo de la tarea #%s', trabajo.pk, exc_info=True)
+        finally:
+            connections.close_all()
+
+    hilo = threading.Thread(target=latir, name=f'latido tarea {trabajo.pk}', daemon=True)
+    hilo.start()
+    try:
+        yield
+    finally:
+        parar.set()
+        hilo.join()
+
+
+def ejecutar(trabajo):
+    """Ejecuta una tarea reclamada y deja anotado el resultado (o programa el reintento)"""
+    inicio = time.monotonic()
+    ESPERA_TAREAS.observar((trabajo.fecha_inicio - trabajo.ejecutar_desde).total_seconds(), trabajo.nombre)
+    intentos = trabajo.intentos  # ya cuenta este, se suma al reclamarla
+    cambios = {'trabajador': '', 'bloqueada_hasta': None}
+    try:
+        with latido(trabajo):
+            _funcion(trabajo.nombre)(*trabajo.args, **trabajo.kwargs)
+    except Exception:
+        cambios['error'] = traceback.format_exc()
+        if intentos < trabajo.max_intentos:
+            retraso = settings.TAREAS_REINTENTO_BASE * 2 ** (intentos - 1) * random.uniform(1, 1.25)
+            cambios.update(estado=Tarea.PENDIENTE, ejecutar_desde=timezone.now() + timedelta(seconds=retraso))
+            resultado = 'reintento'
+        else:
+            cambios.update(estado=Tarea.FALLIDA, fecha_fin=timezone.now())
+            resultado = 'fallida'
+        logger.warning('Tarea %s #%s: %s (intento %s de %s)', trabajo.nombre, trabajo.pk, resultado,
+                       intentos, trabajo.max_intentos, exc_info=True)
+    else:
+        cambios.update(estado=Tarea.HECHA, fecha_fin=timezone.now(), error='')
+        resultado = 'hecha'
+    # Solo si sigue siendo suya: si mantenimiento() la devolvió a la cola, otro worker la tiene
+    if not Tarea.objects.filter(pk=trabajo.pk, estado=Tarea.EN_CURSO, trabajador=trabajo.trabajador).update(**cambios):
+        logger.warning('Tarea %s #%s: ya no era de %s, no se anota el resultado', trabajo.nombre, trabajo.pk,
+                       trabajo.trabajador)
+    DURACION_TAREAS.observar(time.monotonic() - inicio, trabajo.nombre)
+    TAREAS.inc(trabajo.nombre, resultado)
+    return resultado
+
+
+def mantenimiento():
+    """Devuelve a la cola las tareas de workers caídos y borra las terminadas antiguas"""
+    ahora = timezone.now()
+    caidas = Tarea.objects.filter(estado=Tarea.EN_CURSO, bloqueada_hasta__lt=ahora)
+    # Si ya agotó sus intentos (p. ej. tumba al worker cada vez), no se vuelve a probar
+    caidas.filter(intentos__gte=F('max_intentos')).update(
+        estado=Tarea.FALLIDA, trabajador='', bloqueada_hasta=None, fecha_fin=ahora,
+        error='El worker dejó de responder durante la ejecución',
+    )
+    rescatadas = caidas.update(estado=Tarea.PENDIENTE, trabajador='', bloqueada_hasta=None)
+    borradas, _ = Tarea.objects.filter(
+        estado__in=[Tarea.HECHA, Tarea.FALLIDA],
+        fecha_fin__lt=ahora - timedelta(days=settings.TAREAS_RETENCION_DIAS),
+    ).delete()
+    return rescatadas, borradas
+
+
+def procesar(trabajador, maximo=None):
+    """Ejecuta tareas listas hasta vaciar la cola (o `maximo`); devuelve cuántas ejecutó"""
+    ejecutadas = 0
+    while maximo is None or ejecutadas < maximo:
+        siguiente = reclamar(trabajador)
+        if siguiente is None:
+            break
+        ejecutar(siguiente)
+        ejecutadas += 1
+    return ejecutadas
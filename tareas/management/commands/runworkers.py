@@ -0,0 +1,98 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core import metricas
+from tareas.cola import mantenimiento, procesar
+
+
+class Command(BaseCommand):
+    help = (
+        'Ejecuta las tareas en segundo plano (tareas.cola) con un grupo de hilos, y '
+        'opcionalmente varios procesos. SIGTERM o Ctrl+C terminan las tareas en curso y salen.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=settings.TAREAS_HILOS, help='Hilos por proceso')
+        parser.add_argument('--procesos', type=int, default=1, help='Procesos worker (cada uno con --hilos)')
+        parser.add_argument(
+            '--intervalo', type=float, default=1.0, help='Segundos de espera cuando la cola está vacía',
+        )
+        parser.add_argument('--una-vez', action='store_true', help='Vacía la cola y termina (cron, tests)')
+
+    def handle(self, *args, **options):
+        self.parar = threading.Event()
+        if options['procesos'] > 1 and not options['una_vez']:
+            return self._supervisar(options)
+        anteriores = {senal: signal.signal(senal, self._al_parar) for senal in (signal.SIGTERM, signal.SIGINT)}
+        try:
+            self._ejecutar(options)
+        finally:
+            for senal, manejador in anteriores.items():
+                signal.signal(senal, manejador)
+
+    def _ejecutar(self, options):
+        mantenimiento()
+        nombre = f'{socket.gethostname()}:{os.getpid()}'
+        ejecutadas = []
+        hilos = [
+            threading.Thread(target=self._trabajar, args=(f'{nombre}:{n}', options, ejecutadas), name=f'tareas-{n}')
+            for n in range(max(options['hilos'], 1))
+        ]
+        for hilo in hilos:
+            hilo.start()
+        self.stdout.write(f'Worker {nombre} con {len(hilos)} hilos')
+
+        ultimo_mantenimiento = time.monotonic()
+        while any(hilo.is_alive() for hilo in hilos):
+            for hilo in hilos:
+                hilo.join(timeout=options['intervalo'])
+            metricas.volcar_si_toca()
+            if time.monotonic() - ultimo_mantenimiento > settings.TAREAS_BLOQUEO / 2:
+                mantenimiento()
+                ultimo_mantenimiento = time.monotonic()
+        connections.close_all()
+        self.stdout.write(self.style.SUCCESS(f'✅ Worker {nombre} detenido tras {len(ejecutadas)} tareas'))
+
+    def _al_parar(self, senal, marco):
+        if not self.parar.is_set():
+            self.stdout.write('Terminando las tareas en curso...')
+        self.parar.set()
+
+    def _trabajar(self, trabajador, options, ejecutadas):
+        try:
+            while not self.parar.is_set():
+                if procesar(trabajador, maximo=1):
+                    ejecutadas.append(1)
+                else:
+                    if options['una_vez']:
+                        break
+                    self.parar.wait(options['intervalo'])
+        finally:
+            connections.close_all()
+
+    def _supervisar(self, options):
+        """Lanza un `runworkers` por proceso y les reenvía la señal de parada"""
+        orden = [
+            sys.executable, str(Path(settings.BASE_DIR) / 'manage.py'), 'runworkers',
+            f"--hilos={options['hilos']}", f"--intervalo={options['intervalo']}",
+        ]
+        procesos = [subprocess.Popen(orden) for _ in range(options['procesos'])]
+        for senal in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(senal, self._al_parar)
+        while not self.parar.is_set() and all(proceso.poll() is None for proceso in procesos):
+            self.parar.wait(1)
+        for proceso in procesos:
+            if proceso.poll() is None:
+                proceso.send_signal(signal.SIGTERM)
+        codigos = [proceso.wait() for proceso in procesos]
+        self.stdout.write(self.style.SUCCESS(f'✅ {len(procesos)} procesos worker detenidos (códigos {codigos})'))
@@ -0,0 +1,51 @@
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.utils import timezone
+
+
+class Tarea(models.Model):
+    """Trabajo pendiente de la cola en segundo plano (ver tareas.cola)"""
+    PENDIENTE = 'pendiente'
+    EN_CURSO = 'en_curso'
+    HECHA = 'hecha'
+    FALLIDA = 'fallida'
+    ESTADO_CHOICES = [
+        (PENDIENTE, 'Pendiente'),
+        (EN_CURSO, 'En curso'),
+        (HECHA, 'Hecha'),
+        (FALLIDA, 'Fallida'),
+    ]
+    
+    nombre = models.CharField(max_length=200, help_text="Ruta de la función (modulo.funcion)")
+    args = models.JSONField(default=list, encoder=DjangoJSONEncoder)
+    kwargs = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    prioridad = models.IntegerField(default=0, help_text="Las de mayor prioridad se ejecutan antes")
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default=PENDIENTE)
+    ejecutar_desde = models.DateTimeField(default=timezone.now)
+    intentos = models.PositiveIntegerField(default=0)
+    max_intentos = models.PositiveIntegerField(default=3)
+    error = models.TextField(blank=True)
+    
+    # Quién la ejecuta y hasta cuándo; pasado ese momento se da por caído y vuelve a la cola
+    trabajador = models.CharField(max_length=100, blank=True)
+    bloqueada_hasta = models.DateTimeField(null=True, blank=True)
+    
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_inicio = models.DateTimeField(null=True, blank=True)
+    fecha_fin = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = 'Tarea'
+        verbose_name_plural = 'Tareas'
+        ordering = ['-fecha_creacion']
+        indexes = [
+            # La siguiente tarea es la primera de este índice con ejecutar_desde <= ahora
+            models.Index(
+                fields=['-prioridad', 'ejecutar_desde', 'id'], name='tarea_pendientes_idx',
+                condition=models.Q(estado='pendiente'),
+            ),
+            models.Index(fields=['estado', 'bloqueada_hasta'], name='tarea_estado_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.nombre} ({self.get_estado_display()})"
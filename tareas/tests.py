@@ -0,0 +1,173 @@
+import time
+from datetime import timedelta
+from io import StringIO
+
+from django.core import mail
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core.cache import cache
+from core.metricas import exponer
+from core.models import DatosEmpresa
+from core.testing import crear_catalogo
+from pedidos.models import Pedido
+from tareas.cola import ejecutar, encolar, mantenimiento, procesar, reclamar, tarea
+from tareas.models import Tarea
+
+llamadas = []
+
+
+@tarea
+def apuntar(valor):
+    llamadas.append(valor)
+
+
+@tarea(max_intentos=2)
+def fallar():
+    raise ConnectionError('SMTP caído')
+
+
+@tarea
+def tarea_larga():
+    # Más que TAREAS_BLOQUEO: sin latido, mantenimiento() la daría por caída
+    time.sleep(0.5)
+    llamadas.append(mantenimiento())
+
+
+DATOS_ENVIO = {
+    'nombre': 'Ana', 'apellidos': 'Pérez', 'email': 'ana@example.com', 'telefono': '',
+    'direccion': 'Calle Mayor 1', 'ciudad': 'Madrid', 'codigo_postal': '28001', 'metodo_pago': 'tarjeta',
+}
+
+
+@override_settings(TAREAS_REINTENTO_BASE=60)
+class ColaTareasTests(TestCase):
+
+    def setUp(self):
+        llamadas.clear()
+
+    def test_encolar_en_una_transaccion_deshecha(self):
+        try:
+            with transaction.atomic():
+                apuntar.encolar('perdida')
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertFalse(Tarea.objects.exists())
+
+    def test_prioridad_y_retraso(self):
+        apuntar.encolar('normal')
+        apuntar.encolar('urgente', prioridad=10)
+        apuntar.encolar('mañana', prioridad=20, retraso=timedelta(days=1))
+        self.assertEqual(procesar('test'), 2)
+        self.assertEqual(llamadas, ['urgente', 'normal'])
+        self.assertEqual(Tarea.objects.filter(estado=Tarea.PENDIENTE).get().args, ['mañana'])
+
+    def test_una_tarea_solo_la_reclama_un_worker(self):
+        encolar(apuntar, 'x')
+        self.assertIsNotNone(reclamar('uno'))
+        self.assertIsNone(reclamar('dos'))
+
+    def test_reintentos_con_espera_creciente(self):
+        fallar.encolar()
+        with self.assertLogs('petjoy.tareas', 'WARNING'):
+            self.assertEqual(ejecutar(reclamar('test')), 'reintento')
+        trabajo = Tarea.objects.get()
+        self.assertEqual((trabajo.estado, trabajo.intentos), (Tarea.PENDIENTE, 1))
+        self.assertIn('SMTP caído', trabajo.error)
+        espera = (trabajo.ejecutar_desde - timezone.now()).total_seconds()
+        self.assertTrue(55 < espera <= 75)
+        self.assertIsNone(reclamar('test'))  # aún no le toca
+
+        Tarea.objects.update(ejecutar_desde=timezone.now())
+        with self.assertLogs('petjoy.tareas', 'WARNING'):
+            self.assertEqual(ejecutar(reclamar('test')), 'fallida')
+        self.assertEqual(Tarea.objects.get().estado, Tarea.FALLIDA)
+
+    def test_mantenimiento_rescata_las_de_workers_caidos(self):
+        apuntar.encolar('rescatada')
+        fallar.encolar()
+        for _ in range(2):
+            reclamar('caido')
+        Tarea.objects.update(bloqueada_hasta=timezone.now() - timedelta(seconds=1))
+        Tarea.objects.filter(nombre=fallar.nombre_tarea).update(intentos=2)
+        self.assertEqual(mantenimiento(), (1, 0))
+        self.assertEqual(Tarea.objects.get(nombre=apuntar.nombre_tarea).estado, Tarea.PENDIENTE)
+        self.assertEqual(Tarea.objects.get(nombre=fallar.nombre_tarea).estado, Tarea.FALLIDA)
+
+        Tarea.objects.update(fecha_fin=timezone.now() - timedelta(days=30))
+        self.assertEqual(mantenimiento(), (0, 1))
+
+    def test_no_anota_el_resultado_de_una_tarea_que_ya_no_es_suya(self):
+        apuntar.encolar('tarde')
+        trabajo = reclamar('lento')
+        # Mientras tanto se dio por caída y la reclamó otro worker
+        Tarea.objects.update(trabajador='otro')
+        with self.assertLogs('petjoy.tareas', 'WARNING'):
+            self.assertEqual(ejecutar(trabajo), 'hecha')
+        self.assertEqual(Tarea.objects.values_list('estado', 'trabajador').get(), (Tarea.EN_CURSO, 'otro'))
+
+    @override_settings(TAREAS_SINCRONAS=True)
+    def test_sin_worker_se_ejecutan_al_confirmar(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            apuntar.encolar('ya', retraso=60)
+            self.assertEqual(llamadas, [])  # aún puede deshacerse
+        self.assertEqual(llamadas, ['ya'])
+        self.assertEqual(Tarea.objects.get().estado, Tarea.HECHA)
+
+    @override_settings(TAREAS_SINCRONAS=True)
+    def test_sin_worker_el_email_de_contacto_sale_de_la_peticion(self):
+        cache.clear()  # los datos de la empresa que dejaron otros tests
+        DatosEmpresa.objects.create(pk=1, nombre='PetJoy', email='tienda@example.com')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('core:contacto'), {'nombre': 'Ana', 'email': 'ana@example.com', 'mensaje': 'Hola'})
+        self.assertEqual([email.subject for email in mail.outbox], ['Contacto desde la web - Ana'])
+        self.assertEqual(Tarea.objects.get().estado, Tarea.HECHA)
+
+    def test_metricas_de_la_cola(self):
+        apuntar.encolar('uno')
+        Tarea.objects.update(ejecutar_desde=timezone.now() - timedelta(seconds=30))
+        apuntar.encolar('dos')
+        texto = exponer()
+        self.assertIn('petjoy_tareas_en_cola{estado="pendiente"} 2', texto)
+        self.assertRegex(texto, r'petjoy_tareas_espera_maxima_segundos 3\d\.')
+        procesar('test')
+        self.assertIn('petjoy_tareas_en_cola{estado="pendiente"} 0', exponer())
+
+
+@override_settings(TAREAS_BLOQUEO=0.3)
+class LatidoTests(TransactionTestCase):
+    """El latido renueva el bloqueo desde otro hilo: los datos tienen que estar confirmados"""
+
+    def setUp(self):
+        llamadas.clear()
+
+    def test_una_tarea_larga_no_se_da_por_caida(self):
+        tarea_larga.encolar()
+        self.assertEqual(procesar('test'), 1)
+        self.assertEqual(llamadas, [(0, 0)])
+        trabajo = Tarea.objects.get()
+        self.assertEqual((trabajo.estado, trabajo.intentos), (Tarea.HECHA, 1))
+
+
+@override_settings(PASARELA_PAGO='pedidos.pasarela.PasarelaFalsa')
+class RunworkersTests(TransactionTestCase):
+    """Los hilos del worker usan sus propias conexiones: los datos tienen que estar confirmados"""
+    databases = {'default', 'replica'}
+
+    def test_el_email_de_confirmacion_sale_del_worker(self):
+        producto = crear_catalogo(productos=1)[0]
+        self.client.post(reverse('pedidos:agregar_carrito', args=[producto.id]), {'cantidad': 1})
+        self.client.post(reverse('pedidos:checkout'), DATOS_ENVIO, follow=True)
+        pedido = Pedido.objects.get()
+        self.assertEqual(mail.outbox, [])  # la compra no espera al SMTP
+        self.assertEqual(Tarea.objects.get().args, [pedido.id])
+
+        call_command('runworkers', una_vez=True, hilos=2, stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn(pedido.numero_pedido, mail.outbox[0].subject)
+        self.assertEqual(mail.outbox[0].to, ['ana@example.com'])
+        self.assertEqual(Tarea.objects.get().estado, Tarea.HECHA)
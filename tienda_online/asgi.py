@@ -12,5 +12,12 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tienda_online.settings')
+# Con ASGI el catálogo, el carrito y el checkout usan las vistas asíncronas
+os.environ.setdefault('PETJOY_VISTAS_ASYNC', '1')
 
 application = get_asgi_application()
+
+# El índice del catálogo en memoria se construye ya, no en la primera petición
+from productos.bitmap import calentar_indice  # noqa: E402
+
+calentar_indice()
@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -25,6 +27,9 @@ SECRET_KEY = 'django-insecure-68ydtoz277!g2znfvv!dk0!3rv87wa!6)o_om_t!ur*c_g09fi
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
+# Ejecución de la suite de tests (python manage.py test)
+PRUEBAS = len(sys.argv) > 1 and sys.argv[1] == 'test'
+
 ALLOWED_HOSTS = []
 
 
@@ -43,10 +48,17 @@ INSTALLED_APPS = [
     'pedidos',
     'clientes',
     'core',
+    'tareas',
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricasMiddleware',
+    'core.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.EstaticosMiddleware',
+    'core.middleware.DetectorConsultasMiddleware',
+    'core.middleware.ConsultasLentasMiddleware',
+    'core.middleware.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -75,6 +87,17 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'tienda_online.wsgi.application'
 
+# Vistas asíncronas del catálogo, carrito y checkout (las activa tienda_online/asgi.py)
+VISTAS_ASYNC = os.environ.get('PETJOY_VISTAS_ASYNC') == '1'
+
+# Índice de bits en memoria para los filtros del catálogo (productos.bitmap); cada worker
+# aplica el registro de cambios de productos como mucho cada CATALOGO_BITMAP_REFRESCO segundos
+CATALOGO_BITMAP = True
+CATALOGO_BITMAP_REFRESCO = 1
+
+# Productos vistos recientemente que se guardan en la sesión (productos.vistos)
+VISTOS_MAXIMO = 8
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -82,10 +105,62 @@ WSGI_APPLICATION = 'tienda_online.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('PETJOY_DB', BASE_DIR / 'db.sqlite3'),
     }
 }
 
+# Réplica de solo lectura para el catálogo (core.routers). Se mantiene con
+# `python manage.py sincronizar_replica`; en los tests existe siempre, como espejo de
+# 'default', para que el enrutado se ejercite en toda la suite
+if os.environ.get('PETJOY_DB_REPLICA') or PRUEBAS:
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('PETJOY_DB_REPLICA', BASE_DIR / 'db_replica.sqlite3'),
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['core.routers.RouterReplica']
+REPLICA_LECTURA_PROPIA_SEGUNDOS = 10  # tras escribir, el usuario lee de la primaria durante este tiempo
+
+
+# Caché compartida entre workers en disco (sin servicios externos). Se usa a través de
+# core.cache, que pone delante un LRU en memoria por worker
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('PETJOY_CACHE_DIR', BASE_DIR / 'cache'),
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    }
+}
+CACHE_TTL = 300  # segundos que un valor se considera fresco
+CACHE_OBSOLETO = 60  # segundos que se sigue sirviendo un valor caducado mientras se recalcula
+CACHE_JITTER = 0.1  # variación aleatoria del TTL (±10 %)
+CACHE_LOCAL_MAXIMO = 500  # entradas del LRU en memoria de cada worker
+CACHE_LOCAL_TTL = 5  # segundos como mucho en el nivel local (borrados de otros workers)
+CACHE_ESPERA_MAXIMA = 5  # segundos esperando a que otro hilo o worker termine un cálculo
+CACHE_REVALIDAR_EN_SEGUNDO_PLANO = True
+
+# Instantánea de la portada (core.escaparate): se regenera al minuto, pero si la BD no
+# responde se sigue sirviendo la última hasta un día
+ESCAPARATE_TTL = 60
+ESCAPARATE_OBSOLETO = 86400
+
+# Datos de la empresa (core.models.DatosEmpresa): se leen en casi todas las páginas; si la
+# BD no responde se sirve la última copia hasta un día
+DATOS_EMPRESA_OBSOLETO = 86400
+
+# Cola de tareas en segundo plano (tareas.cola), ejecutada con manage.py runworkers
+TAREAS_HILOS = 4  # hilos por proceso worker
+TAREAS_BLOQUEO = 300  # segundos que una tarea en curso es del worker sin dar señales; después vuelve a la cola
+TAREAS_REINTENTO_BASE = 30  # segundos hasta el primer reintento; se dobla en cada intento
+TAREAS_RETENCION_DIAS = 7  # días que se guardan las tareas terminadas
+# Sin worker (en desarrollo solo corre runserver) cada tarea se ejecuta en la propia petición
+# al confirmarse la transacción; en producción, PETJOY_TAREAS_SINCRONAS=0 y manage.py runworkers
+TAREAS_SINCRONAS = os.environ.get('PETJOY_TAREAS_SINCRONAS', '1' if DEBUG and not PRUEBAS else '0') == '1'
+
+# Los tests usan una caché compartida vacía en un directorio temporal
+TEST_RUNNER = 'core.testing.EjecutorTests'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -125,10 +200,24 @@ STATIC_URL = 'static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# collectstatic genera nombres con hash y variantes .gz/.br (core.estaticos);
+# EstaticosMiddleware sirve STATIC_ROOT directamente con caché de un año
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'core.estaticos.AlmacenEstaticos'},
+}
+SERVIR_ESTATICOS = True
+
 # Media files
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Sitemap y feed de productos (productos.publicacion), regenerados con
+# python manage.py publicar_catalogo y servidos en /sitemap.xml, /sitemaps/ y /feeds/
+PUBLICACION_ROOT = os.environ.get('PETJOY_PUBLICACION_DIR', BASE_DIR / 'publicado')
+PUBLICACION_POR_TROZO = 10000  # productos (por tramo de id) en cada sitemap hijo
+SITIO_URL = os.environ.get('PETJOY_SITIO_URL', 'http://localhost:8000')  # base de las URL absolutas
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -136,6 +225,12 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Configuración de autenticación
 AUTH_USER_MODEL = 'clientes.Cliente'
+
+# Login por email (índice único sobre LOWER(email)); ModelBackend sigue valiendo para el admin
+AUTHENTICATION_BACKENDS = [
+    'clientes.backends.EmailBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
 LOGIN_URL = 'clientes:login'
 LOGIN_REDIRECT_URL = 'core:inicio'
 LOGOUT_REDIRECT_URL = 'core:inicio'
@@ -150,4 +245,47 @@ SESSION_COOKIE_AGE = 86400  # 24 horas
 # Configuración de stripe
 STRIPE_SECRET_KEY = 'sk_test_51SQv22JjcGoW4r6WIYcd1ovILog8D8QGh4WCaR2t6hcbfCB7fu1D7rJFgJYw8096tIhlNlGkaaLWob3t8K02rdPD00s4EE3Dbx'
 STRIPE_PUBLIC_KEY = 'pk_test_51SQv22JjcGoW4r6WLs5oEwy6gHwXI5YMAWoSiHUOMC9d4ydYhLJibY8rtJ4uQDxBdpvPeIsnKl9zuRi5n8t1v7jZ00Psj0zXOm'
-SESSION_CURRENCY = 'eur'
\ No newline at end of file
+SESSION_CURRENCY = 'eur'
+
+# Detector de consultas SQL (N+1 y presupuestos por vista). En los tests lo activa core.testing.ConsultasTestCase
+DETECTOR_CONSULTAS = DEBUG
+CONSULTAS_ESTRICTO = False  # True: superar el presupuesto de una vista lanza una excepción
+N_MAS_1_UMBRAL = 3  # repeticiones de la misma consulta desde el mismo punto para considerarla N+1
+
+# Log de consultas lentas (JSONL con el SQL normalizado y su EXPLAIN QUERY PLAN), en ms.
+# Desactivado por defecto; p. ej. PETJOY_CONSULTAS_LENTAS_MS=100 para activarlo.
+# Resumen de los peores casos: python manage.py consultas_lentas
+CONSULTAS_LENTAS_MS = float(os.environ.get('PETJOY_CONSULTAS_LENTAS_MS', '0'))
+CONSULTAS_LENTAS_LOG = BASE_DIR / 'logs' / 'consultas_lentas.jsonl'
+
+# Instrumentación por petición (Server-Timing + log JSON en petjoy.rendimiento).
+# Fracción de peticiones medidas entre 0 y 1; con 0 el middleware se desactiva por completo.
+# En desarrollo se mide todo salvo al pasar los tests, para no llenar su salida de líneas JSON
+INSTRUMENTACION_MUESTREO = float(os.environ.get('PETJOY_MUESTREO', '1' if DEBUG and not PRUEBAS else '0'))
+
+# Métricas Prometheus en /metrics. Con varios workers, METRICAS_DIRECTORIO apunta a un
+# directorio compartido donde cada proceso vuelca sus valores (los ficheros de arranques
+# anteriores del servidor se borran solos; un directorio por servidor)
+METRICAS = True
+METRICAS_IPS_PERMITIDAS = os.environ.get('PETJOY_METRICAS_IPS', '127.0.0.1,::1').split(',')
+METRICAS_DIRECTORIO = os.environ.get('PETJOY_METRICAS_DIR') or None
+METRICAS_INTERVALO_VOLCADO = 5  # segundos entre volcados de cada worker
+
+# Presupuesto de arranque en frío de un worker (django.setup() + URLs), comprobado en los
+# tests. Desglose por módulo: python manage.py tiempo_arranque
+ARRANQUE_MAXIMO_MS = int(os.environ.get('PETJOY_ARRANQUE_MAXIMO_MS', '1500'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'petjoy': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
+
+# Pasarela de pago usada por el checkout ('pedidos.pasarela.PasarelaFalsa' para benchmarks y pruebas de carga)
+PASARELA_PAGO = os.environ.get('PETJOY_PASARELA', 'pedidos.pasarela.PasarelaStripe')
+PASARELA_FALSA_LATENCIA = 0  # segundos de espera simulada de PasarelaFalsa
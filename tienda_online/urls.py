@@ -18,6 +18,7 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from productos.views import fichero_publicado
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -25,6 +26,10 @@ urlpatterns = [
     path('productos/', include('productos.urls')),
     path('pedidos/', include('pedidos.urls')),
     path('cuenta/', include('clientes.urls')),
+    # Sitemap y feed generados por publicar_catalogo
+    path('sitemap.xml', fichero_publicado, {'nombre': 'sitemap.xml'}, name='sitemap'),
+    path('sitemaps/<str:nombre>', fichero_publicado, {'carpeta': 'sitemaps'}, name='sitemap_hijo'),
+    path('feeds/<str:nombre>', fichero_publicado, {'carpeta': 'feeds'}, name='feed'),
 ]
 
 # Servir archivos media en desarrollo
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tienda_online.settings')
 
 application = get_wsgi_application()
+
+# El índice del catálogo en memoria se construye ya, no en la primera petición
+from productos.bitmap import calentar_indice  # noqa: E402
+
+calentar_indice()